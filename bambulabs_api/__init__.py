@@ -1,3 +1,33 @@
-from .client import Printer  # noqa
-from .filament_info import Filament, AMSFilamentSettings, FilamentTray  # noqa
-from .states_info import PrintStatus, GcodeState  # noqa
+from typing import TYPE_CHECKING, Any
+
+# Exports are imported on first access, so that importing the package does
+# not load paho-mqtt, ssl or ftplib before a Printer is needed
+_EXPORTS = {
+    "Printer": ".client",
+    "Filament": ".filament_info",
+    "AMSFilamentSettings": ".filament_info",
+    "FilamentTray": ".filament_info",
+    "PrintStatus": ".states_info",
+    "GcodeState": ".states_info",
+}
+
+__all__ = list(_EXPORTS)
+
+if TYPE_CHECKING:
+    from .client import Printer  # noqa
+    from .filament_info import Filament, AMSFilamentSettings, FilamentTray  # noqa
+    from .states_info import PrintStatus, GcodeState  # noqa
+
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib  # pylint: disable=import-outside-toplevel
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
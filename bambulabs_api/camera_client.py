@@ -6,14 +6,34 @@ import socket
 import ssl
 import logging
 
-from threading import Thread
+from dataclasses import dataclass
+from threading import Event, Thread
 import time
 
-__all__ = ["PrinterCamera"]
+from bambulabs_api import instrumentation
+from bambulabs_api.connection import ConnectionSupervisor
+from bambulabs_api.jpeg import validate_jpeg
+from bambulabs_api.tls import TLSConfig, get_default_config
+
+__all__ = ["FrameInfo", "PrinterCamera"]
+
+
+@dataclass(frozen=True)
+class FrameInfo:
+    """
+    Metadata of a camera frame, read from its JPEG headers
+    """
+    seq: int
+    size: int
+    width: int
+    height: int
+    timestamp: float
 
 
 class PrinterCamera:
-    def __init__(self, hostname, access_code, port=6000, username='bblp'):
+    def __init__(self, hostname, access_code, port=6000, username='bblp',
+                 supervisor: ConnectionSupervisor | None = None,
+                 tls: TLSConfig | None = None):
         self.__username = username
         self.__access_code = str(access_code)
         self.__hostname = str(hostname)
@@ -21,14 +41,24 @@ class PrinterCamera:
 
         self.__thread = Thread(target=self.retriever)
         self.__thread.daemon = True
+        self.__stop = Event()
 
+        self.supervisor = supervisor or ConnectionSupervisor(self.__hostname)
+        self.tls = tls or get_default_config()
         self.last_frame = None
+        # Latest frame and its metadata, replaced together
+        self.latest: tuple[bytearray, FrameInfo] | None = None
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.frames_corrupt = 0
 
     def start(self):
         self.__thread.start()
 
     def stop(self):
-        self.__thread.join()
+        self.__stop.set()
+        if self.__thread.is_alive():
+            self.__thread.join()
 
     def get_frame(self):
         if self.last_frame is None:
@@ -36,8 +66,30 @@ class PrinterCamera:
         encoded_image = base64.b64encode(self.last_frame).decode("utf-8")
         return encoded_image
 
+    def get_frame_info(self) -> FrameInfo | None:
+        """
+        Get the metadata of the latest frame, to skip decoding frames that
+        are not needed.
+
+        Returns:
+            FrameInfo | None: sequence, size in bytes, dimensions and time of
+                the latest frame, None before the first frame
+        """
+        latest = self.latest
+        return latest[1] if latest is not None else None
+
+    def _frame_error(self, kind: str, reason: str) -> None:
+        if kind == "dropped":
+            self.frames_dropped += 1
+        else:
+            self.frames_corrupt += 1
+        logging.debug("Camera frame %s: %s", kind, reason)
+        if instrumentation.ACTIVE:
+            instrumentation.record(f"camera.{kind}", 0.0,
+                                   host=self.__hostname)
+
     def retriever(self):
-        print("Starting camera thread.")
+        logging.info("Starting camera thread.")
 
         auth_data = bytearray()
         connect_attempts = 0
@@ -56,89 +108,110 @@ class PrinterCamera:
         for i in range(0, 32 - len(self.__access_code)):
             auth_data += struct.pack("<x")
 
-        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-
-        jpeg_start = bytearray([0xff, 0xd8, 0xff, 0xe0])
-        jpeg_end = bytearray([0xff, 0xd9])
+        ctx = self.tls.context
 
         read_chunk_size = 4096  # 4096 is the max we'll get even if we increase this.  # noqa
 
-        while True:
+        while not self.__stop.is_set():
+            error: Exception | str | None = "connection closed"
+            self.supervisor.connecting("camera")
             try:
-                with socket.create_connection((self.__hostname, self.__port)) as sock:  # noqa
-                    try:
-                        connect_attempts += 1
-                        sslSock = ctx.wrap_socket(sock,
-                                                  server_hostname=self.__hostname)      # noqa
-                        logging.info("Attempting to connect...")
-                        sslSock.write(auth_data)
-                        img = None
-                        payload_size = 0
-
-                        status = sslSock.getsockopt(socket.SOL_SOCKET,
-                                                    socket.SO_ERROR)
-                        if status != 0:
-                            logging.warning(f"Socket error: {status}")  # noqa  # pylint: disable=logging-fstring-interpolation
-                    except socket.error as e:  # noqa
-                        logging.warning(f"Error in socket: {e}")        # noqa  # pylint: disable=logging-fstring-interpolation
-                        continue
+                # Closing the TLS socket saves its session for the reconnect,
+                # the raw socket is closed too when the handshake fails
+                with (socket.create_connection((self.__hostname, self.__port), timeout=10) as sock,  # noqa
+                      ctx.wrap_socket(sock,
+                                      server_hostname=self.__hostname) as sslSock):  # noqa
+                    connect_attempts += 1
+                    if connect_attempts > 1 and instrumentation.ACTIVE:
+                        instrumentation.record("camera.reconnect", 0.0,
+                                               host=self.__hostname)
+                    logging.info("Attempting to connect...")
+                    sslSock.write(auth_data)
+                    img = None
+                    img_start = 0.0
+                    payload_size = 0
+                    connected = False
+
+                    status = sslSock.getsockopt(socket.SOL_SOCKET,
+                                                socket.SO_ERROR)
+                    if status != 0:
+                        logging.warning("Socket error: %s", status)
 
                     sslSock.setblocking(False)
                     sslSock.settimeout(5.0)
 
-                    while True:
+                    while not self.__stop.is_set():
                         try:
                             logging.debug("Reading chunk...")
                             dr = sslSock.recv(read_chunk_size)
 
                         except ssl.SSLWantReadError:
-                            time.sleep(1)
                             continue
 
                         except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
-                            logging.error(f"Exception. Type: {type(e)} Args: {e}")  # noqa  # pylint: disable=logging-fstring-interpolation
-                            time.sleep(1)
+                            logging.error("Exception. Type: %s Args: %s",
+                                          type(e), e)
+                            error = e
                             break
 
-                        logging.debug(f"Read chunk {len(dr)}")          # noqa  # pylint: disable=logging-fstring-interpolation
+                        logging.debug("Read chunk %d", len(dr))
 
                         if img is not None and len(dr) > 0:
                             logging.debug("Appending to Image")
                             img += dr
                             if len(img) > payload_size:
+                                self._frame_error(
+                                    "dropped", f"{len(img)} bytes received "
+                                    f"for a {payload_size} bytes frame")
                                 img = None
                             elif len(img) == payload_size:
-                                if img[:4] != jpeg_start:
-                                    pass
-                                elif img[-2:] != jpeg_end:
-                                    pass
+                                try:
+                                    info = validate_jpeg(img)
+                                except ValueError as e:
+                                    self._frame_error("corrupt", str(e))
                                 else:
+                                    self.frames_received += 1
+                                    self.latest = (img, FrameInfo(
+                                        self.frames_received, payload_size,
+                                        info.width, info.height,
+                                        time.time()))
                                     self.last_frame = img
+                                    if instrumentation.ACTIVE:
+                                        instrumentation.record(
+                                            "camera.frame",
+                                            time.perf_counter() - img_start,
+                                            host=self.__hostname,
+                                            bytes=payload_size)
                                 img = None
 
                         elif len(dr) == 16:
                             logging.debug("Got header")
-                            connect_attempts = 0
+                            if not connected:
+                                connected = True
+                                connect_attempts = 0
+                                self.supervisor.connected("camera")
                             img = bytearray()
+                            img_start = time.perf_counter()
                             payload_size = int.from_bytes(dr[0:3],
                                                           byteorder='little')
 
                         elif len(dr) == 0:
-                            time.sleep(5)
                             logging.error("Wrong access code or IP")
+                            error = "wrong access code or IP"
                             break
 
                         else:
                             logging.error("something bad happened")
-                            time.sleep(1)
+                            error = "unexpected data"
                             break
 
             except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
-                logging.error(f"Error occurred: {e}")           # noqa  # pylint: disable=logging-fstring-interpolation
-                continue
-            finally:
-                time.sleep(5)
-                logging.info("Reconnecting...")
-                continue
+                logging.error("Error occurred: %s", e)
+                error = e
+
+            if self.__stop.is_set():
+                break
+            delay = self.supervisor.disconnected("camera", error)
+            if not self.supervisor.wait(delay, self.__stop):
+                break
+            logging.info("Reconnecting...")
@@ -3,14 +3,25 @@ Client module for connecting to the Bambulabs 3D printer API
 and getting all the printer data.
 """
 
-from typing import BinaryIO
+import hashlib
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Iterable
 
 from bambulabs_api.states_info import PrintStatus
-from .camera_client import PrinterCamera
-from .ftp_client import PrinterFTPClient
-from .mqtt_client import PrinterMQTTClient
+from .connection import ConnectionListener, ConnectionSupervisor
 from .filament_info import Filament, AMSFilamentSettings
 
+if TYPE_CHECKING:
+    from .camera_client import FrameInfo, PrinterCamera
+    from .ftp_client import PrinterFTPClient, UploadSource
+    from .mqtt_client import PrinterMQTTClient
+    from .project_info import ProjectInfo, ProjectObject
+    from .telemetry import TelemetryBuffer
+    from .tls import TLSConfig
+    from .upload_cache import UploadCache
+
 __all__ = ['Printer']
 
 
@@ -18,33 +29,247 @@ class Printer:
     """
     Client Class for connecting to the Bambulabs 3D printer
     """
-    def __init__(self, ip_address, access_code, serial):
+    def __init__(self, ip_address, access_code, serial,
+                 report_fields: Iterable[str] | None = None,
+                 upload_cache: "UploadCache | None" = None,
+                 tls: "TLSConfig | None" = None):
         self.ip_address = ip_address
         self.access_code = access_code
         self.serial = serial
-
-        self.__printerMQTTClient = PrinterMQTTClient(self.ip_address,
-                                                     self.access_code,
-                                                     self.serial)
-        self.__printerCamera = PrinterCamera(self.ip_address,
-                                             self.access_code)
-        self.__printerFTPClient = PrinterFTPClient(self.ip_address,
-                                                   self.access_code)
-
-    def connect(self):
+        self.__upload_cache = upload_cache
+
+        # Shared so that failures of any connection back off all of them
+        self.supervisor = ConnectionSupervisor(serial)
+
+        # The clients are only built, and their modules imported, on first
+        # use, so that a Printer used for MQTT alone never sets up the
+        # camera or FTP clients
+        self.__report_fields = report_fields
+        # None uses the process-wide TLS settings, see bambulabs_api.tls
+        self.tls = tls
+        self.__lock = threading.Lock()
+        self.__mqtt: PrinterMQTTClient | None = None
+        self.__camera: PrinterCamera | None = None
+        self.__ftp: PrinterFTPClient | None = None
+
+    @property
+    def __printerMQTTClient(self) -> "PrinterMQTTClient":
+        client = self.__mqtt
+        if client is None:
+            with self.__lock:
+                if self.__mqtt is None:
+                    from .mqtt_client import PrinterMQTTClient  # noqa  # pylint: disable=import-outside-toplevel
+                    self.__mqtt = PrinterMQTTClient(
+                        self.ip_address, self.access_code, self.serial,
+                        fields=self.__report_fields,
+                        supervisor=self.supervisor, tls=self.tls)
+                client = self.__mqtt
+        return client
+
+    @__printerMQTTClient.setter
+    def __printerMQTTClient(self, client: "PrinterMQTTClient") -> None:
+        self.__mqtt = client
+
+    @property
+    def __printerCamera(self) -> "PrinterCamera":
+        camera = self.__camera
+        if camera is None:
+            with self.__lock:
+                if self.__camera is None:
+                    from .camera_client import PrinterCamera  # noqa  # pylint: disable=import-outside-toplevel
+                    self.__camera = PrinterCamera(self.ip_address,
+                                                  self.access_code,
+                                                  supervisor=self.supervisor,
+                                                  tls=self.tls)
+                camera = self.__camera
+        return camera
+
+    @__printerCamera.setter
+    def __printerCamera(self, camera: "PrinterCamera") -> None:
+        self.__camera = camera
+
+    @property
+    def __printerFTPClient(self) -> "PrinterFTPClient":
+        ftp = self.__ftp
+        if ftp is None:
+            with self.__lock:
+                if self.__ftp is None:
+                    from .ftp_client import PrinterFTPClient  # noqa  # pylint: disable=import-outside-toplevel
+                    self.__ftp = PrinterFTPClient(self.ip_address,
+                                                  self.access_code,
+                                                  supervisor=self.supervisor,
+                                                  tls=self.tls)
+                ftp = self.__ftp
+        return ftp
+
+    @__printerFTPClient.setter
+    def __printerFTPClient(self, ftp: "PrinterFTPClient") -> None:
+        self.__ftp = ftp
+
+    @property
+    def upload_cache(self) -> "UploadCache":
+        """
+        Manifest of the files uploaded to the printer, in memory unless one
+        was given to the constructor.
+        """
+        cache = self.__upload_cache
+        if cache is None:
+            with self.__lock:
+                if self.__upload_cache is None:
+                    from .upload_cache import UploadCache  # noqa  # pylint: disable=import-outside-toplevel
+                    self.__upload_cache = UploadCache()
+                cache = self.__upload_cache
+        return cache
+
+    @upload_cache.setter
+    def upload_cache(self, cache: "UploadCache") -> None:
+        self.__upload_cache = cache
+
+    def connect(self, camera: bool = True):
         """
         Connect to the printer
+
+        Parameters
+        ----------
+        camera : bool, optional
+            Also start the camera client, by default True.
         """
         self.__printerMQTTClient.connect()
         self.__printerMQTTClient.start()
-        self.__printerCamera.start()
+        if camera:
+            self.__printerCamera.start()
 
     def disconnect(self):
         """
         Disconnect from the printer
         """
-        self.__printerMQTTClient.stop()
-        self.__printerCamera.stop()
+        if self.__mqtt is not None:
+            self.__mqtt.stop()
+        if self.__camera is not None:
+            self.__camera.stop()
+
+    @property
+    def mqtt_client(self) -> "PrinterMQTTClient":
+        """
+        MQTT client of the printer, to send commands without the Printer
+        wrappers (see bambulabs_api.fleet).
+
+        Returns
+        -------
+        PrinterMQTTClient
+            The MQTT client.
+        """
+        return self.__printerMQTTClient
+
+    @property
+    def camera_client(self) -> "PrinterCamera":
+        """
+        Camera client of the printer, to read the raw JPEG frames (see
+        bambulabs_api.gateway).
+
+        Returns
+        -------
+        PrinterCamera
+            The camera client.
+        """
+        return self.__printerCamera
+
+    def add_connection_listener(self, listener: ConnectionListener) -> None:
+        """
+        Get notified of the MQTT, camera and FTP connection state changes.
+
+        Parameters
+        ----------
+        listener : Callable[[ConnectionEvent], None]
+            Called with a ConnectionEvent on every state change, from the
+            thread of the connection.
+        """
+        self.supervisor.add_listener(listener)
+
+    def add_report_listener(
+            self, listener: Callable[[dict[str, Any]], None]) -> None:
+        """
+        Get notified of every printer report.
+
+        Parameters
+        ----------
+        listener : Callable[[dict[str, Any]], None]
+            Called with the "print" section of each report once it has been
+            merged into the printer state, from the MQTT thread.
+        """
+        self.__printerMQTTClient.add_report_listener(listener)
+
+    def remove_report_listener(
+            self, listener: Callable[[dict[str, Any]], None]) -> None:
+        """
+        Stop notifying a listener added with add_report_listener.
+
+        Parameters
+        ----------
+        listener : Callable[[dict[str, Any]], None]
+            The listener to remove.
+        """
+        self.__printerMQTTClient.remove_report_listener(listener)
+
+    def set_report_fields(self, fields: Iterable[str] | None) -> None:
+        """
+        Only keep some fields of the printer reports, to save memory and
+        CPU time with many printers. Getters of the dropped fields return
+        their default value.
+
+        Parameters
+        ----------
+        fields : Iterable[str] | None
+            The report fields to keep, such as "gcode_state", "mc_percent"
+            or "bed_temper". None keeps every field.
+        """
+        self.__printerMQTTClient.set_report_fields(fields)
+
+    def enable_telemetry(self, fields: Iterable[str] | None = None,
+                         capacity: int = 3600) -> "TelemetryBuffer":
+        """
+        Start recording the printer telemetry history.
+
+        Parameters
+        ----------
+        fields : Iterable[str], optional
+            The report fields to record, by default temperatures, progress,
+            layer, speed and fan speeds.
+        capacity : int, optional
+            The number of samples kept, by default 3600.
+
+        Returns
+        -------
+        TelemetryBuffer
+            The buffer the telemetry is recorded into.
+        """
+        from .telemetry import DEFAULT_FIELDS  # noqa  # pylint: disable=import-outside-toplevel
+        return self.__printerMQTTClient.enable_telemetry(
+            DEFAULT_FIELDS if fields is None else fields, capacity)
+
+    def get_telemetry(self) -> "TelemetryBuffer | None":
+        """
+        Get the printer telemetry history.
+
+        Returns
+        -------
+        TelemetryBuffer
+            The telemetry buffer.
+        None if telemetry is not enabled.
+        """
+        return self.__printerMQTTClient.telemetry
+
+    def is_stale(self) -> bool:
+        """
+        Check if the printer state was restored from a snapshot and not
+        confirmed by a report yet (see bambulabs_api.snapshot).
+
+        Returns
+        -------
+        bool
+            True if the state may be outdated.
+        """
+        return self.__printerMQTTClient.stale
 
     def get_time(self) -> (int | str | None):
         """
@@ -166,16 +391,22 @@ class Printer:
         """
         return self.__printerMQTTClient.turn_light_off()
 
-    def upload_file(self, file: BinaryIO, filename: str = "ftp_upload.gcode") -> str:  # noqa
+    def upload_file(self, file: "UploadSource",
+                    filename: str = "ftp_upload.gcode",
+                    close: bool = False) -> str:
         """
         Upload a file to the printer.
 
         Parameters
         ----------
-        file : BinaryIO
-            The file to be uploaded.
+        file : bytes | bytearray | memoryview | BinaryIO | Iterable[bytes]
+            The content to upload: a bytes-like object, a binary file object
+            or an iterable of bytes-like chunks (e.g. a generator). It is
+            streamed without extra copies.
         filename : str, optional
             The name of the file, by default "ftp_upload.gcode".
+        close : bool, optional
+            Close the file object once uploaded, by default False.
 
         Returns
         -------
@@ -183,14 +414,131 @@ class Printer:
             The path of the uploaded file.
         """
         try:
-            if file and filename:
-                return self.__printerFTPClient.upload_file(file, filename)
+            if file is not None and filename:
+                result = self.__printerFTPClient.upload_file(file, filename)
+                # The content under this name is no longer the cached one
+                self.upload_cache.forget(self.serial, filename)
+                return result
         except Exception as e:
             raise Exception(f"Exception occurred during file upload: {e}")  # noqa  # pylint: disable=raise-missing-from,broad-exception-raised
         finally:
-            file.close()
+            if close and hasattr(file, "close"):
+                file.close()  # type: ignore
         return "No file uploaded."
 
+    async def upload_file_async(self, source: Any,
+                                filename: str = "ftp_upload.gcode") -> str:
+        """
+        Upload a file from an async stream without blocking the event loop.
+
+        Parameters
+        ----------
+        source : asyncio.StreamReader | AsyncIterable[bytes]
+            An object with an async read(n) method, or an async iterable of
+            bytes-like chunks such as an HTTP response body.
+        filename : str, optional
+            The name of the file, by default "ftp_upload.gcode".
+
+        Returns
+        -------
+        str
+            The server reply.
+        """
+        return await self.__printerFTPClient.upload_file_async(
+            source, filename)
+
+    def upload_file_if_needed(self, file: str | os.PathLike | BinaryIO | bytes,
+                              filename: str | None = None) -> str:
+        """
+        Upload a file unless the same content is already on the printer.
+
+        Uploads are recorded by content hash in the upload cache. When the
+        content was uploaded before and the printer still reports a file of
+        the same size under that name, the transfer is skipped.
+
+        Parameters
+        ----------
+        file : str | os.PathLike | BinaryIO | bytes | bytearray | memoryview
+            The file to upload, as a path, a seekable binary file object or
+            its content. File objects are left open and rewound.
+        filename : str, optional
+            The name on the printer, by default the base name of the path.
+
+        Returns
+        -------
+        str
+            The name of the file on the printer, which is the name of the
+            earlier upload when the transfer was skipped.
+        """
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "rb") as fp:
+                return self.upload_file_if_needed(
+                    fp, filename or os.path.basename(file))
+        if not filename:
+            raise ValueError("A filename is required for file objects")
+
+        if isinstance(file, (bytes, bytearray, memoryview)):
+            file = memoryview(file).cast("B")
+            sha256, size = hashlib.sha256(file).hexdigest(), len(file)
+        else:
+            from .upload_cache import hash_file  # noqa  # pylint: disable=import-outside-toplevel
+            sha256, size = hash_file(file)
+        record = self.upload_cache.lookup(self.serial, sha256)
+        if record is not None and \
+                self.__printerFTPClient.get_file_size(record.name) == size:
+            logging.info("%s already on %s as %s, skipping upload",
+                         filename, self.serial, record.name)
+            return record.name
+
+        if isinstance(file, memoryview):
+            self.__printerFTPClient.upload_file(file, filename)
+        else:
+            start = file.tell()
+            try:
+                self.__printerFTPClient.upload_file(file, filename)
+            finally:
+                file.seek(start)
+        self.upload_cache.record(self.serial, sha256, filename, size)
+        return filename
+
+    def print_file(self, file: str | os.PathLike | BinaryIO,
+                   plate_number: int = 1,
+                   filename: str | None = None,
+                   use_ams: bool = True,
+                   ams_mapping: list[int] | None = None,
+                   skip_objects: list[int] | None = None) -> bool:
+        """
+        Upload a 3MF file if needed and start printing it.
+
+        Parameters
+        ----------
+        file : str | os.PathLike | BinaryIO
+            The sliced 3MF file, as a path or seekable binary file object.
+        plate_number : int, optional
+            The plate number to print, by default 1.
+        filename : str, optional
+            The name on the printer, by default the base name of the path.
+        use_ams : bool, optional
+            Whether to use the AMS system, by default True.
+        ams_mapping : list[int], optional
+            The AMS mapping, by default computed from the loaded trays when
+            using the AMS.
+        skip_objects : list[int] | None, optional
+            The gcode objects to skip, by default None.
+
+        Returns
+        -------
+        bool
+            True if the print command was sent.
+        """
+        if ams_mapping is None:
+            ams_mapping = self.compute_ams_mapping(file, plate_number) \
+                if use_ams else [0]
+        name = self.upload_file_if_needed(file, filename)
+        return self.__printerMQTTClient.start_print_3mf(name, plate_number,
+                                                        use_ams, ams_mapping,
+                                                        skip_objects)
+
     def start_print(self, filename: str,
                     plate_number: int,
                     use_ams: bool = True,
@@ -225,6 +573,71 @@ class Printer:
                                                         ams_mapping,
                                                         skip_objects)
 
+    def compute_ams_mapping(self, file: str | os.PathLike | BinaryIO,
+                            plate_number: int) -> list[int]:
+        """
+        Compute the ams_mapping for a plate of a local 3MF file against the
+        filaments currently loaded in the AMS.
+
+        Parameters
+        ----------
+        file : str | os.PathLike | BinaryIO
+            The sliced 3MF file, as a path or seekable binary file object.
+        plate_number : int
+            The plate number to be printed.
+
+        Returns
+        -------
+        list[int]
+            The ams_mapping to pass to start_print.
+        """
+        from .project_info import compute_ams_mapping, read_project_info  # noqa  # pylint: disable=import-outside-toplevel
+        info = read_project_info(file)
+        return compute_ams_mapping(
+            info.get_plate(plate_number),
+            self.__printerMQTTClient.get_ams(),
+            filament_count=info.filament_count,
+            external_spool=self.__printerMQTTClient.get_external_spool())
+
+    def get_project_info(self, file: str | os.PathLike | BinaryIO
+                         ) -> "ProjectInfo":
+        """
+        Get the plates, objects, estimated time and filament use of a local
+        3MF file.
+
+        Parameters
+        ----------
+        file : str | os.PathLike | BinaryIO
+            The sliced 3MF file, as a path or seekable binary file object.
+
+        Returns
+        -------
+        ProjectInfo
+            The project metadata, with the sliced plates by plate number.
+        """
+        from .project_info import read_project_info  # noqa  # pylint: disable=import-outside-toplevel
+        return read_project_info(file)
+
+    def get_plate_objects(self, file: str | os.PathLike | BinaryIO,
+                          plate_number: int) -> "list[ProjectObject]":
+        """
+        Get the objects on a plate of a local 3MF file.
+
+        Parameters
+        ----------
+        file : str | os.PathLike | BinaryIO
+            The sliced 3MF file, as a path or seekable binary file object.
+        plate_number : int
+            The plate number.
+
+        Returns
+        -------
+        list[ProjectObject]
+            The objects with their ids and names.
+        """
+        from .project_info import read_project_info  # noqa  # pylint: disable=import-outside-toplevel
+        return list(read_project_info(file).get_plate(plate_number).objects)
+
     def stop_print(self) -> bool:
         """
         Stop the printer from printing.
@@ -374,9 +787,22 @@ class Printer:
         Returns
         -------
         str
-            The path of the deleted file.
-        """
-        return self.__printerFTPClient.delete_file(file_path)
+            The server reply.
+
+        Raises
+        ------
+        ftplib.Error
+            If the printer refused to delete the file, for example because
+            it does not exist. Failures were only logged, returning None,
+            before the connection supervisor was added.
+        OSError
+            If the printer could not be reached.
+        CircuitOpenError
+            If the printer circuit is open after repeated failures.
+        """
+        result = self.__printerFTPClient.delete_file(file_path)
+        self.upload_cache.forget(self.serial, file_path)
+        return result
 
     def calibrate_printer(self, bed_level: bool = True,
                           motor_noise_calibration: bool = True,
@@ -446,6 +872,19 @@ class Printer:
         """
         return self.__printerCamera.get_frame()
 
+    def get_camera_frame_info(self) -> "FrameInfo | None":
+        """
+        Get the metadata of the latest camera frame, read from its JPEG
+        headers without decoding it.
+
+        Returns
+        -------
+        FrameInfo | None
+            Sequence, size in bytes, dimensions and time of the frame, None
+            before the first frame.
+        """
+        return self.__printerCamera.get_frame_info()
+
     def get_current_state(self) -> PrintStatus:
         """
         Get the current state of the printer.
@@ -479,3 +918,23 @@ class Printer:
             bool: if publish command is successful
         """
         return self.__printerMQTTClient.skip_objects(obj_list=obj_list)
+
+    def skip_objects_by_name(self, file: str | os.PathLike | BinaryIO,
+                             plate_number: int,
+                             names: list[str]) -> bool:
+        """
+        Skip Objects during printing, looked up by name in the 3MF file
+        being printed.
+
+        Args:
+            file (str | os.PathLike | BinaryIO): local copy of the 3MF file
+                being printed.
+            plate_number (int): plate number being printed.
+            names (list[str]): names of the objects to skip.
+
+        Returns:
+            bool: if publish command is successful
+        """
+        from .project_info import read_project_info  # noqa  # pylint: disable=import-outside-toplevel
+        plate = read_project_info(file).get_plate(plate_number)
+        return self.skip_objects(plate.find_objects(names))
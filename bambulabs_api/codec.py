@@ -0,0 +1,184 @@
+"""
+JSON encoding and decoding of MQTT payloads.
+
+The backend is chosen at import time, orjson or msgspec when installed and
+the standard library ``json`` module otherwise. Use :func:`set_backend` to
+force one.
+"""
+
+import json
+from typing import Any, Callable, Iterable
+
+__all__ = ["BACKENDS", "ReportDecoder", "dumps", "get_backend", "loads",
+           "set_backend"]
+
+# Always kept by ReportDecoder, command answers are matched on them.
+ROUTING_FIELDS = ("command", "sequence_id", "result", "reason")
+
+
+def _json_backend() -> tuple[Callable[[bytes], Any], Callable[[Any], bytes]]:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+    return json.loads, dumps
+
+
+def _orjson_backend() -> tuple[Callable[[bytes], Any],
+                               Callable[[Any], bytes]]:
+    import orjson  # pylint: disable=import-outside-toplevel
+    return orjson.loads, orjson.dumps
+
+
+def _msgspec_backend() -> tuple[Callable[[bytes], Any],
+                                Callable[[Any], bytes]]:
+    import msgspec  # pylint: disable=import-outside-toplevel
+    return msgspec.json.decode, msgspec.json.encode
+
+
+# In order of preference
+BACKENDS: dict[str, Callable[[], tuple[Callable[[bytes], Any],
+                                       Callable[[Any], bytes]]]] = {
+    "orjson": _orjson_backend,
+    "msgspec": _msgspec_backend,
+    "json": _json_backend,
+}
+
+_backend = "json"
+_loads, _dumps = _json_backend()
+
+
+def set_backend(name: str | None = None) -> str:
+    """
+    Select the JSON backend.
+
+    Args:
+        name (str | None, optional): "orjson", "msgspec" or "json", None
+            for the fastest one installed. Defaults to None.
+
+    Raises:
+        ValueError: if the backend is unknown
+        ImportError: if the backend is not installed
+
+    Returns:
+        str: name of the selected backend
+    """
+    global _backend, _loads, _dumps  # pylint: disable=global-statement
+
+    if name is not None:
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown JSON backend {name!r}, "
+                             f"expected one of {', '.join(BACKENDS)}")
+        _loads, _dumps = BACKENDS[name]()
+        _backend = name
+        return name
+
+    for candidate in BACKENDS:
+        try:
+            return set_backend(candidate)
+        except ImportError:
+            continue
+    raise ImportError("No JSON backend available")  # json is always present
+
+
+def get_backend() -> str:
+    """
+    Get the name of the selected JSON backend.
+
+    Returns:
+        str: "orjson", "msgspec" or "json"
+    """
+    return _backend
+
+
+def loads(data: bytes | str) -> Any:
+    """
+    Decode a JSON document with the selected backend.
+
+    Args:
+        data (bytes | str): JSON document
+
+    Returns:
+        Any: decoded document
+    """
+    return _loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Encode a JSON document with the selected backend.
+
+    Args:
+        obj (Any): document to encode
+
+    Returns:
+        bytes: compact UTF-8 JSON
+    """
+    return _dumps(obj)
+
+
+class ReportDecoder:
+    """
+    Decoder for printer report payloads.
+
+    Without fields, it decodes the whole document with the selected backend.
+    With fields, the "print" section is reduced to those fields (plus the
+    command routing fields) and the other sections are dropped. When msgspec
+    is installed the unwanted fields are skipped by the parser instead of
+    being built and discarded, which matters for the large ``ams``, ``ipcam``
+    and ``upgrade_state`` subtrees of full reports.
+    """
+
+    def __init__(self, fields: Iterable[str] | None = None) -> None:
+        """
+        Args:
+            fields (Iterable[str] | None, optional): "print" fields to keep,
+                None to keep everything. Defaults to None.
+        """
+        self.fields: frozenset[str] | None = None
+        self._schema: Any = None
+        self._unset: Any = None
+        if fields is None:
+            return
+
+        self.fields = frozenset(fields) | frozenset(ROUTING_FIELDS)
+        try:
+            import msgspec  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            return
+        report = msgspec.defstruct(
+            "PrintReport",
+            [(f, Any, msgspec.UNSET) for f in sorted(self.fields)])
+        document = msgspec.defstruct(
+            "ReportDocument", [("print", report | None, None)])
+        self._schema = msgspec.json.Decoder(document)
+        self._unset = msgspec.UNSET
+
+    def decode(self, payload: bytes | str) -> dict[str, Any]:
+        """
+        Decode a report payload.
+
+        Args:
+            payload (bytes | str): JSON payload
+
+        Returns:
+            dict[str, Any]: decoded document
+        """
+        if self.fields is None:
+            return _loads(payload)
+
+        if self._schema is not None:
+            report = self._schema.decode(payload).print
+            if report is None:
+                return {}
+            unset = self._unset
+            return {"print": {f: v for f in report.__struct_fields__
+                              if (v := getattr(report, f)) is not unset}}
+
+        doc = _loads(payload)
+        report = doc.get("print")
+        if not isinstance(report, dict):
+            return {}
+        fields = self.fields
+        return {"print": {k: v for k, v in report.items() if k in fields}}
+
+
+set_backend()
@@ -0,0 +1,191 @@
+"""
+Rate limited command queue of one printer.
+
+Commands are sent right away while the printer is within its token bucket
+rate. Beyond that they wait in a bounded FIFO queue drained by a worker
+thread. Idempotent setters carry a coalescing key, such as
+"nozzle_temperature": while one is waiting, a newer call replaces its value
+in place, so only the latest value is sent.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable
+
+__all__ = ["CommandQueue", "TokenBucket"]
+
+
+class TokenBucket:
+    """
+    Token bucket, refilled at ``rate`` tokens per second up to ``burst``.
+    Not thread safe, callers hold their own lock.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        """
+        Args:
+            rate (float): tokens per second
+            burst (int, optional): bucket size. Defaults to 1.
+        """
+        if rate <= 0 or burst < 1:
+            raise ValueError("Rate must be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+
+    def take(self) -> float:
+        """
+        Take a token if one is available.
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until the next
+                token
+        """
+        now = time.monotonic()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+class CommandQueue:
+    """
+    Queue of the commands to one printer, sent through ``publish`` under a
+    token bucket rate limit.
+    """
+
+    def __init__(self, publish: Callable[[dict[str, Any]], bool],
+                 rate: float = 2.0, burst: int = 5, max_depth: int = 64,
+                 name: str = "") -> None:
+        """
+        Args:
+            publish (Callable[[dict[str, Any]], bool]): sends a command
+                payload, returns whether it was published
+            rate (float, optional): commands per second. Defaults to 2.
+            burst (int, optional): commands sent at once after an idle
+                period. Defaults to 5.
+            max_depth (int, optional): queued commands beyond which new
+                commands are dropped. Defaults to 64.
+            name (str, optional): printer name for the logs
+        """
+        if max_depth < 1:
+            raise ValueError("max_depth must be at least 1")
+        self.bucket = TokenBucket(rate, burst)
+        self.max_depth = max_depth
+        self.name = name
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+        self._publish = publish
+        self._pending: deque[list[Any]] = deque()
+        self._keyed: dict[str, list[Any]] = {}
+        self._busy = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def depth(self) -> int:
+        """
+        Number of queued commands
+        """
+        return len(self._pending)
+
+    def submit(self, payload: dict[str, Any], key: str | None = None) -> bool:
+        """
+        Send a command now if the rate allows, otherwise queue it.
+
+        Args:
+            payload (dict[str, Any]): command payload
+            key (str | None, optional): coalescing key of idempotent
+                commands, a queued command with the same key is replaced
+
+        Returns:
+            bool: the publish result when sent right away, True when queued,
+                False when dropped
+        """
+        with self._cond:
+            if self._closed:
+                self.dropped += 1
+                return False
+            send_now = not self._pending and not self._busy \
+                and self.bucket.take() == 0
+            if send_now:
+                self._busy = True
+            elif key is not None and key in self._keyed:
+                self._keyed[key][1] = payload
+                self.coalesced += 1
+                return True
+            elif len(self._pending) >= self.max_depth:
+                self.dropped += 1
+                logging.warning("Command queue of %s full, dropping %s",
+                                self.name, payload)
+                return False
+            else:
+                entry = [key, payload]
+                self._pending.append(entry)
+                if key is not None:
+                    self._keyed[key] = entry
+                self._start()
+                self._cond.notify_all()
+                return True
+        return self._send(payload)
+
+    def _send(self, payload: dict[str, Any]) -> bool:
+        try:
+            published = self._publish(payload)
+        except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
+            logging.error("Command to %s failed: %s", self.name, e)
+            published = False
+        with self._cond:
+            self.sent += 1
+            self._busy = False
+            self._cond.notify_all()
+        return published
+
+    def _start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name=f"commands-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    if not self._pending or self._busy:
+                        self._cond.wait()
+                        continue
+                    wait = self.bucket.take()
+                    if wait:
+                        self._cond.wait(wait)
+                        continue
+                    key, payload = self._pending.popleft()
+                    if key is not None:
+                        del self._keyed[key]
+                    self._busy = True
+                    break
+            self._send(payload)
+
+    def close(self) -> None:
+        """
+        Stop the worker, queued commands are dropped.
+        """
+        with self._cond:
+            self._closed = True
+            self.dropped += len(self._pending)
+            self._pending.clear()
+            self._keyed.clear()
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
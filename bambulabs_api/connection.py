@@ -0,0 +1,302 @@
+"""
+Reconnection supervisor shared by the MQTT, camera and FTP clients.
+
+A :class:`ConnectionSupervisor` tracks the connections of one printer. Failed
+connections wait for an exponential backoff with jitter, so printers that
+dropped together do not reconnect in lockstep. Consecutive failures across
+all the connections of the printer open a circuit breaker, which stops
+attempts for a while. Listeners receive a :class:`ConnectionEvent` on every
+state change.
+"""
+
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable
+
+__all__ = ["BackoffPolicy", "CircuitOpenError", "ConnectionEvent",
+           "ConnectionState", "ConnectionSupervisor"]
+
+
+class ConnectionState(Enum):
+    """
+    State of a supervised connection
+    """
+    DISCONNECTED = "disconnected"
+    CONNECTING = "connecting"
+    CONNECTED = "connected"
+    BACKOFF = "backoff"
+    CIRCUIT_OPEN = "circuit_open"
+
+
+class CircuitOpenError(ConnectionError):
+    """
+    Raised when a connection is refused because the printer circuit is open
+    """
+
+
+@dataclass(frozen=True)
+class BackoffPolicy:
+    """
+    Exponential backoff with jitter.
+
+    The delay before attempt ``n`` is ``initial * multiplier ** (n - 1)``,
+    capped at ``maximum``, then reduced by a random fraction of up to
+    ``jitter`` of itself.
+    """
+    initial: float = 1.0
+    maximum: float = 60.0
+    multiplier: float = 2.0
+    jitter: float = 0.5
+
+    def __post_init__(self) -> None:
+        if self.initial < 0 or self.maximum < self.initial:
+            raise ValueError("Backoff needs 0 <= initial <= maximum")
+        if self.multiplier < 1:
+            raise ValueError("Backoff multiplier must be at least 1")
+        if not 0 <= self.jitter <= 1:
+            raise ValueError("Backoff jitter must be between 0 and 1")
+
+    def delay(self, attempt: int, rng: random.Random | None = None) -> float:
+        """
+        Get the delay before a reconnection attempt.
+
+        Args:
+            attempt (int): number of consecutive failures, from 1
+            rng (random.Random | None, optional): random source.
+                Defaults to the random module.
+
+        Returns:
+            float: seconds to wait
+        """
+        exponent = min(max(attempt - 1, 0), 64)
+        base = min(self.maximum, self.initial * self.multiplier ** exponent)
+        return base * (1 - self.jitter * (rng or random).random())
+
+
+@dataclass(frozen=True)
+class ConnectionEvent:
+    """
+    Connection state change
+    """
+    name: str
+    channel: str
+    state: ConnectionState
+    failures: int = 0
+    delay: float = 0.0
+    error: BaseException | str | None = None
+
+
+ConnectionListener = Callable[[ConnectionEvent], None]
+
+
+class ConnectionSupervisor:
+    """
+    Backoff and circuit breaker for the connections of one printer.
+
+    Each client reports its channel ("mqtt", "camera", "ftp") with
+    :meth:`connecting`, :meth:`connected` and :meth:`disconnected`, the last
+    one returns how long to wait before the next attempt. The circuit opens
+    after ``failure_threshold`` consecutive failures on any channel and stays
+    open ``reset_timeout`` seconds, then lets one attempt through.
+    """
+
+    def __init__(self, name: str = "",
+                 policy: BackoffPolicy | None = None,
+                 failure_threshold: int = 8,
+                 reset_timeout: float = 300.0,
+                 seed: int | None = None) -> None:
+        """
+        Args:
+            name (str, optional): printer name used in events and logs
+            policy (BackoffPolicy | None, optional): backoff policy.
+                Defaults to BackoffPolicy().
+            failure_threshold (int, optional): consecutive failures opening
+                the circuit, 0 to never open it. Defaults to 8.
+            reset_timeout (float, optional): seconds the circuit stays open.
+                Defaults to 300.
+            seed (int | None, optional): seed of the jitter. Defaults to None.
+        """
+        self.name = name
+        self.policy = policy or BackoffPolicy()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._states: dict[str, ConnectionState] = {}
+        self._attempts: dict[str, int] = {}
+        self._failures = 0
+        self._open_until = 0.0
+        self._listeners: list[ConnectionListener] = []
+
+    def add_listener(self, listener: ConnectionListener) -> None:
+        """
+        Register a callback called with every ConnectionEvent. Callbacks run
+        on the thread of the client reporting the change.
+
+        Args:
+            listener (ConnectionListener): event callback
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: ConnectionListener) -> None:
+        """
+        Unregister a callback added with add_listener.
+
+        Args:
+            listener (ConnectionListener): event callback
+        """
+        self._listeners.remove(listener)
+
+    def state(self, channel: str) -> ConnectionState:
+        """
+        Get the state of a channel.
+
+        Args:
+            channel (str): channel name
+
+        Returns:
+            ConnectionState: channel state
+        """
+        with self._lock:
+            return self._states.get(channel, ConnectionState.DISCONNECTED)
+
+    def states(self) -> dict[str, ConnectionState]:
+        """
+        Get the state of every channel seen so far.
+
+        Returns:
+            dict[str, ConnectionState]: state by channel
+        """
+        with self._lock:
+            return dict(self._states)
+
+    @property
+    def circuit_open(self) -> bool:
+        """
+        Whether the circuit is open, refusing connection attempts
+        """
+        return time.monotonic() < self._open_until
+
+    def _emit(self, event: ConnectionEvent) -> None:
+        for listener in list(self._listeners):
+            try:
+                listener(event)
+            except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
+                logging.error("Connection listener failed: %s", e)
+
+    def _set(self, channel: str, state: ConnectionState,
+             delay: float = 0.0,
+             error: BaseException | str | None = None) -> None:
+        with self._lock:
+            changed = self._states.get(channel) != state
+            self._states[channel] = state
+            failures = self._failures
+        if changed or delay:
+            self._emit(ConnectionEvent(self.name, channel, state, failures,
+                                       delay, error))
+
+    def connecting(self, channel: str) -> None:
+        """
+        Report a connection attempt.
+
+        Args:
+            channel (str): channel name
+        """
+        self._set(channel, ConnectionState.CONNECTING)
+
+    def connected(self, channel: str) -> None:
+        """
+        Report a successful connection, resetting the backoff and closing
+        the circuit.
+
+        Args:
+            channel (str): channel name
+        """
+        with self._lock:
+            self._attempts[channel] = 0
+            self._failures = 0
+            self._open_until = 0.0
+        logging.info("%s %s connected", self.name, channel)
+        self._set(channel, ConnectionState.CONNECTED)
+
+    def closed(self, channel: str) -> None:
+        """
+        Report a connection closed on purpose.
+
+        Args:
+            channel (str): channel name
+        """
+        self._set(channel, ConnectionState.DISCONNECTED)
+
+    def disconnected(self, channel: str,
+                     error: BaseException | str | None = None) -> float:
+        """
+        Report a failed or lost connection.
+
+        Args:
+            channel (str): channel name
+            error (BaseException | str | None, optional): cause
+
+        Returns:
+            float: seconds to wait before the next attempt
+        """
+        now = time.monotonic()
+        with self._lock:
+            attempt = self._attempts.get(channel, 0) + 1
+            self._attempts[channel] = attempt
+            self._failures += 1
+            delay = self.policy.delay(attempt, self._random)
+            if now < self._open_until:
+                delay = max(delay, self._open_until - now)
+            elif self.failure_threshold \
+                    and self._failures >= self.failure_threshold:
+                # Open, or re-open after a failed half-open attempt
+                self._open_until = now + self.reset_timeout \
+                    * (1 - self.policy.jitter / 2 * self._random.random())
+                delay = max(delay, self._open_until - now)
+            state = ConnectionState.CIRCUIT_OPEN if now < self._open_until \
+                else ConnectionState.BACKOFF
+
+        logging.warning("%s %s disconnected (%s), retrying in %.1fs",
+                        self.name, channel, error, delay)
+        self._set(channel, state, delay, error)
+        return delay
+
+    def check(self, channel: str) -> None:
+        """
+        Refuse a connection attempt while the circuit is open.
+
+        Args:
+            channel (str): channel name
+
+        Raises:
+            CircuitOpenError: if the circuit is open
+        """
+        remaining = self._open_until - time.monotonic()
+        if remaining > 0:
+            raise CircuitOpenError(
+                f"{self.name or 'printer'} {channel} circuit open, "
+                f"retry in {remaining:.0f}s")
+
+    def wait(self, delay: float,
+             stop: threading.Event | None = None) -> bool:
+        """
+        Wait a backoff delay.
+
+        Args:
+            delay (float): seconds to wait
+            stop (threading.Event | None, optional): event interrupting the
+                wait. Defaults to None.
+
+        Returns:
+            bool: False if the wait was interrupted by ``stop``
+        """
+        if stop is None:
+            time.sleep(delay)
+            return True
+        return not stop.wait(delay)
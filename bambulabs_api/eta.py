@@ -0,0 +1,373 @@
+"""
+Print finish time estimation from the report stream.
+
+The remaining time reported by the printer (``mc_remaining_time``) swings
+widely early in a print. Each report gives two estimates of the finish
+time:
+
+- the printer estimate, now plus ``mc_remaining_time``
+- the progress estimate, extrapolating the printing time spent so far
+  (pauses and preparation stages such as heating or bed leveling
+  excluded, scaled by the speed level ``spd_mag``) to the remaining
+  progress, from ``mc_percent`` or the layers
+
+Early in a print the printer estimate is trusted more, then the progress
+estimate takes over. The blended estimates are smoothed with an
+exponentially weighted mean and variance, so each report costs a constant
+time, and the variance bounds the finish time. Pauses postpone the finish
+time by their duration.
+
+The state of every printer is kept in columns, so a whole fleet is
+queried in one vectorized call (with numpy installed) to plan jobs.
+"""
+
+import math
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+from typing import Any, Iterable
+
+__all__ = ["EtaTracker", "PrintEta"]
+
+NAN = float("nan")
+
+_IDLE, _PREPARE, _RUNNING, _PAUSE, _FINISH = 0.0, 1.0, 2.0, 3.0, 4.0
+_STATES = {"IDLE": _IDLE, "PREPARE": _PREPARE, "SLICING": _PREPARE,
+           "RUNNING": _RUNNING, "PAUSE": _PAUSE, "FINISH": _FINISH,
+           "FAILED": _IDLE}
+
+# stg_cur values during which the printer prints: printing, idle, unknown
+_PRINTING_STAGES = frozenset({0.0, 255.0, -1.0})
+
+# Relative uncertainty of the first estimate of a print
+_PRIOR_ERROR = 0.25
+
+_COLUMNS = ("state", "stage", "mean", "var", "observed", "progress",
+            "origin", "work", "last", "speed", "paused_since")
+
+
+@dataclass(frozen=True)
+class PrintEta:
+    """
+    Estimated finish of a print, times in seconds since the epoch
+    """
+    serial: str
+    finish: float
+    low: float
+    high: float
+    remaining: float
+    progress: float
+
+
+class EtaTracker:
+    """
+    Finish time estimates of the prints of a group of printers.
+
+    Added printers feed the tracker from their report listeners. Updates of
+    a printer come from its MQTT thread and cost a constant time.
+    """
+
+    def __init__(self, printers: Iterable[Any] = (),
+                 halflife: float = 120.0,
+                 z: float = 1.64,
+                 blend_progress: float = 0.2) -> None:
+        """
+        Args:
+            printers (Iterable[Printer | PrinterMQTTClient], optional):
+                printers to track, such as a Fleet
+            halflife (float, optional): seconds after which an estimate
+                weighs half in the smoothed one, whatever the report rate.
+                Defaults to 120.
+            z (float, optional): standard deviations of the finish time
+                bounds, 1.64 for 90%. Defaults to 1.64.
+            blend_progress (float, optional): progress observed, between 0
+                and 1, from which only the progress estimate is used.
+                Defaults to 0.2.
+        """
+        if halflife <= 0 or z < 0 or not 0 < blend_progress <= 1:
+            raise ValueError("halflife must be positive, z not negative and "
+                             "blend_progress in (0, 1]")
+        self.halflife = halflife
+        self.z = z
+        self.blend_progress = blend_progress
+        self.serials: list[str] = []
+        self.rows: dict[str, int] = {}
+        self._columns = {name: array("d") for name in _COLUMNS}
+        self._listeners: dict[str, tuple[Any, Any]] = {}
+        self._lock = threading.Lock()
+        for printer in printers:
+            self.add(printer)
+
+    def add(self, printer: Any) -> None:
+        """
+        Track a printer, starting from its current state.
+
+        Args:
+            printer (Printer | PrinterMQTTClient): printer
+        """
+        client = getattr(printer, "mqtt_client", printer)
+        serial = client.serial
+        with self._lock:
+            if serial in self._listeners:
+                return
+            row = self.rows.get(serial)
+            if row is None:
+                # Removed printers keep their row when added back
+                row = self.rows[serial] = len(self.serials)
+                self.serials.append(serial)
+                for column in self._columns.values():
+                    column.append(NAN)
+            for column in self._columns.values():
+                column[row] = NAN
+            self._columns["state"][row] = _IDLE
+            self._columns["speed"][row] = 1.0
+            self._columns["stage"][row] = -1.0
+            # Claims the serial until the listener is registered
+            self._listeners[serial] = (client, None)
+
+        def listener(report: dict[str, Any]) -> None:
+            self.update(serial, report)
+
+        data, last_report = client.state_snapshot()
+        if data and not client.stale:
+            self.update(serial, data, last_report)
+        client.add_report_listener(listener)
+        self._listeners[serial] = (client, listener)
+
+    def remove(self, serial: str) -> None:
+        """
+        Stop tracking a printer, its row is reset and kept.
+
+        Args:
+            serial (str): printer serial
+        """
+        entry = self._listeners.pop(serial, None)
+        if entry is not None:
+            client, listener = entry
+            if listener is not None:
+                client.remove_report_listener(listener)
+            self._columns["state"][self.rows[serial]] = _IDLE
+            self._columns["mean"][self.rows[serial]] = NAN
+
+    def update(self, serial: str, report: dict[str, Any],
+               now: float | None = None) -> None:
+        """
+        Update the estimate of a printer with a report.
+
+        Args:
+            serial (str): printer serial
+            report (dict[str, Any]): the "print" section of a report
+            now (float | None, optional): report time. Defaults to now.
+        """
+        if now is None:
+            now = time.time()
+        row = self.rows[serial]
+        c = self._columns
+        state = c["state"][row]
+
+        # Printing time, in seconds at 100% speed, up to this report
+        if state == _RUNNING and not math.isnan(c["last"][row]):
+            if c["stage"][row] in _PRINTING_STAGES:
+                c["work"][row] += (now - c["last"][row]) * c["speed"][row]
+            c["last"][row] = now
+
+        new_state = _STATES.get(report.get("gcode_state", ""), state)
+        if new_state != state:
+            self._transition(row, state, new_state, now)
+            state = new_state
+
+        stage = report.get("stg_cur")
+        if stage is not None:
+            c["stage"][row] = float(stage)
+        speed = report.get("spd_mag")
+        if speed:
+            c["speed"][row] = float(speed) / 100
+
+        progress = self._progress(report)
+        if progress is not None:
+            c["progress"][row] = progress
+        if state == _RUNNING and progress is not None and \
+                math.isnan(c["origin"][row]):
+            # Progress when the tracking of the print started, the printing
+            # time is counted from there
+            c["origin"][row] = progress
+            c["work"][row] = 0.0
+        remaining = report.get("mc_remaining_time")
+        if state not in (_PREPARE, _RUNNING) or \
+                (progress is None and remaining is None):
+            return
+        self._observe(row, self._instant(row, remaining, now), now)
+
+    @staticmethod
+    def _progress(report: dict[str, Any]) -> float | None:
+        percent = report.get("mc_percent")
+        if percent is not None:
+            return min(max(float(percent) / 100, 0.0), 1.0)
+        layer, total = report.get("layer_num"), report.get("total_layer_num")
+        if layer is not None and total:
+            return min(max(float(layer) / float(total), 0.0), 1.0)
+        return None
+
+    def _transition(self, row: int, state: float, new_state: float,
+                    now: float) -> None:
+        c = self._columns
+        c["state"][row] = new_state
+        if new_state == _RUNNING:
+            if state == _PAUSE:
+                # The pause postponed the finish
+                c["mean"][row] += now - c["paused_since"][row]
+            else:
+                # A new print, the progress of the previous one is stale
+                c["work"][row] = 0.0
+                c["origin"][row] = c["progress"][row] = NAN
+                if state != _PREPARE:
+                    c["mean"][row] = c["var"][row] = NAN
+            c["paused_since"][row] = NAN
+            c["last"][row] = now
+        elif new_state == _PAUSE:
+            c["paused_since"][row] = now
+        elif new_state == _FINISH:
+            c["mean"][row] = now
+            c["var"][row] = 0.0
+            c["progress"][row] = 1.0
+        else:
+            c["mean"][row] = c["var"][row] = c["progress"][row] = NAN
+
+    def _instant(self, row: int, remaining: Any, now: float) -> float:
+        c = self._columns
+        printer = now + float(remaining) * 60 if remaining is not None \
+            else NAN
+        progress, work = c["progress"][row], c["work"][row]
+        done = progress - c["origin"][row]
+        extrapolated = NAN
+        if done > 0 and work > 0:
+            extrapolated = now + work * (1 - progress) / done \
+                / c["speed"][row]
+        if math.isnan(printer):
+            return extrapolated
+        if math.isnan(extrapolated):
+            return printer
+        weight = min(done / self.blend_progress, 1.0)
+        return (1 - weight) * printer + weight * extrapolated
+
+    def _observe(self, row: int, estimate: float, now: float) -> None:
+        if math.isnan(estimate):
+            return
+        c = self._columns
+        mean = c["mean"][row]
+        elapsed = now - c["observed"][row]
+        c["observed"][row] = now
+        if math.isnan(mean) or math.isnan(elapsed):
+            c["mean"][row] = estimate
+            c["var"][row] = ((estimate - now) * _PRIOR_ERROR) ** 2
+            return
+        alpha = 1 - 0.5 ** (max(elapsed, 0.0) / self.halflife)
+        delta = estimate - mean
+        c["mean"][row] = mean + alpha * delta
+        c["var"][row] = (1 - alpha) * (c["var"][row] + alpha * delta * delta)
+
+    def estimate(self, serial: str,
+                 now: float | None = None) -> PrintEta | None:
+        """
+        Get the finish estimate of a printer.
+
+        Args:
+            serial (str): printer serial
+            now (float | None, optional): query time. Defaults to now.
+
+        Returns:
+            PrintEta | None: finish time and bounds, None without a print
+                or before its first estimate
+        """
+        if now is None:
+            now = time.time()
+        row = self.rows[serial]
+        c = self._columns
+        mean = c["mean"][row]
+        if math.isnan(mean):
+            return None
+        if c["state"][row] == _PAUSE:
+            mean += now - c["paused_since"][row]
+        spread = self.z * math.sqrt(c["var"][row])
+        # Prints not over yet finish now at the earliest
+        floor = mean if c["state"][row] == _FINISH else now
+        finish = max(mean, floor)
+        return PrintEta(serial, finish, max(mean - spread, floor),
+                        max(mean + spread, floor), finish - now,
+                        c["progress"][row])
+
+    def estimates(self, now: float | None = None) -> dict[str, PrintEta]:
+        """
+        Get the finish estimates of every printer with one.
+
+        Args:
+            now (float | None, optional): query time. Defaults to now.
+
+        Returns:
+            dict[str, PrintEta]: estimates by serial
+        """
+        if now is None:
+            now = time.time()
+        result = {}
+        for serial in list(self.serials):
+            eta = self.estimate(serial, now)
+            if eta is not None:
+                result[serial] = eta
+        return result
+
+    def finish_times(self, now: float | None = None) -> tuple[Any, Any, Any]:
+        """
+        Get the finish times and bounds of every printer in one vectorized
+        call, in the order of ``serials``.
+
+        Finished prints have their finish time, printers without an
+        estimate NaN. Uses numpy when installed, lists otherwise.
+
+        Args:
+            now (float | None, optional): query time. Defaults to now.
+
+        Returns:
+            tuple[Any, Any, Any]: finish times, low and high bounds
+        """
+        if now is None:
+            now = time.time()
+        try:
+            import numpy as np  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            etas = [self.estimate(serial, now)
+                    for serial in list(self.serials)]
+            return ([e.finish if e else NAN for e in etas],
+                    [e.low if e else NAN for e in etas],
+                    [e.high if e else NAN for e in etas])
+
+        with self._lock:
+            c = {name: np.frombuffer(column, dtype=np.float64).copy()
+                 for name, column in self._columns.items()}
+        paused = c["state"] == _PAUSE
+        mean = c["mean"] + np.where(paused, now - c["paused_since"], 0.0)
+        spread = self.z * np.sqrt(c["var"])
+        floor = np.where(c["state"] == _FINISH, mean, now)
+        return (np.maximum(mean, floor), np.maximum(mean - spread, floor),
+                np.maximum(mean + spread, floor))
+
+    def finishing_before(self, deadline: float, confident: bool = False,
+                         now: float | None = None) -> list[str]:
+        """
+        Get the printers whose print should be over by a deadline, to plan
+        the next jobs.
+
+        Args:
+            deadline (float): time in seconds since the epoch
+            confident (bool, optional): use the high bound instead of the
+                estimate. Defaults to False.
+            now (float | None, optional): query time. Defaults to now.
+
+        Returns:
+            list[str]: serials, soonest first
+        """
+        finish, _, high = self.finish_times(now)
+        times = high if confident else finish
+        due = [(t, serial) for t, serial in zip(times, self.serials)
+               if t <= deadline]
+        return [serial for _, serial in sorted(due)]
@@ -0,0 +1,223 @@
+"""
+Send the same command to many printers at once.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator
+
+__all__ = ["BroadcastResult", "COMMANDS", "Fleet"]
+
+# PrinterMQTTClient methods publishing a command to the printer
+COMMANDS = frozenset({
+    "auto_home",
+    "calibration",
+    "load_filament_spool",
+    "manual_update",
+    "pause_print",
+    "pushall",
+    "resume_filament_action",
+    "resume_print",
+    "set_bed_height",
+    "set_bed_temperature",
+    "set_nozzle_temperature",
+    "set_print_speed_lvl",
+    "set_printer_filament",
+    "skip_objects",
+    "start_print_3mf",
+    "stop_print",
+    "turn_light_off",
+    "turn_light_on",
+    "unload_filament_spool",
+})
+
+Selector = str | Iterable[str] | Callable[[Any], bool] | None
+
+
+@dataclass(frozen=True)
+class BroadcastResult:
+    """
+    Outcome of a command on one printer
+    """
+    serial: str
+    value: Any = None
+    error: BaseException | None = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        """
+        Whether the command ran without error and did not return False
+        """
+        return self.error is None and self.value is not False
+
+
+class Fleet:
+    """
+    Group of printers, selectable by serial or tag, receiving commands
+    concurrently.
+
+    Members are Printer objects or bare PrinterMQTTClients, named commands
+    are sent through the MQTT client of each printer.
+    """
+
+    def __init__(self, printers: Iterable[Any] = (),
+                 max_workers: int = 128) -> None:
+        """
+        Args:
+            printers (Iterable[Printer | PrinterMQTTClient], optional):
+                printers to add
+            max_workers (int, optional): commands sent at the same time.
+                Defaults to 128.
+        """
+        self._printers: dict[str, Any] = {}
+        self._tags: dict[str, set[str]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="fleet")
+        for printer in printers:
+            self.add(printer)
+
+    def __enter__(self) -> "Fleet":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._printers)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(list(self._printers.values()))
+
+    def __getitem__(self, serial: str) -> Any:
+        return self._printers[serial]
+
+    def add(self, printer: Any, tags: Iterable[str] = ()) -> None:
+        """
+        Add a printer, or update the tags of a known one.
+
+        Args:
+            printer (Printer | PrinterMQTTClient): printer
+            tags (Iterable[str], optional): tags to select it by, such as
+                "bay3" or "pla"
+        """
+        self._printers[printer.serial] = printer
+        self._tags[printer.serial] = set(tags)
+
+    def remove(self, serial: str) -> None:
+        """
+        Remove a printer.
+
+        Args:
+            serial (str): printer serial
+        """
+        self._printers.pop(serial, None)
+        self._tags.pop(serial, None)
+
+    def tags(self, serial: str) -> set[str]:
+        """
+        Get the tags of a printer.
+
+        Args:
+            serial (str): printer serial
+
+        Returns:
+            set[str]: tags
+        """
+        return set(self._tags.get(serial, ()))
+
+    def select(self, selector: Selector = None) -> list[Any]:
+        """
+        Select printers.
+
+        Args:
+            selector (Selector, optional): None for every printer, a tag,
+                an iterable of serials or a predicate taking a printer
+
+        Returns:
+            list[Printer]: selected printers
+        """
+        printers = list(self._printers.values())
+        if selector is None:
+            return printers
+        if isinstance(selector, str):
+            return [p for p in printers if selector in self._tags[p.serial]]
+        if callable(selector):
+            return [p for p in printers if selector(p)]
+        serials = set(selector)
+        return [p for p in printers if p.serial in serials]
+
+    def broadcast(self, command: str | Callable[[Any], Any], *args: Any,
+                  selector: Selector = None, timeout: float = 10.0,
+                  **kwargs: Any) -> dict[str, BroadcastResult]:
+        """
+        Run a command on the selected printers concurrently.
+
+        Args:
+            command (str | Callable[[Any], Any]): name of a PrinterMQTTClient
+                command method (see COMMANDS), or a function called with
+                each fleet member
+            args: arguments of the command method
+            selector (Selector, optional): printers to target, see select.
+                Defaults to every printer.
+            timeout (float, optional): seconds to wait for the results.
+                Printers that did not answer in time get a TimeoutError.
+            kwargs: keyword arguments of the command method
+
+        Raises:
+            ValueError: if the command is not a PrinterMQTTClient command
+
+        Returns:
+            dict[str, BroadcastResult]: result by printer serial
+        """
+        if isinstance(command, str):
+            if command not in COMMANDS:
+                raise ValueError(f"Unknown printer command {command!r}")
+            name = command
+
+            def run(printer: Any) -> Any:
+                client = getattr(printer, "mqtt_client", printer)
+                return getattr(client, name)(*args, **kwargs)
+        else:
+            def run(printer: Any) -> Any:
+                return command(printer, *args, **kwargs)  # type: ignore
+
+        from .mqtt_client import publish_deadline  # noqa  # pylint: disable=import-outside-toplevel
+        deadline = time.monotonic() + timeout
+
+        def timed(printer: Any) -> BroadcastResult:
+            start = time.perf_counter()
+            # Commands stop waiting to be sent at the deadline, so timed out
+            # printers do not hold on to the worker threads
+            token = publish_deadline.set(deadline)
+            try:
+                value = run(printer)
+            except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
+                return BroadcastResult(printer.serial, error=e,
+                                       elapsed=time.perf_counter() - start)
+            finally:
+                publish_deadline.reset(token)
+            return BroadcastResult(printer.serial, value,
+                                   elapsed=time.perf_counter() - start)
+
+        futures = {p.serial: self._executor.submit(timed, p)
+                   for p in self.select(selector)}
+        wait(futures.values(), timeout=timeout)
+
+        results = {}
+        for serial, future in futures.items():
+            if future.done():
+                results[serial] = future.result()
+            else:
+                future.cancel()
+                results[serial] = BroadcastResult(
+                    serial, error=TimeoutError(
+                        f"No result after {timeout:g}s"), elapsed=timeout)
+        return results
+
+    def close(self) -> None:
+        """
+        Stop the worker threads, commands still running are left to finish
+        """
+        self._executor.shutdown(wait=False, cancel_futures=True)
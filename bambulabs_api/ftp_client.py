@@ -1,8 +1,111 @@
+import asyncio
 import ftplib
+import inspect
+import select
 import ssl
 
 import logging
-from typing import Any, BinaryIO
+from typing import Any, AsyncIterable, BinaryIO, Iterable, Iterator, Union
+
+from bambulabs_api import instrumentation
+from bambulabs_api.connection import ConnectionSupervisor
+from bambulabs_api.tls import TLSConfig, get_default_config
+
+# Anything upload_file can send
+UploadSource = Union[bytes, bytearray, memoryview, BinaryIO,
+                     Iterable[Union[bytes, bytearray, memoryview]]]
+
+
+def iter_chunks(source: UploadSource, blocksize: int = 32768
+                ) -> Iterator[bytes | memoryview]:
+    """
+    Split an upload source into chunks without copying it.
+
+    Buffers are sliced with memoryview, file objects are read with readinto
+    into one reused buffer (or read when they have no readinto) and
+    iterables are passed through. Yielded memoryviews are only valid until
+    the next chunk is requested.
+
+    Args:
+        source (UploadSource): bytes-like object, binary file object or
+            iterable of bytes-like chunks
+        blocksize (int, optional): chunk size. Defaults to 32768.
+
+    Yields:
+        bytes | memoryview: chunks
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source).cast("B")
+        for start in range(0, len(view), blocksize):
+            yield view[start:start + blocksize]
+        return
+
+    readinto = getattr(source, "readinto", None)
+    if readinto is not None:
+        buffer = bytearray(blocksize)
+        view = memoryview(buffer)
+        while size := readinto(buffer):
+            yield view[:size]
+        return
+
+    read = getattr(source, "read", None)
+    if read is not None:
+        while chunk := read(blocksize):
+            yield chunk
+        return
+
+    for chunk in source:  # type: ignore
+        if chunk:
+            yield chunk
+
+
+async def aiter_chunks(source: Any, blocksize: int = 32768
+                       ) -> AsyncIterable[bytes]:
+    """
+    Read an async stream in chunks.
+
+    Args:
+        source (Any): object with an async read(n) method, such as
+            asyncio.StreamReader, or async iterable of bytes-like chunks
+        blocksize (int, optional): read size. Defaults to 32768.
+
+    Yields:
+        bytes: chunks
+    """
+    read = getattr(source, "read", None)
+    if read is not None and inspect.iscoroutinefunction(read):
+        while chunk := await read(blocksize):
+            yield chunk
+        return
+
+    async for chunk in source:
+        if chunk:
+            yield chunk
+
+
+def _drain_pending(conn: ssl.SSLSocket, limit: int = 65536) -> None:
+    """
+    Read what the server already sent on a data connection, such as TLS 1.3
+    session tickets, without waiting for more. Closing a socket with unread
+    data resets the connection and the server can lose the tail of the
+    file. When nothing is pending the connection is closed as before.
+
+    Args:
+        conn (ssl.SSLSocket): data connection
+        limit (int, optional): bytes read at most. Defaults to 65536.
+    """
+    conn.settimeout(0.0)
+    read = 0
+    try:
+        while read < limit and (conn.pending()
+                                or select.select([conn], [], [], 0)[0]):
+            data = conn.recv(4096)
+            if not data:
+                break
+            read += len(data)
+    except OSError:
+        # SSLWantReadError once only handshake messages were pending
+        pass
 
 
 class ImplicitFTP_TLS(ftplib.FTP_TLS):
@@ -24,21 +127,31 @@ class ImplicitFTP_TLS(ftplib.FTP_TLS):
             value = self.context.wrap_socket(value)
         self._sock = value
 
+    def ntransfercmd(self, cmd, rest=None):
+        """Open a data connection resuming the control channel TLS session, as
+        FTPS servers commonly require, which also skips a full handshake."""
+        conn, size = ftplib.FTP.ntransfercmd(self, cmd, rest)
+        if self._prot_p:
+            session = self.sock.session if self.sock is not None else None
+            conn = self.context.wrap_socket(conn, server_hostname=self.host,
+                                            session=session)
+            # Data connections use ephemeral ports, never cache by address
+            conn._session_key = None
+        return conn, size
+
     def storbinary(self, cmd, fp, blocksize=8192, callback=None, rest=None):
+        """Store a file, fp can be any UploadSource, see iter_chunks."""
         self.voidcmd('TYPE I')
         conn = self.transfercmd(cmd, rest)
         try:
-            while 1:
-                buf = fp.read(blocksize)
-                if not buf:
-                    break
+            for buf in iter_chunks(fp, blocksize):
                 conn.sendall(buf)
                 if callback:
                     callback(buf)
             # shutdown ssl layer
             if isinstance(conn, ssl.SSLSocket):
                 # conn.unwrap()  # Fix for storbinary waiting indefinitely for response message from server  # noqa
-                pass
+                _drain_pending(conn)
         finally:
             conn.close()  # This is the addition to the previous comment.
         return self.voidresp()
@@ -49,46 +162,178 @@ class PrinterFTPClient:
                  server_ip: str,
                  access_code: str,
                  user: str = 'bblp',
-                 port: int = 990) -> None:
-        self.ftps = ImplicitFTP_TLS()
+                 port: int = 990,
+                 supervisor: ConnectionSupervisor | None = None,
+                 retries: int = 2,
+                 tls: TLSConfig | None = None) -> None:
+        self.tls = tls or get_default_config()
+        self.ftps = ImplicitFTP_TLS(context=self.tls.context)
 
         self.server_ip = server_ip
         self.port = port
         self.user = user
         self.access_code = access_code
 
+        self.supervisor = supervisor or ConnectionSupervisor(server_ip)
+        self.retries = retries
+
+    def _connect(self) -> None:
+        """
+        Connect and log in, retrying network errors with the supervisor
+        backoff.
+
+        Raises:
+            CircuitOpenError: if the printer circuit is open
+            OSError: if the connection failed after the retries
+            ftplib.Error: if the server refused the login
+        """
+        attempt = 0
+        while True:
+            self.supervisor.check("ftp")
+            self.supervisor.connecting("ftp")
+            logging.info("Connecting to FTP server...")
+            try:
+                self.ftps.connect(host=self.server_ip, port=self.port)
+                self.ftps.login(self.user, self.access_code)
+                logging.info("%s", self.ftps.prot_p())
+            except (OSError, ftplib.Error) as e:
+                self.ftps.close()
+                delay = self.supervisor.disconnected("ftp", e)
+                attempt += 1
+                if isinstance(e, ftplib.Error) or attempt > self.retries:
+                    raise
+                self.supervisor.wait(delay)
+                continue
+            self.supervisor.connected("ftp")
+            return
+
     @staticmethod
     def connect_and_run(func):
         """
         A decorator that connects to the FTP server before running the function and closes the connection after running the function.
+        Errors are logged and raised to the caller, decorated methods no longer return None on failure.
 
         Args:
             func (function): the function to be decorated
         """ # noqa
         def wrapper(self, *args, **kwargs) -> Any:
-            logging.info("Connecting to FTP server...")
-            self.ftps.connect(host=self.server_ip, port=self.port)
-            self.ftps.login(self.user, self.access_code)
-            logging.info("Connected to FTP server")
-            logging.info(self.ftps.prot_p())
-
+            self._connect()
             try:
                 return func(self, *args, **kwargs)  # type: ignore
-            except Exception as e:                                  # noqa  # pylint: disable=broad-exception-caught
-                logging.error(f"Failed to execute function: {e}")   # noqa  # pylint: disable=logging-fstring-interpolation
+            except Exception as e:
+                logging.error("Failed to execute function: %s", e)
+                raise
             finally:
                 self.ftps.close()
+                self.supervisor.closed("ftp")
                 logging.info("Connection to FTP server closed")
         return wrapper
 
+    def upload_file(self, file: UploadSource, file_path: str,
+                    close: bool = False) -> str:
+        """
+        Upload a file.
+
+        Args:
+            file (UploadSource): bytes-like object, binary file object or
+                iterable of bytes-like chunks, sent without extra copies
+            file_path (str): file path on the printer
+            close (bool, optional): close the file object once sent.
+                Defaults to False.
+
+        Returns:
+            str: the server reply
+        """
+        try:
+            return self._upload(file, file_path)
+        finally:
+            if close and hasattr(file, "close"):
+                file.close()  # type: ignore
+
+    async def upload_file_async(self, source: Any, file_path: str,
+                                blocksize: int = 32768) -> str:
+        """
+        Upload from an async stream, such as an asyncio.StreamReader or an
+        async iterable of chunks. The transfer runs in a worker thread that
+        pulls one chunk at a time from the event loop, so at most one chunk
+        is buffered.
+
+        Args:
+            source (Any): async stream, see aiter_chunks
+            file_path (str): file path on the printer
+            blocksize (int, optional): read size. Defaults to 32768.
+
+        Returns:
+            str: the server reply
+        """
+        loop = asyncio.get_running_loop()
+        chunks = aiter_chunks(source, blocksize).__aiter__()
+
+        async def next_chunk() -> bytes | None:
+            try:
+                return await chunks.__anext__()
+            except StopAsyncIteration:
+                return None
+
+        def pull() -> Iterator[bytes]:
+            while (chunk := asyncio.run_coroutine_threadsafe(
+                    next_chunk(), loop).result()) is not None:
+                yield chunk
+
+        return await loop.run_in_executor(None, self.upload_file, pull(),
+                                          file_path)
+
+    @connect_and_run
+    def _upload(self, file: UploadSource, file_path: str) -> str:
+        sent = 0
+
+        def callback(buf: bytes) -> None:
+            nonlocal sent
+            sent += len(buf)
+            logging.debug("Uploaded %d bytes", sent)
+
+        with instrumentation.span("ftp.transfer",
+                                  host=self.server_ip) as span:
+            try:
+                return self.ftps.storbinary(f'STOR {file_path}', file,
+                                            blocksize=32768,
+                                            callback=callback)
+            finally:
+                span.set("bytes", sent)
+
     @connect_and_run
-    def upload_file(self, file: BinaryIO, file_path: str) -> str:
-        return self.ftps.storbinary(f'STOR {file_path}', file, blocksize=32768,
-                                 callback=lambda x: logging.debug(f"Uploaded {x} bytes"))   # noqa  # pylint: disable=logging-fstring-interpolation
+    def get_file_size(self, file_path: str) -> int | None:
+        """
+        Get the size of a file on the printer.
+
+        Args:
+            file_path (str): file path on the printer
+
+        Returns:
+            int | None: size in bytes, None if the file does not exist
+        """
+        self.ftps.voidcmd('TYPE I')
+        try:
+            return self.ftps.size(file_path)
+        except ftplib.error_perm:
+            return None
 
     @connect_and_run
     def delete_file(self, file_path: str) -> str:
-        logging.info(f"Deleting file: {file_path}")     # noqa  # pylint: disable=logging-fstring-interpolation
+        """
+        Delete a file.
+
+        Args:
+            file_path (str): file path on the printer
+
+        Raises:
+            ftplib.Error: if the server refused to delete the file
+            OSError: if the printer could not be reached
+
+        Returns:
+            str: the server reply
+        """
+        logging.info("Deleting file: %s", file_path)
         return self.ftps.delete(file_path)
 
     def close(self) -> None:
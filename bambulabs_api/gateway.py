@@ -0,0 +1,685 @@
+"""
+HTTP and WebSocket gateway sharing printer connections between consumers.
+
+The gateway owns one Printer per device and serves what it receives to any
+number of consumers, so that N consumers cost one MQTT session and one
+camera stream per printer:
+
+- ``GET /printers``: serials and state versions of the printers
+- ``GET /printers/<serial>/state``: the cached state, with an ETag so that
+  polling consumers get ``304 Not Modified`` until a report arrives
+- ``GET /printers/<serial>/ws``: WebSocket sending the state, then every
+  report as a delta to merge into it
+- ``GET /printers/<serial>/camera.jpg``: the latest camera frame
+- ``GET /printers/<serial>/camera.mjpg``: MJPEG stream of the camera
+- ``POST /printers/<serial>/commands/<command>``: runs one of the
+  ``bambulabs_api.fleet.COMMANDS`` with the JSON body
+  ``{"args": [...], "kwargs": {...}}``
+
+Example
+-------
+
+python -m bambulabs_api.gateway --port 8080 \
+    --printer 192.168.1.200:AC12309BH109:12347890
+"""
+
+import argparse
+import asyncio
+import base64
+import functools
+import hashlib
+import hmac
+import logging
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from http import HTTPStatus
+from typing import Any, Iterable
+from urllib.parse import parse_qs, urlsplit
+
+from bambulabs_api import codec
+from bambulabs_api.fleet import COMMANDS
+
+__all__ = ["Gateway"]
+
+_WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+_WS_TEXT, _WS_CLOSE, _WS_PING, _WS_PONG = 0x1, 0x8, 0x9, 0xA
+_MAX_BODY = 1 << 16
+_BOUNDARY = b"frame"
+
+
+def _client(printer: Any) -> Any:
+    return getattr(printer, "mqtt_client", printer)
+
+
+def _ws_frame(payload: bytes, opcode: int = _WS_TEXT) -> bytes:
+    size = len(payload)
+    if size < 126:
+        header = struct.pack("!BB", 0x80 | opcode, size)
+    elif size < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, size)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, size)
+    return header + payload
+
+
+async def _ws_read(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+    head = await reader.readexactly(2)
+    size = head[1] & 0x7F
+    if size == 126:
+        size = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif size == 127:
+        size = struct.unpack("!Q", await reader.readexactly(8))[0]
+    if size > _MAX_BODY:
+        raise ValueError("WebSocket frame too large")
+    mask = await reader.readexactly(4) if head[1] & 0x80 else b""
+    data = await reader.readexactly(size)
+    if mask and size:
+        key = (mask * (size // 4 + 1))[:size]
+        data = (int.from_bytes(data, "big") ^ int.from_bytes(key, "big")) \
+            .to_bytes(size, "big")
+    return head[0] & 0x0F, data
+
+
+@dataclass
+class _Request:
+    method: str
+    path: list[str]
+    query: dict[str, list[str]]
+    headers: dict[str, str]
+    body: bytes
+    keep_alive: bool
+
+
+class _Subscriber:
+    """
+    WebSocket consumer of the reports of one printer. Consumers too slow
+    for the reports skip the queued deltas and get the whole state again.
+    """
+
+    def __init__(self, max_queue: int) -> None:
+        # None stands for the whole state, sent first
+        self.queue: asyncio.Queue[bytes | None] = asyncio.Queue(max_queue)
+        self.queue.put_nowait(None)
+
+    def push(self, message: bytes) -> None:
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class _Device:
+    """
+    Printer served by the gateway, with its encoded state and camera frame
+    cached for all the consumers
+    """
+
+    def __init__(self, printer: Any, camera: bool) -> None:
+        self.printer = printer
+        self.client = _client(printer)
+        self.serial: str = self.client.serial
+        self.camera = getattr(printer, "camera_client", None) \
+            if camera else None
+        # Bumped by every report, read before the state is copied so that
+        # a version never labels an older state
+        self.version = 0
+        self.subscribers: set[_Subscriber] = set()
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+        self._state: tuple[int, bytes] | None = None
+        self._frame: Any = None
+        self._frame_bytes = b""
+        self.frame_seq = 0
+        self._watchers = 0
+        self._pump: asyncio.Task | None = None
+        self._new_frame = asyncio.Event()
+
+    def on_report(self, report: dict[str, Any]) -> None:
+        """
+        Report listener, called from the MQTT thread
+        """
+        self.version += 1
+        loop = self.loop
+        if not self.subscribers or loop is None:
+            return
+        message = _ws_frame(codec.dumps(
+            {"type": "delta", "serial": self.serial,
+             "version": self.version, "data": report}))
+        try:
+            loop.call_soon_threadsafe(self._fanout, message)
+        except RuntimeError:
+            # Loop closed while the gateway stops
+            pass
+
+    def _fanout(self, message: bytes) -> None:
+        for subscriber in self.subscribers:
+            subscriber.push(message)
+
+    def state(self) -> tuple[int, bytes]:
+        """
+        Get the state version and its JSON encoding, encoded once per
+        version.
+        """
+        version = self.version
+        cached = self._state
+        if cached is None or cached[0] != version:
+            data, last_report = self.client.state_snapshot()
+            cached = self._state = (version, codec.dumps(
+                {"type": "state", "serial": self.serial,
+                 "version": version, "last_report": last_report,
+                 "stale": self.client.stale, "data": data}))
+        return cached
+
+    def frame(self) -> tuple[int, bytes] | None:
+        """
+        Get the latest camera frame and its sequence number, None before
+        the first frame.
+        """
+        frame = self.camera.last_frame if self.camera is not None else None
+        if frame is None:
+            return None
+        if frame is not self._frame:
+            # The camera client stores every frame in a new buffer
+            self._frame = frame
+            self._frame_bytes = bytes(frame)
+            self.frame_seq += 1
+        return self.frame_seq, self._frame_bytes
+
+    async def next_frame(self, seq: int,
+                         interval: float) -> tuple[int, bytes]:
+        """
+        Wait for a frame newer than ``seq``. One task per printer polls the
+        camera while someone is waiting.
+        """
+        self._watchers += 1
+        try:
+            if self._pump is None:
+                self._pump = asyncio.create_task(self._run_pump(interval))
+            while True:
+                frame = self.frame()
+                if frame is not None and frame[0] != seq:
+                    return frame
+                await self._new_frame.wait()
+        finally:
+            self._watchers -= 1
+
+    async def _run_pump(self, interval: float) -> None:
+        try:
+            seq = self.frame_seq
+            while self._watchers:
+                await asyncio.sleep(interval)
+                frame = self.frame()
+                if frame is not None and frame[0] != seq:
+                    seq = frame[0]
+                    event, self._new_frame = self._new_frame, asyncio.Event()
+                    event.set()
+        finally:
+            self._pump = None
+
+
+class Gateway:
+    """
+    HTTP and WebSocket server exposing a group of printers.
+    """
+
+    def __init__(self, printers: Iterable[Any] = (),
+                 connect: bool = True,
+                 camera: bool = True,
+                 token: str | None = None,
+                 max_fps: float = 10.0,
+                 max_queue: int = 256) -> None:
+        """
+        Args:
+            printers (Iterable[Printer], optional): printers to serve, such
+                as a Fleet
+            connect (bool, optional): connect the printers when added and
+                disconnect them when removed. Defaults to True.
+            camera (bool, optional): serve the camera frames, which starts
+                the camera clients. Defaults to True.
+            token (str | None, optional): bearer token required on every
+                request, in the Authorization header or the ``token`` query
+                parameter. Defaults to None, no authentication.
+            max_fps (float, optional): camera polling rate of the MJPEG
+                streams. Defaults to 10.
+            max_queue (int, optional): deltas queued for a WebSocket
+                consumer before it is sent the whole state instead.
+                Defaults to 256.
+        """
+        if max_fps <= 0 or max_queue < 1:
+            raise ValueError("max_fps must be positive and max_queue at "
+                             "least 1")
+        self.connect = connect
+        self.camera = camera
+        self.token = token
+        self.frame_interval = 1 / max_fps
+        self.max_queue = max_queue
+        self.port = 0
+        # Changes on every start, so that ETags of a previous run never
+        # match
+        self._epoch = format(time.time_ns(), "x")
+        self._devices: dict[str, _Device] = {}
+        self._server: asyncio.base_events.Server | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread_loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        for printer in printers:
+            self.add(printer)
+
+    def add(self, printer: Any) -> None:
+        """
+        Add a printer, connected first unless the gateway was created with
+        ``connect=False``.
+
+        Args:
+            printer (Printer): printer
+        """
+        device = _Device(printer, self.camera)
+        device.loop = self._loop
+        if self.connect:
+            printer.connect(camera=self.camera)
+        device.client.add_report_listener(device.on_report)
+        self._devices[device.serial] = device
+
+    def remove(self, serial: str) -> None:
+        """
+        Remove a printer, disconnected unless the gateway was created with
+        ``connect=False``.
+
+        Args:
+            serial (str): printer serial
+        """
+        device = self._devices.pop(serial, None)
+        if device is None:
+            return
+        device.client.remove_report_listener(device.on_report)
+        if self.connect:
+            device.printer.disconnect()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> None:
+        """
+        Start serving on the running loop.
+
+        Args:
+            host (str, optional): address to bind. Defaults to localhost.
+            port (int, optional): port, 0 for any. Defaults to 8080.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._epoch = format(time.time_ns(), "x")
+        for device in self._devices.values():
+            device.loop = self._loop
+        self._server = await asyncio.start_server(self._session, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logging.info("Gateway serving %d printers on %s:%d",
+                     len(self._devices), host, self.port)
+
+    async def stop(self) -> None:
+        """
+        Stop serving, the printers stay connected.
+        """
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for device in self._devices.values():
+            device.loop = None
+
+    def start_in_thread(self, host: str = "127.0.0.1",
+                        port: int = 8080) -> None:
+        """
+        Serve from a new event loop in a daemon thread, for use from
+        synchronous code.
+        """
+        self._thread_loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._thread_loop.run_forever, name="gateway",
+            daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(host, port),
+                                         self._thread_loop).result()
+
+    def stop_thread(self) -> None:
+        """
+        Stop a gateway started with start_in_thread.
+        """
+        loop = self._thread_loop
+        if loop is None:
+            return
+
+        async def shutdown() -> None:
+            await self.stop()
+            tasks = [t for t in asyncio.all_tasks()
+                     if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        if self._thread is not None:
+            self._thread.join(5)
+        loop.close()
+        self._thread_loop = self._thread = None
+
+    def close(self) -> None:
+        """
+        Stop serving and remove every printer.
+        """
+        self.stop_thread()
+        for serial in list(self._devices):
+            self.remove(serial)
+
+    def __enter__(self) -> "Gateway":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def _etag(self, serial: str, version: int | str) -> str:
+        return f'"{serial}-{self._epoch}-{version}"'
+
+    async def _read_request(self, reader: asyncio.StreamReader
+                            ) -> _Request | None:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        lines = head.decode("latin-1").split("\r\n")
+        method, target, version = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if not 0 <= length <= _MAX_BODY:
+            raise ValueError("Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        url = urlsplit(target)
+        keep_alive = version == "HTTP/1.1" and \
+            headers.get("connection", "").lower() != "close"
+        return _Request(method, [p for p in url.path.split("/") if p],
+                        parse_qs(url.query), headers, body, keep_alive)
+
+    @staticmethod
+    def _respond(writer: asyncio.StreamWriter, status: int,
+                 body: bytes = b"",
+                 content_type: str = "application/json",
+                 headers: dict[str, str] | None = None,
+                 keep_alive: bool = True) -> None:
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+                 f"Content-Length: {len(body)}"]
+        if body:
+            lines.append(f"Content-Type: {content_type}")
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        if not keep_alive:
+            lines.append("Connection: close")
+        writer.write("\r\n".join(lines).encode("latin-1") + b"\r\n\r\n"
+                     + body)
+
+    def _error(self, writer: asyncio.StreamWriter, status: int,
+               message: str, keep_alive: bool = True) -> None:
+        self._respond(writer, status, codec.dumps({"error": message}),
+                      keep_alive=keep_alive)
+
+    def _authorized(self, request: _Request) -> bool:
+        if self.token is None:
+            return True
+        given = request.headers.get("authorization", "")
+        if given.startswith("Bearer "):
+            given = given[7:]
+        else:
+            given = request.query.get("token", [""])[0]
+        return hmac.compare_digest(given.encode(), self.token.encode())
+
+    async def _session(self, reader: asyncio.StreamReader,
+                       writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except (ValueError, asyncio.LimitOverrunError):
+                    self._error(writer, 400, "malformed request",
+                                keep_alive=False)
+                    break
+                if request is None:
+                    break
+                if not await self._dispatch(request, reader, writer):
+                    break
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request: _Request,
+                        reader: asyncio.StreamReader,
+                        writer: asyncio.StreamWriter) -> bool:
+        """
+        Answer a request, returns whether the connection stays open for
+        the next one
+        """
+        keep_alive = request.keep_alive
+        path = request.path
+        if not self._authorized(request):
+            self._error(writer, 401, "unauthorized", keep_alive)
+            return keep_alive
+        if path == ["printers"] and request.method == "GET":
+            self._list(writer, keep_alive)
+            return keep_alive
+        device = self._devices.get(path[1]) \
+            if len(path) >= 3 and path[0] == "printers" else None
+        if device is None:
+            self._error(writer, 404, "not found", keep_alive)
+            return keep_alive
+
+        route = path[2:]
+        if route == ["state"] and request.method == "GET":
+            self._state(device, request, writer)
+        elif route == ["ws"] and request.method == "GET":
+            await self._websocket(device, request, reader, writer)
+            return False
+        elif route == ["camera.jpg"] and request.method == "GET":
+            self._snapshot(device, request, writer)
+        elif route == ["camera.mjpg"] and request.method == "GET":
+            await self._mjpeg(device, reader, writer)
+            return False
+        elif len(route) == 2 and route[0] == "commands" and \
+                request.method == "POST":
+            await self._command(device, route[1], request, writer)
+        else:
+            self._error(writer, 404, "not found", keep_alive)
+        return keep_alive
+
+    def _list(self, writer: asyncio.StreamWriter, keep_alive: bool) -> None:
+        printers = [{"serial": d.serial, "version": d.version,
+                     "last_report": d.client.last_report,
+                     "stale": d.client.stale}
+                    for d in list(self._devices.values())]
+        self._respond(writer, 200, codec.dumps({"printers": printers}),
+                      keep_alive=keep_alive)
+
+    @staticmethod
+    def _not_modified(request: _Request, etag: str) -> bool:
+        tags = request.headers.get("if-none-match")
+        if tags is None:
+            return False
+        return tags.strip() == "*" or \
+            etag in (t.strip() for t in tags.split(","))
+
+    def _state(self, device: _Device, request: _Request,
+               writer: asyncio.StreamWriter) -> None:
+        version = device.version
+        etag = self._etag(device.serial, version)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if self._not_modified(request, etag):
+            self._respond(writer, 304, headers=headers,
+                          keep_alive=request.keep_alive)
+            return
+        version, body = device.state()
+        headers["ETag"] = self._etag(device.serial, version)
+        self._respond(writer, 200, body, headers=headers,
+                      keep_alive=request.keep_alive)
+
+    def _snapshot(self, device: _Device, request: _Request,
+                  writer: asyncio.StreamWriter) -> None:
+        frame = device.frame()
+        if frame is None:
+            self._error(writer, 503, "no camera frame", request.keep_alive)
+            return
+        seq, data = frame
+        etag = self._etag(device.serial, f"f{seq}")
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if self._not_modified(request, etag):
+            self._respond(writer, 304, headers=headers,
+                          keep_alive=request.keep_alive)
+        else:
+            self._respond(writer, 200, data, "image/jpeg", headers,
+                          request.keep_alive)
+
+    async def _mjpeg(self, device: _Device, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        if device.camera is None:
+            self._error(writer, 503, "camera disabled", keep_alive=False)
+            return
+        writer.write(b"HTTP/1.1 200 OK\r\n"
+                     b"Content-Type: multipart/x-mixed-replace; boundary="
+                     + _BOUNDARY + b"\r\n"
+                     b"Cache-Control: no-cache\r\n"
+                     b"Connection: close\r\n\r\n")
+
+        async def stream() -> None:
+            seq = 0
+            while True:
+                seq, data = await device.next_frame(seq, self.frame_interval)
+                writer.write(b"--" + _BOUNDARY + b"\r\n"
+                             b"Content-Type: image/jpeg\r\n"
+                             b"Content-Length: " + str(len(data)).encode()
+                             + b"\r\n\r\n" + data + b"\r\n")
+                # Slow consumers skip the frames sent while they catch up
+                await writer.drain()
+
+        # The consumer sends nothing more, stop streaming when it hangs up
+        # even if no frame arrives
+        tasks = {asyncio.create_task(stream()),
+                 asyncio.create_task(reader.read())}
+        done, _ = await asyncio.wait(tasks,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _websocket(self, device: _Device, request: _Request,
+                         reader: asyncio.StreamReader,
+                         writer: asyncio.StreamWriter) -> None:
+        key = request.headers.get("sec-websocket-key")
+        if request.headers.get("upgrade", "").lower() != "websocket" or \
+                key is None:
+            self._error(writer, 400, "WebSocket upgrade expected",
+                        keep_alive=False)
+            return
+        accept = base64.b64encode(
+            hashlib.sha1(key.encode() + _WS_GUID).digest()).decode()
+        self._respond(writer, 101, headers={
+            "Upgrade": "websocket", "Connection": "Upgrade",
+            "Sec-WebSocket-Accept": accept})
+
+        subscriber = _Subscriber(self.max_queue)
+        device.subscribers.add(subscriber)
+
+        async def send() -> None:
+            while True:
+                message = await subscriber.queue.get()
+                if message is None:
+                    message = _ws_frame(device.state()[1])
+                writer.write(message)
+                await writer.drain()
+
+        sender = asyncio.create_task(send())
+        try:
+            while True:
+                opcode, data = await _ws_read(reader)
+                if opcode == _WS_CLOSE:
+                    writer.write(_ws_frame(data[:2], _WS_CLOSE))
+                    break
+                if opcode == _WS_PING:
+                    writer.write(_ws_frame(data, _WS_PONG))
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            device.subscribers.discard(subscriber)
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+
+    async def _command(self, device: _Device, name: str, request: _Request,
+                       writer: asyncio.StreamWriter) -> None:
+        keep_alive = request.keep_alive
+        if name not in COMMANDS:
+            self._error(writer, 404, f"unknown command {name}", keep_alive)
+            return
+        try:
+            doc = codec.loads(request.body) if request.body else {}
+            args = list(doc.get("args", ()))
+            kwargs = dict(doc.get("kwargs", {}))
+        except (ValueError, TypeError, AttributeError):
+            self._error(writer, 400, "body must be a JSON object with "
+                        "args and kwargs", keep_alive)
+            return
+        call = functools.partial(getattr(device.client, name), *args,
+                                 **kwargs)
+        try:
+            value = await asyncio.get_running_loop().run_in_executor(
+                None, call)
+        except TypeError as e:
+            self._error(writer, 400, str(e), keep_alive)
+            return
+        except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
+            self._error(writer, 502, str(e), keep_alive)
+            return
+        self._respond(writer, 200,
+                      codec.dumps({"ok": value is not False,
+                                   "value": value}),
+                      keep_alive=keep_alive)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Printer gateway")
+    parser.add_argument("--printer", action="append", default=[],
+                        metavar="IP:SERIAL:ACCESS_CODE",
+                        help="printer to serve, repeat for each printer")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--no-camera", action="store_true",
+                        help="do not start the camera clients")
+    parser.add_argument("--token", help="bearer token required on every "
+                        "request")
+    parser.add_argument("--max-fps", type=float, default=10.0)
+    args = parser.parse_args()
+
+    from bambulabs_api.client import Printer  # noqa  # pylint: disable=import-outside-toplevel
+
+    logging.basicConfig(level=logging.INFO)
+    printers = []
+    for spec in args.printer:
+        ip, serial, access_code = spec.rsplit(":", 2)
+        printers.append(Printer(ip, access_code, serial))
+    gateway = Gateway(printers, camera=not args.no_camera, token=args.token,
+                      max_fps=args.max_fps)
+
+    async def serve() -> None:
+        await gateway.start(args.host, args.port)
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gateway.close()
+
+
+if __name__ == "__main__":
+    main()
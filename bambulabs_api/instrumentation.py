@@ -0,0 +1,259 @@
+"""
+Timing spans around the client hot paths.
+
+Spans are only timed while at least one hook is registered, otherwise
+:func:`span` returns a shared no-op object. Hooks are called with the span
+name, its duration in seconds and its attributes.
+
+Span names
+----------
+
+mqtt.decode: JSON decoding of a report (serial, bytes).
+mqtt.merge: merging a report into the printer state (serial).
+mqtt.publish: publishing a command until it is sent (serial, result).
+camera.frame: assembling a camera frame from its chunks (host, bytes).
+camera.reconnect: camera reconnection attempt, zero duration (host).
+camera.dropped: camera frame of the wrong size, zero duration (host).
+camera.corrupt: camera frame that is not a whole JPEG, zero duration (host).
+ftp.transfer: an FTP upload (host, bytes).
+"""
+
+import bisect
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable
+
+__all__ = ["span", "record", "add_hook", "remove_hook", "Profiler",
+           "enable_profiling", "disable_profiling", "get_profiler"]
+
+Hook = Callable[[str, float, dict[str, Any]], None]
+
+ACTIVE = False
+
+_hooks: tuple[Hook, ...] = ()
+_hooks_lock = threading.Lock()
+
+
+def add_hook(hook: Hook) -> None:
+    """
+    Register a callback called for every finished span.
+
+    Args:
+        hook (Callable[[str, float, dict[str, Any]], None]): callback taking
+            the span name, duration in seconds and attributes
+    """
+    global _hooks, ACTIVE  # pylint: disable=global-statement
+    with _hooks_lock:
+        _hooks = _hooks + (hook,)
+        ACTIVE = True
+
+
+def remove_hook(hook: Hook) -> None:
+    """
+    Unregister a span callback.
+
+    Args:
+        hook (Callable[[str, float, dict[str, Any]], None]): callback
+    """
+    global _hooks, ACTIVE  # pylint: disable=global-statement
+    with _hooks_lock:
+        _hooks = tuple(h for h in _hooks if h != hook)
+        ACTIVE = bool(_hooks)
+
+
+def record(name: str, seconds: float, **attrs: Any) -> None:
+    """
+    Report a span measured by the caller to the registered hooks.
+
+    Args:
+        name (str): span name
+        seconds (float): duration of the span
+    """
+    for hook in _hooks:
+        try:
+            hook(name, seconds, attrs)
+        except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
+            logging.error("Instrumentation hook failed: %s", e)
+
+
+class Span:
+    """
+    Context manager timing a block of code.
+    """
+    __slots__ = ("name", "attrs", "_start")
+
+    def __init__(self, name: str, attrs: dict[str, Any]) -> None:
+        self.name = name
+        self.attrs = attrs
+        self._start = 0.0
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Set an attribute of the span.
+        """
+        self.attrs[key] = value
+
+    def __enter__(self) -> "Span":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        record(self.name, time.perf_counter() - self._start, **self.attrs)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str, **attrs: Any) -> Span | _NullSpan:
+    """
+    Time a block of code.
+
+    Args:
+        name (str): span name
+
+    Returns:
+        Span: context manager, a no-op when no hook is registered
+    """
+    if not ACTIVE:
+        return _NULL_SPAN
+    return Span(name, attrs)
+
+
+class Profiler:
+    """
+    Hook aggregating span durations into per-span histograms with
+    power-of-two microsecond buckets.
+    """
+
+    BUCKETS = tuple(2.0 ** i / 1e6 for i in range(25))
+
+    def __init__(self) -> None:
+        self._stats: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, name: str, seconds: float,
+                 attrs: dict[str, Any]) -> None:
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = \
+                    [0, 0.0, math.inf, 0.0, [0] * (len(self.BUCKETS) + 1)]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = min(stats[2], seconds)
+            stats[3] = max(stats[3], seconds)
+            stats[4][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+
+    def _quantile(self, buckets: list[int], count: int, q: float) -> float:
+        target = q * count
+        cumulative = 0
+        for bound, n in zip(self.BUCKETS + (math.inf,), buckets):
+            cumulative += n
+            if cumulative >= target:
+                return bound
+        return math.inf
+
+    def report(self) -> dict[str, dict[str, float]]:
+        """
+        Get the aggregated span statistics.
+
+        Returns:
+            dict[str, dict[str, float]]: count, total, min, max, mean and
+            p50/p90/p99 upper bucket bounds in seconds, per span name
+        """
+        with self._lock:
+            return {
+                name: {
+                    "count": count,
+                    "total": total,
+                    "min": low,
+                    "max": high,
+                    "mean": total / count,
+                    "p50": self._quantile(buckets, count, 0.5),
+                    "p90": self._quantile(buckets, count, 0.9),
+                    "p99": self._quantile(buckets, count, 0.99),
+                }
+                for name, (count, total, low, high, buckets)
+                in self._stats.items()
+            }
+
+    def format(self) -> str:
+        """
+        Format the span statistics as a table.
+
+        Returns:
+            str: one line per span, durations in microseconds
+        """
+        lines = [f"{'span':<20}{'count':>10}{'mean':>12}{'p50':>12}"
+                 f"{'p99':>12}{'max':>12}"]
+        for name, s in sorted(self.report().items()):
+            lines.append(
+                f"{name:<20}{s['count']:>10}{s['mean'] * 1e6:>12.1f}"
+                f"{s['p50'] * 1e6:>12.1f}{s['p99'] * 1e6:>12.1f}"
+                f"{s['max'] * 1e6:>12.1f}")
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        """
+        Drop the aggregated statistics.
+        """
+        with self._lock:
+            self._stats.clear()
+
+
+_profiler: Profiler | None = None
+
+
+def enable_profiling() -> Profiler:
+    """
+    Start aggregating span durations.
+
+    Returns:
+        Profiler: the active profiler
+    """
+    global _profiler  # pylint: disable=global-statement
+    if _profiler is None:
+        _profiler = Profiler()
+        add_hook(_profiler)
+    return _profiler
+
+
+def disable_profiling() -> Profiler | None:
+    """
+    Stop aggregating span durations.
+
+    Returns:
+        Profiler | None: the profiler that was active
+    """
+    global _profiler  # pylint: disable=global-statement
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        remove_hook(profiler)
+    return profiler
+
+
+def get_profiler() -> Profiler | None:
+    """
+    Get the active profiler.
+
+    Returns:
+        Profiler | None: the profiler, None if profiling is disabled
+    """
+    return _profiler
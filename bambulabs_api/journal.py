@@ -0,0 +1,307 @@
+"""
+Journal of the MQTT reports received from printers, and replay.
+
+Each printer gets a directory of gzip compressed segments named after the
+time of their first record, rotated by age and size. Closed segments are
+listed with their time range in ``index.tsv``, so reading a time window only
+opens the segments overlapping it. Records are the raw payloads, or in delta
+mode only the report fields whose value changed.
+"""
+
+import gzip
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Iterator
+
+from bambulabs_api import codec
+
+__all__ = ["JournalReader", "JournalWriter", "Segment", "replay"]
+
+# timestamp, flags (1 when written in delta mode), payload length
+_HEADER = struct.Struct("<dBI")
+_FLAG_DELTA = 1
+_SUFFIX = ".jrnl.gz"
+_INDEX = "index.tsv"
+
+
+def _printer_dir(directory: str | os.PathLike, serial: str) -> str:
+    return os.path.join(os.fspath(directory), serial)
+
+
+@dataclass(frozen=True)
+class Segment:
+    """
+    Journal segment and its time range, ``end`` is None while it is written
+    """
+    path: str
+    start: float
+    end: float | None = None
+    count: int | None = None
+
+
+class JournalWriter:
+    """
+    Appends the reports of one printer to the journal.
+    """
+
+    def __init__(self, directory: str | os.PathLike, serial: str,
+                 delta: bool = False,
+                 segment_seconds: float = 3600.0,
+                 segment_bytes: int = 64 << 20,
+                 compresslevel: int = 6) -> None:
+        """
+        Args:
+            directory (str | os.PathLike): journal directory, shared by all
+                printers
+            serial (str): printer serial
+            delta (bool, optional): only store the changed report fields.
+                Defaults to False.
+            segment_seconds (float, optional): age after which a new segment
+                is started. Defaults to one hour.
+            segment_bytes (int, optional): uncompressed size after which a
+                new segment is started. Defaults to 64 MiB.
+            compresslevel (int, optional): gzip level. Defaults to 6.
+        """
+        if segment_seconds <= 0 or segment_bytes <= 0:
+            raise ValueError("Segment limits must be positive")
+        self.serial = serial
+        self.delta = delta
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        self.compresslevel = compresslevel
+        self.records = 0
+
+        self._dir = _printer_dir(directory, serial)
+        os.makedirs(self._dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file: gzip.GzipFile | None = None
+        self._segment: Segment | None = None
+        self._segment_size = 0
+        self._segment_count = 0
+        self._last_time = 0.0
+        self._state: dict[str, Any] = {}
+
+    def _open(self, timestamp: float) -> None:
+        name = f"{int(timestamp * 1000):013d}{_SUFFIX}"
+        path = os.path.join(self._dir, name)
+        self._file = gzip.open(path, "ab", compresslevel=self.compresslevel)
+        self._segment = Segment(path, timestamp)
+        self._segment_size = 0
+        self._segment_count = 0
+        # Deltas never span segments, so that each one replays on its own
+        self._state = {}
+
+    def _close_segment(self) -> None:
+        if self._file is None or self._segment is None:
+            return
+        self._file.close()
+        with open(os.path.join(self._dir, _INDEX), "a",
+                  encoding="utf-8") as index:
+            index.write(f"{os.path.basename(self._segment.path)}\t"
+                        f"{self._segment.start:.3f}\t{self._last_time:.3f}\t"
+                        f"{self._segment_count}\n")
+        self._file = None
+        self._segment = None
+
+    def _encode_delta(self, payload: bytes,
+                      doc: dict[str, Any] | None) -> bytes | None:
+        if doc is None:
+            try:
+                doc = codec.loads(payload)
+            except ValueError:
+                return payload
+        report = doc.get("print") if isinstance(doc, dict) else None
+        if not isinstance(report, dict):
+            return payload
+        state = self._state
+        changed = {k: v for k, v in report.items() if state.get(k) != v}
+        state.update(changed)
+        if not changed:
+            return None
+        return codec.dumps({**doc, "print": changed})
+
+    def append(self, payload: bytes, timestamp: float | None = None,
+               doc: dict[str, Any] | None = None) -> None:
+        """
+        Append a report payload.
+
+        Args:
+            payload (bytes): MQTT payload as received
+            timestamp (float | None, optional): reception time.
+                Defaults to now.
+            doc (dict[str, Any] | None, optional): the payload already
+                decoded, in full, to spare decoding it again in delta mode.
+                Defaults to None.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        with self._lock:
+            if self._segment is not None and (
+                    timestamp - self._segment.start >= self.segment_seconds
+                    or self._segment_size >= self.segment_bytes):
+                self._close_segment()
+            if self._file is None:
+                self._open(timestamp)
+
+            flags = 0
+            if self.delta:
+                delta = self._encode_delta(bytes(payload), doc)
+                if delta is None:
+                    return
+                payload, flags = delta, _FLAG_DELTA
+
+            record = _HEADER.pack(timestamp, flags, len(payload)) + payload
+            self._file.write(record)  # type: ignore
+            self._segment_size += len(record)
+            self._segment_count += 1
+            self._last_time = timestamp
+            self.records += 1
+
+    def flush(self) -> None:
+        """
+        Flush the current segment so that readers see every record.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.flush(zlib.Z_SYNC_FLUSH)
+
+    def close(self) -> None:
+        """
+        Close the current segment and record it in the index.
+        """
+        with self._lock:
+            self._close_segment()
+
+
+class JournalReader:
+    """
+    Reads the journal of one printer.
+    """
+
+    def __init__(self, directory: str | os.PathLike, serial: str) -> None:
+        """
+        Args:
+            directory (str | os.PathLike): journal directory
+            serial (str): printer serial
+        """
+        self.serial = serial
+        self._dir = _printer_dir(directory, serial)
+
+    def segments(self) -> list[Segment]:
+        """
+        Get the segments, oldest first.
+
+        Returns:
+            list[Segment]: segments, with their range once closed
+        """
+        if not os.path.isdir(self._dir):
+            return []
+        closed: dict[str, Segment] = {}
+        index = os.path.join(self._dir, _INDEX)
+        if os.path.exists(index):
+            with open(index, encoding="utf-8") as fp:
+                for line in fp:
+                    name, start, end, count = line.rstrip("\n").split("\t")
+                    closed[name] = Segment(os.path.join(self._dir, name),
+                                           float(start), float(end),
+                                           int(count))
+
+        segments = []
+        for name in sorted(os.listdir(self._dir)):
+            if not name.endswith(_SUFFIX):
+                continue
+            segments.append(closed.get(name) or Segment(
+                os.path.join(self._dir, name),
+                int(name[:-len(_SUFFIX)]) / 1000))
+        return segments
+
+    def records(self, since: float | None = None,
+                until: float | None = None
+                ) -> Iterator[tuple[float, bytes]]:
+        """
+        Iterate over the records of a time window, in order.
+
+        Args:
+            since (float | None, optional): first timestamp. Defaults to None.
+            until (float | None, optional): last timestamp. Defaults to None.
+
+        Yields:
+            tuple[float, bytes]: timestamp and payload
+        """
+        for segment in self.segments():
+            if until is not None and segment.start > until:
+                break
+            if since is not None and segment.end is not None \
+                    and segment.end < since:
+                continue
+            yield from self._read(segment.path, since, until)
+
+    @staticmethod
+    def _read(path: str, since: float | None,
+              until: float | None) -> Iterator[tuple[float, bytes]]:
+        with gzip.open(path, "rb") as fp:
+            while True:
+                try:
+                    header = fp.read(_HEADER.size)
+                    if len(header) < _HEADER.size:
+                        return
+                    timestamp, _, size = _HEADER.unpack(header)
+                    payload = fp.read(size)
+                except (EOFError, zlib.error):
+                    # Segment still being written or cut by a crash
+                    logging.debug("Journal segment %s ends early", path)
+                    return
+                if len(payload) < size:
+                    return
+                if until is not None and timestamp > until:
+                    return
+                if since is None or timestamp >= since:
+                    yield timestamp, payload
+
+
+class _Message:  # pylint: disable=too-few-public-methods
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic: str, payload: bytes) -> None:
+        self.topic = topic
+        self.payload = payload
+
+
+def replay(reader: JournalReader, client: Any, speed: float = 0.0,
+           since: float | None = None, until: float | None = None) -> int:
+    """
+    Feed journaled reports to a PrinterMQTTClient as if they were received.
+
+    Args:
+        reader (JournalReader): journal to replay
+        client (PrinterMQTTClient): client receiving the reports, it does
+            not need to be connected
+        speed (float, optional): replay speed relative to the recorded
+            time, 0 for as fast as possible. Defaults to 0.
+        since (float | None, optional): first timestamp. Defaults to None.
+        until (float | None, optional): last timestamp. Defaults to None.
+
+    Returns:
+        int: number of reports replayed
+    """
+    if speed < 0:
+        raise ValueError("Replay speed must be positive, or 0")
+    topic = f"device/{reader.serial}/report"
+    count = 0
+    first = start = 0.0
+    for timestamp, payload in reader.records(since, until):
+        if speed:
+            if not count:
+                first, start = timestamp, time.monotonic()
+            delay = (timestamp - first) / speed - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+        client._on_message(None, None,  # pylint: disable=protected-access
+                           _Message(topic, payload))
+        count += 1
+    return count
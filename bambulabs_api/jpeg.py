@@ -0,0 +1,100 @@
+"""
+JPEG header parsing, to validate camera frames without decoding them.
+
+Only the markers up to the start of frame (SOF) segment are read, which
+holds the image dimensions; these come within the first few hundred bytes
+of a frame.
+"""
+
+import struct
+from dataclasses import dataclass
+
+__all__ = ["JpegInfo", "parse_jpeg", "validate_jpeg"]
+
+SOI = b"\xff\xd8"
+EOI = b"\xff\xd9"
+
+# Start of frame markers, all but DHT (C4), JPG (C8) and DAC (CC)
+_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+_PROGRESSIVE = frozenset({0xC2, 0xC6, 0xCA, 0xCE})
+# Markers without a length
+_STANDALONE = frozenset(range(0xD0, 0xD8)) | {0x01}
+_SOS = 0xDA
+
+
+@dataclass(frozen=True)
+class JpegInfo:
+    """
+    Dimensions and encoding of a JPEG image
+    """
+    width: int
+    height: int
+    components: int
+    progressive: bool
+
+
+def parse_jpeg(data: bytes | bytearray | memoryview) -> JpegInfo:
+    """
+    Read the dimensions of a JPEG image from its SOF segment.
+
+    Args:
+        data (bytes | bytearray | memoryview): JPEG data, only the headers
+            are needed
+
+    Raises:
+        ValueError: if the data is not a JPEG or its headers are malformed
+
+    Returns:
+        JpegInfo: image dimensions
+    """
+    if data[:2] != SOI:
+        raise ValueError("Missing JPEG start of image marker")
+    pos = 2
+    end = len(data)
+    while pos + 4 <= end:
+        if data[pos] != 0xFF:
+            raise ValueError(f"Expected a JPEG marker at {pos}")
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+            continue
+        if marker in _STANDALONE:
+            pos += 2
+            continue
+        if marker == _SOS or marker == EOI[1]:
+            raise ValueError("JPEG scan data before the start of frame")
+        length = struct.unpack_from(">H", data, pos + 2)[0]
+        if length < 2:
+            raise ValueError(f"Invalid JPEG segment length at {pos}")
+        if marker in _SOF:
+            if pos + 10 > end or length < 8:
+                raise ValueError("Truncated JPEG start of frame")
+            height, width, components = struct.unpack_from(">HHB", data,
+                                                           pos + 5)
+            if not width or not height or components not in (1, 3, 4):
+                raise ValueError(f"Invalid JPEG frame {width}x{height} "
+                                 f"with {components} components")
+            return JpegInfo(width, height, components,
+                            marker in _PROGRESSIVE)
+        pos += 2 + length
+    raise ValueError("No JPEG start of frame")
+
+
+def validate_jpeg(data: bytes | bytearray | memoryview) -> JpegInfo:
+    """
+    Check that data holds a whole JPEG image: start and end markers and a
+    valid start of frame.
+
+    Args:
+        data (bytes | bytearray | memoryview): JPEG data
+
+    Raises:
+        ValueError: if the image is not a whole JPEG
+
+    Returns:
+        JpegInfo: image dimensions
+    """
+    if data[-2:] != EOI:
+        raise ValueError("Missing JPEG end of image marker")
+    return parse_jpeg(data)
@@ -0,0 +1,420 @@
+"""
+Prometheus/OpenMetrics style metrics for printers and client internals.
+
+Metrics are disabled by default. Client internals are fed from the
+instrumentation spans, which are no-ops until :func:`enable_metrics`
+registers the registry as a span hook. Printer telemetry is not recorded on
+the hot path, it is read from the tracked MQTT clients when the registry is
+rendered.
+"""
+
+import abc
+import bisect
+import math
+import threading
+import time
+import weakref
+from typing import TYPE_CHECKING, Any, Callable, Iterable
+
+from bambulabs_api import instrumentation
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+__all__ = ["MetricsRegistry", "REGISTRY", "enable_metrics",
+           "disable_metrics", "track_client"]
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05,
+                   0.1, 0.5, 1.0, 5.0)
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n") \
+        .replace('"', '\\"')
+
+
+def _format_labels(names: Labels, values: Labels,
+                   extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Labels = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[Labels, Any] = {}
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _samples(self) -> Iterable[str]:
+        """
+        Sample lines of the metric, called with the lock held
+        """
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """
+    Monotonically increasing value per label set.
+    """
+    kind = "counter"
+
+    def inc(self, labels: Labels = (), amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def _samples(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield (f"{self.name}"
+                   f"{_format_labels(self.labelnames, labels)} "
+                   f"{_format_value(value)}")
+
+
+class Gauge(Counter):
+    """
+    Value per label set that can go up and down.
+    """
+    kind = "gauge"
+
+    def set(self, labels: Labels, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """
+    Cumulative histogram of observations per label set.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str,
+                 labelnames: Labels = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, labels: Labels, value: float) -> None:
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = \
+                    [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def _samples(self) -> Iterable[str]:
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield (f"{self.name}_bucket"
+                       f"{_format_labels(self.labelnames, labels, le)} "
+                       f"{cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_str} {_format_value(total)}"
+            yield f"{self.name}_count{label_str} {cumulative}"
+
+
+_clients: "weakref.WeakSet[Any]" = weakref.WeakSet()
+
+
+def track_client(client: Any) -> None:
+    """
+    Track an MQTT client so its printer state is exported at scrape time.
+    Clients are held by weak reference.
+
+    Args:
+        client (PrinterMQTTClient): the client to track
+    """
+    _clients.add(client)
+
+
+class MetricsRegistry:
+    """
+    Registry holding the client metrics and rendering them in the
+    Prometheus text exposition format.
+    """
+
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+        self._collectors: list[Callable[[], Iterable[_Metric]]] = []
+
+        self.mqtt_messages = self.register(Counter(
+            "bambulabs_mqtt_messages_total",
+            "MQTT report messages received.", ("serial",)))
+        self.mqtt_bytes = self.register(Counter(
+            "bambulabs_mqtt_received_bytes_total",
+            "MQTT report payload bytes received.", ("serial",)))
+        self.mqtt_decode_seconds = self.register(Histogram(
+            "bambulabs_mqtt_decode_seconds",
+            "Time spent decoding MQTT report payloads."))
+        self.mqtt_commands = self.register(Counter(
+            "bambulabs_mqtt_commands_total",
+            "Commands published to printers.", ("serial", "result")))
+        self.mqtt_publish_seconds = self.register(Histogram(
+            "bambulabs_mqtt_publish_seconds",
+            "Time from publishing a command until it is sent."))
+        self.camera_frames = self.register(Counter(
+            "bambulabs_camera_frames_total",
+            "Camera frames received.", ("host",)))
+        self.camera_fps = self.register(Gauge(
+            "bambulabs_camera_fps",
+            "Smoothed camera frame rate.", ("host",)))
+        self.camera_discarded = self.register(Counter(
+            "bambulabs_camera_frames_discarded_total",
+            "Camera frames discarded, dropped for their size or corrupt.",
+            ("host", "reason")))
+        self.camera_reconnects = self.register(Counter(
+            "bambulabs_camera_reconnects_total",
+            "Camera connection attempts after the first.", ("host",)))
+        self.ftp_bytes = self.register(Counter(
+            "bambulabs_ftp_transferred_bytes_total",
+            "Bytes transferred over FTP.", ("host",)))
+        self.ftp_seconds = self.register(Counter(
+            "bambulabs_ftp_transfer_seconds_total",
+            "Time spent in FTP transfers.", ("host",)))
+        self.ftp_throughput = self.register(Gauge(
+            "bambulabs_ftp_last_throughput_bytes_per_second",
+            "Throughput of the last FTP transfer.", ("host",)))
+
+        self._last_frame: dict[str, float] = {}
+        self.add_collector(_collect_printers)
+
+    def register(self, metric: _Metric) -> Any:
+        """
+        Register a metric to be rendered.
+
+        Args:
+            metric (Counter | Gauge | Histogram): the metric
+
+        Returns:
+            Counter | Gauge | Histogram: the metric
+        """
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self,
+                      collector: Callable[[], Iterable[_Metric]]) -> None:
+        """
+        Register a callback creating metrics at scrape time.
+
+        Args:
+            collector (Callable[[], Iterable[_Metric]]): metrics factory
+        """
+        self._collectors.append(collector)
+
+    def on_span(self, name: str, seconds: float,
+                attrs: dict[str, Any]) -> None:
+        """
+        Instrumentation hook updating the client metrics from spans.
+
+        Args:
+            name (str): span name
+            seconds (float): span duration
+            attrs (dict[str, Any]): span attributes
+        """
+        if name == "mqtt.decode":
+            serial = (attrs.get("serial", ""),)
+            self.mqtt_decode_seconds.observe((), seconds)
+            self.mqtt_messages.inc(serial)
+            self.mqtt_bytes.inc(serial, attrs.get("bytes", 0))
+        elif name == "mqtt.publish":
+            self.mqtt_publish_seconds.observe((), seconds)
+            self.mqtt_commands.inc((attrs.get("serial", ""),
+                                    attrs.get("result", "error")))
+        elif name == "camera.frame":
+            self.observe_frame(attrs.get("host", ""))
+        elif name in ("camera.dropped", "camera.corrupt"):
+            self.camera_discarded.inc((attrs.get("host", ""), name[7:]))
+        elif name == "camera.reconnect":
+            self.camera_reconnects.inc((attrs.get("host", ""),))
+        elif name == "ftp.transfer":
+            self.observe_transfer(attrs.get("host", ""),
+                                  attrs.get("bytes", 0), seconds)
+
+    def observe_frame(self, host: str) -> None:
+        """
+        Record a camera frame and update the smoothed frame rate.
+
+        Args:
+            host (str): camera host
+        """
+        now = time.monotonic()
+        self.camera_frames.inc((host,))
+        last = self._last_frame.get(host)
+        self._last_frame[host] = now
+        if last is not None and now > last:
+            fps = 1.0 / (now - last)
+            previous = self.camera_fps._values.get((host,), fps)
+            self.camera_fps.set((host,), 0.8 * previous + 0.2 * fps)
+
+    def observe_transfer(self, host: str, nbytes: int,
+                         seconds: float) -> None:
+        """
+        Record an FTP transfer.
+
+        Args:
+            host (str): FTP host
+            nbytes (int): bytes transferred
+            seconds (float): duration of the transfer
+        """
+        self.ftp_bytes.inc((host,), nbytes)
+        self.ftp_seconds.inc((host,), seconds)
+        if seconds > 0:
+            self.ftp_throughput.set((host,), nbytes / seconds)
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: the exposition text
+        """
+        metrics = list(self._metrics)
+        for collector in self._collectors:
+            metrics.extend(collector())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+    def serve(self, port: int = 9100,
+              addr: str = "") -> "ThreadingHTTPServer":
+        """
+        Serve the metrics over HTTP from a daemon thread.
+
+        Args:
+            port (int, optional): port to listen on. Defaults to 9100.
+            addr (str, optional): address to bind. Defaults to all.
+
+        Returns:
+            ThreadingHTTPServer: the server, call shutdown() to stop it
+        """
+        from http.server import (  # pylint: disable=import-outside-toplevel
+            BaseHTTPRequestHandler, ThreadingHTTPServer)
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa  # pylint: disable=invalid-name
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # noqa  # pylint: disable=redefined-builtin
+                pass
+
+        server = ThreadingHTTPServer((addr, port), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
+
+
+def _collect_printers() -> Iterable[_Metric]:
+    gauges = {
+        key: Gauge(name, documentation, ("serial",))
+        for key, name, documentation in (
+            ("bed_temper", "bambulabs_printer_bed_temperature_celsius",
+             "Bed temperature."),
+            ("nozzle_temper", "bambulabs_printer_nozzle_temperature_celsius",
+             "Nozzle temperature."),
+            ("mc_percent", "bambulabs_printer_progress_percent",
+             "Print progress."),
+            ("layer_num", "bambulabs_printer_layer",
+             "Current layer."),
+        )
+    }
+    state = Gauge("bambulabs_printer_state",
+                  "Printer gcode state, 1 for the current state.",
+                  ("serial", "state"))
+    humidity = Gauge("bambulabs_ams_humidity",
+                     "AMS humidity level.", ("serial", "ams"))
+    queue_depth = Gauge("bambulabs_command_queue_depth",
+                        "Commands waiting in the rate limited queue.",
+                        ("serial",))
+    coalesced = Counter("bambulabs_commands_coalesced_total",
+                        "Queued commands replaced by a newer value.",
+                        ("serial",))
+    dropped = Counter("bambulabs_commands_dropped_total",
+                      "Commands dropped because the queue was full.",
+                      ("serial",))
+
+    for client in list(_clients):
+        data: dict[str, Any] = client._data  # pylint: disable=protected-access  # noqa
+        serial = (client._printer_serial,)  # pylint: disable=protected-access  # noqa
+        for key, gauge in gauges.items():
+            try:
+                gauge.set(serial, float(data[key]))
+            except (KeyError, TypeError, ValueError):
+                pass
+        if "gcode_state" in data:
+            state.set(serial + (str(data["gcode_state"]),), 1.0)
+        for unit in (data.get("ams") or {}).get("ams", []):
+            try:
+                humidity.set(serial + (str(unit.get("id")),),
+                             float(unit["humidity"]))
+            except (KeyError, TypeError, ValueError):
+                pass
+        commands = client.commands
+        if commands is not None:
+            queue_depth.set(serial, commands.depth)
+            coalesced.inc(serial, commands.coalesced)
+            dropped.inc(serial, commands.dropped)
+
+    return [*gauges.values(), state, humidity, queue_depth, coalesced,
+            dropped]
+
+
+REGISTRY: MetricsRegistry | None = None
+
+
+def enable_metrics(registry: MetricsRegistry | None = None
+                   ) -> MetricsRegistry:
+    """
+    Enable metrics collection for all clients.
+
+    Args:
+        registry (MetricsRegistry | None, optional): registry to record
+            into. Defaults to a new registry.
+
+    Returns:
+        MetricsRegistry: the active registry
+    """
+    global REGISTRY  # pylint: disable=global-statement
+    disable_metrics()
+    REGISTRY = registry or MetricsRegistry()
+    instrumentation.add_hook(REGISTRY.on_span)
+    return REGISTRY
+
+
+def disable_metrics() -> None:
+    """
+    Disable metrics collection.
+    """
+    global REGISTRY  # pylint: disable=global-statement
+    if REGISTRY is not None:
+        instrumentation.remove_hook(REGISTRY.on_span)
+    REGISTRY = None
@@ -1,18 +1,30 @@
-import json
+import contextvars
 import logging
-import ssl
 import datetime
-from typing import Any
+import time
+from typing import Any, Callable, Iterable
 
 import paho.mqtt.client as mqtt
 from paho.mqtt.enums import CallbackAPIVersion
 
+from bambulabs_api import codec, instrumentation, metrics
 from bambulabs_api.ams import AMS
+from bambulabs_api.command_queue import CommandQueue
+from bambulabs_api.connection import ConnectionSupervisor
+from bambulabs_api.journal import JournalWriter
 from bambulabs_api.printer_info import NozzleType
+from bambulabs_api.refresh import RefreshScheduler
+from bambulabs_api.telemetry import DEFAULT_FIELDS, TelemetryBuffer
+from bambulabs_api.tls import TLSConfig, get_default_config
 
 from .filament_info import Filament, FilamentTray
 from .states_info import GcodeState, PrintStatus
 
+# time.monotonic() deadline of the commands published from the current
+# context, set by Fleet.broadcast so that its timeout bounds the wait
+publish_deadline: contextvars.ContextVar[float | None] = \
+    contextvars.ContextVar("publish_deadline", default=None)
+
 
 class PrinterMQTTClient:
     """
@@ -20,7 +32,10 @@ class PrinterMQTTClient:
     """
 
     def __init__(self, hostname: str, access: str, printer_serial: str,
-                 username: str = "bblp", port: int = 8883, timeout: int = 60):
+                 username: str = "bblp", port: int = 8883, timeout: int = 60,
+                 fields: Iterable[str] | None = None,
+                 supervisor: ConnectionSupervisor | None = None,
+                 tls: TLSConfig | None = None):
         self._hostname = hostname
         self._access = access
         self._username = username
@@ -31,31 +46,268 @@ class PrinterMQTTClient:
 
         self._client: mqtt.Client = mqtt.Client(CallbackAPIVersion.VERSION2)
         self._client.username_pw_set(username, access)
-        self._client.tls_set(tls_version=ssl.PROTOCOL_TLS,
-                             cert_reqs=ssl.CERT_NONE)
-        self._client.tls_insecure_set(True)
+        self.tls = tls or get_default_config()
+        self._client.tls_set_context(self.tls.context)
 
         self._client.on_connect = self._on_connect
+        self._client.on_connect_fail = self._on_connect_fail
+        self._client.on_disconnect = self._on_disconnect
         self._client.on_message = self._on_message
 
+        self.supervisor = supervisor or ConnectionSupervisor(printer_serial)
+
         self.printer_timeout: int = 10
+        # Seconds to wait for a command to be sent
+        self.publish_timeout: float = 10.0
         self._last_update: int = int(datetime.datetime.now().timestamp())
 
         self.command_topic = f"device/{printer_serial}/request"
-        logging.info(f"{self.command_topic}")   # noqa  # pylint: disable=logging-fstring-interpolation
+        logging.info("%s", self.command_topic)
         self._data: dict = {}
 
         self._ams: dict[int, AMS] = {}
 
+        # Time of the last report, and whether the state was restored from
+        # a snapshot and not confirmed by a report since
+        self.last_report: float = 0.0
+        self.stale = False
+        # Set when a RefreshScheduler coordinates the pushall requests
+        self.refresher: RefreshScheduler | None = None
+        # time.monotonic() of the pushall sent for a restored state
+        self._stale_refresh: float | None = None
+
+        self.decoder = codec.ReportDecoder(fields)
+
+        self._report_listeners: list[Callable[[dict[str, Any]], None]] = []
+        self.telemetry: TelemetryBuffer | None = None
+        self.journal: JournalWriter | None = None
+        self.commands: CommandQueue | None = None
+
+        metrics.track_client(self)
+
     def _on_message(self, client, userdata, msg) -> None:  # pylint: disable=unused-argument  # noqa
-        # Current date and time
-        doc = json.loads(msg.payload)
+        doc = None
+        try:
+            with instrumentation.span("mqtt.decode",
+                                      serial=self._printer_serial,
+                                      bytes=len(msg.payload)):
+                doc = self.decoder.decode(msg.payload)
+        finally:
+            # Undecodable payloads are journaled too
+            if self.journal is not None:
+                self._append_journal(msg.payload, doc)
 
         if "print" in doc:
-            self._data |= doc["print"]
-            logging.debug(self._data)
+            report = doc["print"]
+            with instrumentation.span("mqtt.merge",
+                                      serial=self._printer_serial):
+                self._data |= report
+            self.last_report = time.time()
+            self.stale = False
+            logging.debug("Report from %s: %s", self._printer_serial, report)
+
+            # Listener lists are replaced, never mutated, so adding or
+            # removing a listener from a callback is safe
+            for listener in self._report_listeners:
+                try:
+                    listener(report)
+                except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
+                    logging.error("Report listener failed: %s", e)
+
+    def _append_journal(self, payload: bytes,
+                        doc: dict[str, Any] | None) -> None:
+        journal = self.journal
+        if journal is None:
+            return
+        # Documents filtered by the report fields are not the full payload
+        full = doc if self.decoder.fields is None else None
+        try:
+            journal.append(payload, doc=full)
+        except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
+            logging.error("Journal of %s failed, journaling disabled: %s",
+                          self._printer_serial, e)
+            self.journal = None
+            try:
+                journal.close()
+            except Exception:  # noqa  # pylint: disable=broad-exception-caught
+                pass
+
+    @property
+    def serial(self) -> str:
+        """
+        Serial of the printer
+        """
+        return self._printer_serial
+
+    @property
+    def report_fields(self) -> frozenset[str] | None:
+        """
+        Report fields kept at ingest, None when every field is kept
+        """
+        return self.decoder.fields
+
+    def set_report_fields(self, fields: Iterable[str] | None) -> None:
+        """
+        Only keep the given fields of the reports, the others are dropped
+        while decoding and never merged into the printer state. Fields
+        already stored that are not in the list are removed.
+
+        Getters of dropped fields return their default value, include
+        "ams" or "vt_tray" to keep the AMS and external spool data.
+
+        Args:
+            fields (Iterable[str] | None): report fields to keep, None to
+                keep every field
+        """
+        self.decoder = codec.ReportDecoder(fields)
+        if self.decoder.fields is not None:
+            self._data = {k: v for k, v in self._data.items()
+                          if k in self.decoder.fields}
+
+    def state_snapshot(self) -> tuple[dict[str, Any], float]:
+        """
+        Get a copy of the printer state, to restore it later.
+
+        Returns:
+            tuple[dict[str, Any], float]: merged report fields and the time
+                of the last report
+        """
+        return dict(self._data), self.last_report
+
+    def restore_state(self, data: dict[str, Any], last_report: float) -> bool:
+        """
+        Restore a state saved with state_snapshot, for example after a
+        restart. The state is marked stale until the next report, and is
+        ignored if a newer report was already received.
+
+        Args:
+            data (dict[str, Any]): report fields
+            last_report (float): time of the last report in the state
+
+        Returns:
+            bool: True if the state was restored
+        """
+        if self.last_report >= last_report:
+            return False
+        if self.decoder.fields is not None:
+            data = {k: v for k, v in data.items() if k in self.decoder.fields}
+        self._data = dict(data)
+        self.last_report = last_report
+        self.stale = True
+        self._stale_refresh = None
+        return True
+
+    def add_report_listener(
+            self, listener: Callable[[dict[str, Any]], None]) -> None:
+        """
+        Register a callback called with the "print" section of every report,
+        after it has been merged into the printer state.
+
+        Listeners run on the MQTT network thread and should return quickly.
+
+        Args:
+            listener (Callable[[dict[str, Any]], None]): report callback
+        """
+        self._report_listeners = [*self._report_listeners, listener]
+
+    def remove_report_listener(
+            self, listener: Callable[[dict[str, Any]], None]) -> None:
+        """
+        Unregister a report callback added with add_report_listener.
+
+        Args:
+            listener (Callable[[dict[str, Any]], None]): report callback
+        """
+        listeners = list(self._report_listeners)
+        listeners.remove(listener)
+        self._report_listeners = listeners
+
+    def enable_telemetry(self, fields: Iterable[str] = DEFAULT_FIELDS,
+                         capacity: int = 3600) -> TelemetryBuffer:
+        """
+        Start recording numeric report fields into a fixed-size time series
+        buffer. Calling it again replaces the previous buffer.
+
+        Args:
+            fields (Iterable[str], optional): report fields to record.
+                Defaults to temperatures, progress, layer, speed and fans.
+            capacity (int, optional): number of samples kept.
+                Defaults to 3600.
+
+        Returns:
+            TelemetryBuffer: the telemetry buffer
+        """
+        self.disable_telemetry()
+        self.telemetry = TelemetryBuffer(fields, capacity)
+        self.add_report_listener(self.telemetry.record)
+        return self.telemetry
 
-    def _on_connect(self, client: mqtt.Client, serial, userdata, flags, rc) -> None:  # pylint: disable=unused-argument  # noqa
+    def disable_telemetry(self) -> None:
+        """
+        Stop recording telemetry and drop the buffer
+        """
+        if self.telemetry is not None:
+            self.remove_report_listener(self.telemetry.record)
+            self.telemetry = None
+
+    def enable_journal(self, directory: str, **options: Any
+                       ) -> JournalWriter:
+        """
+        Start journaling the received payloads, see JournalWriter for the
+        options. Calling it again replaces the previous journal.
+
+        Args:
+            directory (str): journal directory, shared by all printers
+
+        Returns:
+            JournalWriter: the journal writer
+        """
+        self.disable_journal()
+        self.journal = JournalWriter(directory, self._printer_serial,
+                                     **options)
+        return self.journal
+
+    def disable_journal(self) -> None:
+        """
+        Stop journaling and close the current journal segment
+        """
+        journal, self.journal = self.journal, None
+        if journal is not None:
+            journal.close()
+
+    def enable_command_queue(self, rate: float = 2.0, burst: int = 5,
+                             max_depth: int = 64) -> CommandQueue:
+        """
+        Rate limit the commands sent to the printer, see CommandQueue.
+        Commands beyond the rate are queued and the commands return True
+        once queued. Temperature, speed, light, bed height and pushall
+        requests waiting in the queue are replaced by newer calls. Calling
+        it again replaces the previous queue.
+
+        Args:
+            rate (float, optional): commands per second. Defaults to 2.
+            burst (int, optional): commands sent at once after an idle
+                period. Defaults to 5.
+            max_depth (int, optional): queued commands beyond which new
+                commands are dropped. Defaults to 64.
+
+        Returns:
+            CommandQueue: the command queue
+        """
+        self.disable_command_queue()
+        self.commands = CommandQueue(self.__send_command, rate, burst,
+                                     max_depth, name=self._printer_serial)
+        return self.commands
+
+    def disable_command_queue(self) -> None:
+        """
+        Send the commands directly again, queued commands are dropped
+        """
+        commands, self.commands = self.commands, None
+        if commands is not None:
+            commands.close()
+
+    def _on_connect(self, client: mqtt.Client, userdata, flags, rc, properties=None) -> None:  # pylint: disable=unused-argument  # noqa
         """
         _on_connect Callback function for when the client
         receives a CONNACK response from the server.
@@ -68,19 +320,39 @@ class PrinterMQTTClient:
             User data
         flags : Arraylike
             Response flags sent by the broker
-        rc : int
+        rc : ReasonCode
             The connection result
+        properties : Properties
+            The MQTT v5 properties of the CONNACK
         """
         if rc == 0:
-            print("Connected successfully")
+            self.supervisor.connected("mqtt")
             client.subscribe(f"device/{self._printer_serial}/report")
         else:
-            print(f"Connection failed with result code {rc}")
+            # paho closes the connection next and calls _on_disconnect
+            logging.error("MQTT connection to %s refused: %s",
+                          self._hostname, rc)
+
+    def _on_disconnect(self, client: mqtt.Client, userdata, flags, rc, properties=None) -> None:  # pylint: disable=unused-argument  # noqa
+        if rc == 0:
+            # Disconnection requested by stop()
+            return
+        self._schedule_reconnect(rc)
+
+    def _on_connect_fail(self, client: mqtt.Client, userdata) -> None:  # pylint: disable=unused-argument  # noqa
+        self._schedule_reconnect("connection failed")
+
+    def _schedule_reconnect(self, reason: Any) -> None:
+        # paho waits min_delay before its next attempt, replace its
+        # deterministic doubling with the jittered supervisor delay.
+        delay = self.supervisor.disconnected("mqtt", reason)
+        self._client.reconnect_delay_set(delay, delay)  # type: ignore
 
     def connect(self) -> None:
         """
         Connects to the MQTT server asynchronously
         """
+        self.supervisor.connecting("mqtt")
         self._client.connect_async(self._hostname, self._port, self._timeout)
 
     def start(self):
@@ -99,16 +371,43 @@ class PrinterMQTTClient:
         """
         Stops the MQTT client
         """
+        # Disconnect first so that the socket is closed, and its TLS session
+        # kept for the next connection, instead of left to the GC
+        self._client.disconnect()
         self._client.loop_stop()
+        self.supervisor.closed("mqtt")
 
     def __get(self, key: str, default: Any = None) -> Any:
         self.manual_update()
         return self._data.get(key, default)
 
     def manual_update(self) -> bool:
+        if self.refresher is not None:
+            return self.refresher.request(self._printer_serial)
         if self._last_update + self.printer_timeout < int(datetime.datetime.now().timestamp()):  # noqa
             return False
-        return self.__publish_command({"pushing": {"command": "pushall"}})
+        if self.stale:
+            # One refresh of a restored state at a time, until the printer
+            # reports or printer_timeout passes without a report
+            now = time.monotonic()
+            if self._stale_refresh is not None and \
+                    now - self._stale_refresh < self.printer_timeout:
+                return False
+            published = self.pushall()
+            if published:
+                self._stale_refresh = now
+            return published
+        return self.pushall()
+
+    def pushall(self) -> bool:
+        """
+        Ask the printer for a full report
+
+        Returns:
+            bool: if the request was published
+        """
+        return self.__publish_command({"pushing": {"command": "pushall"}},
+                                      coalesce="pushall")
 
     def get_last_print_percentage(self) -> int | str | None:
         """
@@ -155,7 +454,22 @@ class PrinterMQTTClient:
         """
         return int(self.__get("spd_mag", 100))
 
-    def __publish_command(self, payload: dict[Any, Any]) -> bool:
+    def __publish_command(self, payload: dict[Any, Any],
+                          coalesce: str | None = None) -> bool:
+        """
+        Send a command, through the command queue when enabled
+
+        Args:
+            payload (dict[Any, Any]): command to send to the printer
+            coalesce (str | None, optional): key of idempotent commands,
+                a queued command with the same key is replaced
+        """
+        commands = self.commands
+        if commands is not None:
+            return commands.submit(payload, coalesce)
+        return self.__send_command(payload)
+
+    def __send_command(self, payload: dict[Any, Any]) -> bool:
         """
         Generate a command payload and publish it to the MQTT server
 
@@ -166,22 +480,33 @@ class PrinterMQTTClient:
             logging.error("Not connected to the MQTT server")
             return False
 
-        command = self._client.publish(self.command_topic, json.dumps(payload))
-        logging.info(f"Published command: {payload}")   # noqa  # pylint: disable=logging-fstring-interpolation
-        command.wait_for_publish()
-        return command.is_published()
+        with instrumentation.span("mqtt.publish",
+                                  serial=self._printer_serial) as span:
+            command = self._client.publish(self.command_topic,
+                                           codec.dumps(payload))
+            logging.info("Published command: %s", payload)
+            timeout = self.publish_timeout
+            deadline = publish_deadline.get()
+            if deadline is not None:
+                timeout = min(timeout, max(deadline - time.monotonic(), 0))
+            command.wait_for_publish(timeout)
+            published = command.is_published()
+            span.set("result", "ok" if published else "error")
+        return published
 
     def turn_light_off(self) -> bool:
         """
         Turn off the printer light
         """
-        return self.__publish_command({"system": {"led_mode": "off"}})
+        return self.__publish_command({"system": {"led_mode": "off"}},
+                                      coalesce="light")
 
     def turn_light_on(self) -> bool:
         """
         Turn on the printer light
         """
-        return self.__publish_command({"system": {"led_mode": "on"}})
+        return self.__publish_command({"system": {"led_mode": "on"}},
+                                      coalesce="light")
 
     def get_light_state(self) -> str:
         """
@@ -309,15 +634,18 @@ class PrinterMQTTClient:
             return True
         return self.__publish_command({"print": {"command": "resume"}})
 
-    def __send_gcode_line(self, gcode_command: str) -> bool:
+    def __send_gcode_line(self, gcode_command: str,
+                          coalesce: str | None = None) -> bool:
         """
         Send a G-code line command to the printer
 
         Args:
             gcode_command (str): G-code command to send to the printer
+            coalesce (str | None, optional): key of idempotent commands
         """
         return self.__publish_command({"print": {"command": "gcode_line",
-                                                 "param": f"{gcode_command}"}})
+                                                 "param": f"{gcode_command}"}},
+                                      coalesce=coalesce)
 
     def set_bed_temperature(self, temperature: int) -> bool:
         """
@@ -329,7 +657,8 @@ class PrinterMQTTClient:
         Returns:
             bool: success of setting the bed temperature
         """
-        return self.__send_gcode_line(f"M140 S{temperature}\n")
+        return self.__send_gcode_line(f"M140 S{temperature}\n",
+                                      coalesce="bed_temperature")
 
     def set_bed_height(self, height: int) -> bool:
         """
@@ -342,7 +671,8 @@ class PrinterMQTTClient:
         Returns:
             bool: success of the bed height setting
         """  # noqa
-        return self.__send_gcode_line(f"G90\nG0 Z{height}\n")
+        return self.__send_gcode_line(f"G90\nG0 Z{height}\n",
+                                      coalesce="bed_height")
 
     def auto_home(self) -> bool:
         """
@@ -364,8 +694,8 @@ class PrinterMQTTClient:
             bool: success of setting the print speed
         """  # noqa
         return self.__publish_command(
-            {"print": {"command": "print_speed", "param": f"{speed_lvl}"}}
-        )
+            {"print": {"command": "print_speed", "param": f"{speed_lvl}"}},
+            coalesce="print_speed")
 
     def set_nozzle_temperature(self, temperature: int) -> bool:
         """
@@ -377,7 +707,8 @@ class PrinterMQTTClient:
         Returns:
             bool: success of setting the nozzle temperature
         """
-        return self.__send_gcode_line(f"M104 S{temperature}\n")
+        return self.__send_gcode_line(f"M104 S{temperature}\n",
+                                      coalesce="nozzle_temperature")
 
     def set_printer_filament(self, filament_material: Filament, colour: str) -> bool:  # noqa
         """
@@ -592,8 +923,32 @@ class PrinterMQTTClient:
             if trays:
                 for tray_id, tray in enumerate(trays):
                     tray_id = int(tray.get("id", tray_id))
+                    if not FilamentTray.keys() <= tray.keys():
+                        continue  # empty tray slot
                     ams.set_filament_tray(
                         tray_index=tray_id,
                         filament_tray=FilamentTray.from_dict(tray))
 
             self._ams[id] = ams
+
+    def get_ams(self) -> dict[int, AMS]:
+        """
+        Get the AMS units and their loaded filament trays
+
+        Returns:
+            dict[int, AMS]: AMS units keyed by AMS id
+        """
+        self.ams_filament()
+        return self._ams
+
+    def get_external_spool(self) -> FilamentTray | None:
+        """
+        Get the filament loaded on the external spool holder
+
+        Returns:
+            FilamentTray | None: external spool filament, None if unknown
+        """
+        tray: dict[str, Any] = self.__get("vt_tray", {})
+        if not tray or not FilamentTray.keys() <= tray.keys():
+            return None
+        return FilamentTray.from_dict(tray)
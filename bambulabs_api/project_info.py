@@ -0,0 +1,449 @@
+"""
+Read slicer metadata from 3MF project files.
+
+A 3MF project is a zip archive. Only the small metadata members under
+``Metadata/`` are read, the plate gcode and meshes are never extracted.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import BinaryIO
+
+from bambulabs_api.ams import AMS
+
+__all__ = ["ProjectFilament", "ProjectObject", "ProjectPlate", "ProjectInfo",
+           "read_project_info", "compute_ams_mapping", "set_cache_limit"]
+
+SLICE_INFO = "Metadata/slice_info.config"
+PLATE_JSON = "Metadata/plate_{}.json"
+EXTERNAL_SPOOL_ID = 254
+
+_HASH_CHUNK_SIZE = 1 << 20
+
+
+@dataclass(frozen=True)
+class ProjectFilament:
+    """
+    Dataclass for a filament required by a plate
+
+    Attributes
+    ----------
+
+    id: The 1-based project filament id (slot in the slicer).
+    type: The filament type, e.g. "PLA".
+    color: The filament color as a "RRGGBB" hex string.
+    tray_info_idx: The filament preset index, e.g. "GFA00".
+    used_m: The filament length used in metres.
+    used_g: The filament weight used in grams.
+    """
+    id: int
+    type: str
+    color: str
+    tray_info_idx: str = ""
+    used_m: float = 0.0
+    used_g: float = 0.0
+
+
+@dataclass(frozen=True)
+class ProjectObject:
+    """
+    Dataclass for a printable object on a plate
+
+    Attributes
+    ----------
+
+    identify_id: The object id used by skip_objects.
+    name: The object name shown in the slicer.
+    skipped: Whether the object was already skipped when slicing.
+    """
+    identify_id: int
+    name: str
+    skipped: bool = False
+
+
+@dataclass(frozen=True)
+class ProjectPlate:
+    """
+    Dataclass for a sliced plate of a 3MF project
+
+    Attributes
+    ----------
+
+    index: The 1-based plate number.
+    filaments: The filaments used by the plate.
+    objects: The objects on the plate.
+    prediction: The estimated print time in seconds.
+    weight: The estimated filament weight in grams.
+    """
+    index: int
+    filaments: tuple[ProjectFilament, ...] = ()
+    objects: tuple[ProjectObject, ...] = ()
+    prediction: int = 0
+    weight: float = 0.0
+
+    def find_objects(self, names: list[str]) -> list[int]:
+        """
+        Get the ids of the objects with the given names.
+
+        Args:
+            names (list[str]): object names
+
+        Raises:
+            ValueError: if a name does not match any object
+
+        Returns:
+            list[int]: the matching object ids, to pass to skip_objects
+        """
+        ids = {}
+        for obj in self.objects:
+            ids.setdefault(obj.name, []).append(obj.identify_id)
+
+        missing = [name for name in names if name not in ids]
+        if missing:
+            raise ValueError(
+                f"Objects not found on plate {self.index}: {missing}")
+        return [i for name in names for i in ids[name]]
+
+
+@dataclass(frozen=True)
+class ProjectInfo:
+    """
+    Dataclass for the metadata of a sliced 3MF project
+
+    Attributes
+    ----------
+
+    sha256: The content hash of the 3MF file.
+    plates: The sliced plates, keyed by plate number.
+    """
+    sha256: str
+    plates: dict[int, ProjectPlate] = field(default_factory=dict)
+
+    @property
+    def filament_count(self) -> int:
+        """
+        Get the number of filament slots used by the project.
+
+        Returns:
+            int: highest filament id used on any plate
+        """
+        return max((f.id for p in self.plates.values() for f in p.filaments),
+                   default=0)
+
+    def get_plate(self, plate_number: int) -> ProjectPlate:
+        """
+        Get a plate by number.
+
+        Args:
+            plate_number (int): 1-based plate number
+
+        Raises:
+            ValueError: if the plate was not sliced in the project
+
+        Returns:
+            ProjectPlate: the plate
+        """
+        try:
+            return self.plates[int(plate_number)]
+        except KeyError:
+            raise ValueError(f"Plate {plate_number} not found in project")  # noqa  # pylint: disable=raise-missing-from
+
+
+class _LRUCache:
+    """
+    Least recently used cache bounded by the approximate size of the
+    metadata that was parsed to build each entry.
+    """
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[str, tuple[ProjectInfo, int]] = \
+            OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> ProjectInfo | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: str, value: ProjectInfo, size: int) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            self._evict()
+
+    def resize(self, max_bytes: int) -> None:
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self) -> None:
+        while self.size > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.size -= size
+
+
+_cache = _LRUCache(max_bytes=8 << 20)
+
+# Content hash of the files read by path, keyed by (path, size, mtime), so
+# that reading an unchanged file again does not hash it
+_path_hashes: OrderedDict[tuple[str, int, int], str] = OrderedDict()
+_path_hashes_lock = threading.Lock()
+_PATH_HASHES_MAX = 1024
+
+
+def set_cache_limit(max_bytes: int) -> None:
+    """
+    Set the memory bound of the parsed metadata cache.
+
+    Args:
+        max_bytes (int): approximate maximum size of the cached metadata,
+            0 disables caching
+    """
+    _cache.resize(max_bytes)
+
+
+def _hash_file(fp: BinaryIO) -> str:
+    digest = hashlib.sha256()
+    while chunk := fp.read(_HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _parse_color(color: str) -> str:
+    return color.lstrip("#")[:6].upper()
+
+
+def _plate_json_objects(archive: zipfile.ZipFile,
+                        index: int) -> tuple[tuple[ProjectObject, ...], int]:
+    try:
+        data = archive.read(PLATE_JSON.format(index))
+    except KeyError:
+        return (), 0
+
+    objects = tuple(
+        ProjectObject(identify_id=int(o.get("id", 0)),
+                      name=str(o.get("name", "")))
+        for o in json.loads(data).get("bbox_objects", [])
+    )
+    return objects, len(data)
+
+
+def _parse_slice_info(archive: zipfile.ZipFile,
+                      sha256: str) -> tuple[ProjectInfo, int]:
+    try:
+        data = archive.read(SLICE_INFO)
+    except KeyError:
+        raise ValueError(f"{SLICE_INFO} not found, is the 3MF sliced?")  # noqa  # pylint: disable=raise-missing-from
+
+    size = len(data)
+    root = ET.fromstring(data)
+    plates: dict[int, ProjectPlate] = {}
+
+    for plate in root.iter("plate"):
+        meta = {m.get("key"): m.get("value")
+                for m in plate.iter("metadata")}
+        index = int(meta.get("index", len(plates) + 1))
+
+        objects = tuple(
+            ProjectObject(
+                identify_id=int(o.get("identify_id", 0)),
+                name=o.get("name", ""),
+                skipped=o.get("skipped", "false") == "true",
+            )
+            for o in plate.iter("object")
+        )
+        if not objects:
+            # Older slicer versions only list objects in plate_<n>.json
+            objects, json_size = _plate_json_objects(archive, index)
+            size += json_size
+
+        filaments = tuple(
+            ProjectFilament(
+                id=int(f.get("id", 0)),
+                type=f.get("type", ""),
+                color=_parse_color(f.get("color", "")),
+                tray_info_idx=f.get("tray_info_idx", ""),
+                used_m=float(f.get("used_m", 0.0)),
+                used_g=float(f.get("used_g", 0.0)),
+            )
+            for f in plate.iter("filament")
+        )
+        plates[index] = ProjectPlate(
+            index=index,
+            filaments=filaments,
+            objects=objects,
+            prediction=int(float(meta.get("prediction") or 0)),
+            weight=float(meta.get("weight") or 0.0),
+        )
+
+    return ProjectInfo(sha256=sha256, plates=plates), size
+
+
+def _read(fp: BinaryIO) -> ProjectInfo:
+    fp.seek(0)
+    sha256 = _hash_file(fp)
+    cached = _cache.get(sha256)
+    if cached is not None:
+        return cached
+
+    fp.seek(0)
+    with zipfile.ZipFile(fp) as archive:
+        info, size = _parse_slice_info(archive, sha256)
+
+    _cache.put(sha256, info, size)
+    return info
+
+
+def read_project_info(file: str | os.PathLike | BinaryIO) -> ProjectInfo:
+    """
+    Read the slicer metadata of a 3MF project file.
+
+    Parsed metadata is kept in a memory-bounded LRU cache keyed by content
+    hash, so reading the same file again only costs hashing it, and nothing
+    for a path whose size and modification time did not change.
+
+    Args:
+        file (str | os.PathLike | BinaryIO): path or seekable binary file
+            object of the 3MF project. File objects are left open and
+            rewound to the start.
+
+    Returns:
+        ProjectInfo: project metadata
+    """
+    if isinstance(file, (str, os.PathLike)):
+        path = os.path.abspath(file)
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with _path_hashes_lock:
+            sha256 = _path_hashes.get(key)
+        cached = _cache.get(sha256) if sha256 is not None else None
+        if cached is not None:
+            return cached
+
+        with open(path, "rb") as fp:
+            info = _read(fp)
+        with _path_hashes_lock:
+            _path_hashes[key] = info.sha256
+            _path_hashes.move_to_end(key)
+            while len(_path_hashes) > _PATH_HASHES_MAX:
+                _path_hashes.popitem(last=False)
+        return info
+
+    try:
+        return _read(file)
+    finally:
+        file.seek(0)
+
+
+def _rgb(color: str) -> tuple[int, int, int]:
+    try:
+        value = int(color[:6], 16)
+    except ValueError:
+        return (0, 0, 0)
+    return (value >> 16 & 0xFF, value >> 8 & 0xFF, value & 0xFF)
+
+
+def _cost(filament: ProjectFilament, tray) -> float | None:
+    if filament.type.upper() != str(tray.tray_type).upper():
+        return None
+    a, b = _rgb(filament.color), _rgb(str(tray.tray_color))
+    cost = float(sum((x - y) ** 2 for x, y in zip(a, b)))
+    if filament.tray_info_idx != tray.tray_info_idx:
+        cost += 1.0
+    return cost
+
+
+def _available_trays(ams_units: dict[int, AMS], external_spool=None):
+    trays = [
+        (ams_id * 4 + tray_id, tray)
+        for ams_id, ams in sorted(ams_units.items())
+        for tray_id, tray in sorted(ams.filament_trays.items())
+        if tray.tray_type
+    ]
+    if external_spool is not None and external_spool.tray_type:
+        trays.append((EXTERNAL_SPOOL_ID, external_spool))
+    return trays
+
+
+def compute_ams_mapping(plate: ProjectPlate,
+                        ams_units: dict[int, AMS],
+                        filament_count: int | None = None,
+                        external_spool=None) -> list[int]:
+    """
+    Compute the tray mapping for a plate against the loaded AMS trays.
+
+    Filaments are matched on type, then on the closest colour. Each filament
+    gets its own tray when possible and the assignment minimising the total
+    colour distance is used. If there are not enough distinct trays,
+    filaments share their closest matching tray.
+
+    Args:
+        plate (ProjectPlate): plate to print
+        ams_units (dict[int, AMS]): AMS units keyed by AMS id
+        filament_count (int | None, optional): length of the mapping.
+            Defaults to the highest filament id used by the plate.
+        external_spool (FilamentTray | None, optional): filament loaded on
+            the external spool holder. Defaults to None.
+
+    Raises:
+        ValueError: if a filament has no tray of a compatible type
+
+    Returns:
+        list[int]: the ams_mapping, -1 for filament slots the plate
+        does not use
+    """
+    filaments = sorted(plate.filaments, key=lambda f: f.id)
+    trays = _available_trays(ams_units, external_spool)
+
+    costs = [[_cost(f, tray) for _, tray in trays] for f in filaments]
+
+    missing = [f for f, row in zip(filaments, costs)
+               if all(c is None for c in row)]
+    if missing:
+        raise ValueError(
+            "No loaded tray matches filament(s) "
+            + ", ".join(f"{f.id} ({f.type} #{f.color})" for f in missing))
+
+    @lru_cache(maxsize=None)
+    def best(i: int, used: int) -> tuple[float, tuple[int, ...]] | None:
+        if i == len(filaments):
+            return (0.0, ())
+        result = None
+        for j, cost in enumerate(costs[i]):
+            if cost is None or used & (1 << j):
+                continue
+            rest = best(i + 1, used | (1 << j))
+            if rest is not None and (result is None
+                                     or cost + rest[0] < result[0]):
+                result = (cost + rest[0], (j,) + rest[1])
+        return result
+
+    assignment = best(0, 0)
+    if assignment is not None:
+        chosen = assignment[1]
+    else:
+        chosen = tuple(
+            min((c, j) for j, c in enumerate(row) if c is not None)[1]
+            for row in costs)
+
+    if filament_count is None:
+        filament_count = max((f.id for f in filaments), default=0)
+    mapping = [-1] * max(filament_count,
+                         max((f.id for f in filaments), default=0))
+    for f, j in zip(filaments, chosen):
+        mapping[f.id - 1] = trays[j][0]
+    return mapping
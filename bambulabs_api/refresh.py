@@ -0,0 +1,216 @@
+"""
+Fleet-wide scheduling of full state requests (``pushall``).
+
+Printers send incremental reports, a full report is only needed when a
+client has no state, a state restored from a snapshot, or has not heard
+from the printer for a while. The scheduler gives each printer a slot in a
+refresh period, derived from its serial so that the requests of a fleet are
+spread evenly, sends them under a global rate limit and skips the printers
+whose reports are fresh.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+import zlib
+from typing import Any, Iterable
+
+__all__ = ["RefreshScheduler"]
+
+
+def _client(printer: Any) -> Any:
+    return getattr(printer, "mqtt_client", printer)
+
+
+class RefreshScheduler:
+    """
+    Sends ``pushall`` to a group of printers, spread over a period and rate
+    limited.
+
+    Added clients route the requests of their getters (manual_update)
+    through the scheduler, so they are coordinated with the rest of the
+    fleet instead of sent on every call.
+    """
+
+    def __init__(self, printers: Iterable[Any] = (),
+                 period: float = 300.0,
+                 max_rate: float = 5.0,
+                 max_age: float = 30.0) -> None:
+        """
+        Args:
+            printers (Iterable[Printer | PrinterMQTTClient], optional):
+                printers to refresh, such as a Fleet
+            period (float, optional): seconds between two scheduled
+                refreshes of a printer. Defaults to 300.
+            max_rate (float, optional): pushall requests per second for the
+                whole fleet. Defaults to 5.
+            max_age (float, optional): seconds after the last report before
+                a printer needs a refresh. Defaults to 30.
+        """
+        if period <= 0 or max_rate <= 0 or max_age < 0:
+            raise ValueError("period and max_rate must be positive, max_age "
+                             "must not be negative")
+        self.period = period
+        self.max_rate = max_rate
+        self.max_age = max_age
+        self.sent = 0
+        self.skipped = 0
+
+        self._clients: dict[str, Any] = {}
+        self._due: dict[str, float] = {}
+        self._sent: dict[str, float] = {}
+        self._heap: list[tuple[float, int, str]] = []
+        self._counter = itertools.count()
+        self._next_slot = 0.0
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._stopped = False
+        for printer in printers:
+            self.add(printer)
+
+    def _schedule(self, serial: str, due: float) -> None:
+        self._due[serial] = due
+        heapq.heappush(self._heap, (due, next(self._counter), serial))
+        self._cond.notify()
+
+    def is_fresh(self, client: Any) -> bool:
+        """
+        Check if a client state is recent enough to skip a refresh.
+
+        Args:
+            client (PrinterMQTTClient): printer client
+
+        Returns:
+            bool: True if the printer reported within max_age seconds
+        """
+        return bool(client.last_report) and not client.stale and \
+            time.time() - client.last_report < self.max_age
+
+    def add(self, printer: Any) -> None:
+        """
+        Add a printer. Printers without a confirmed state are refreshed as
+        soon as the rate limit allows, the others at their slot.
+
+        Args:
+            printer (Printer | PrinterMQTTClient): printer
+        """
+        client = _client(printer)
+        serial = client.serial
+        now = time.monotonic()
+        if client.last_report and not client.stale:
+            offset = zlib.crc32(serial.encode()) / 2**32 * self.period
+            due = now + offset
+        else:
+            due = now
+        with self._cond:
+            self._clients[serial] = client
+            self._schedule(serial, due)
+        client.refresher = self
+
+    def remove(self, serial: str) -> None:
+        """
+        Remove a printer.
+
+        Args:
+            serial (str): printer serial
+        """
+        with self._cond:
+            client = self._clients.pop(serial, None)
+            self._due.pop(serial, None)
+            self._sent.pop(serial, None)
+        if client is not None and client.refresher is self:
+            client.refresher = None
+
+    def request(self, serial: str) -> bool:
+        """
+        Ask for a refresh of a printer as soon as the rate limit allows,
+        unless its state is fresh. A printer whose last refresh was not
+        answered yet is asked again max_age seconds after it.
+
+        Args:
+            serial (str): printer serial
+
+        Returns:
+            bool: True if a refresh is pending
+        """
+        with self._cond:
+            client = self._clients.get(serial)
+            if client is None or self.is_fresh(client):
+                return False
+            now = time.monotonic()
+            sent = self._sent.get(serial)
+            due = now if sent is None else max(now, sent + self.max_age)
+            if self._due.get(serial, due) > due:
+                self._schedule(serial, due)
+            return True
+
+    def _next(self) -> Any:
+        """
+        Wait for the next printer to refresh, None once stopped.
+        """
+        while not self._stopped:
+            now = time.monotonic()
+            if not self._heap:
+                self._cond.wait()
+                continue
+            due, _, serial = self._heap[0]
+            if self._due.get(serial) != due:
+                # Rescheduled or removed since pushed
+                heapq.heappop(self._heap)
+                continue
+            if due > now:
+                self._cond.wait(due - now)
+                continue
+            client = self._clients[serial]
+            if self.is_fresh(client):
+                heapq.heappop(self._heap)
+                self._schedule(serial, now + self.period)
+                self.skipped += 1
+                continue
+            if self._next_slot > now:
+                self._cond.wait(self._next_slot - now)
+                continue
+            heapq.heappop(self._heap)
+            self._schedule(serial, now + self.period)
+            self._next_slot = now + 1 / self.max_rate
+            self._sent[serial] = now
+            self.sent += 1
+            return client
+        return None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                client = self._next()
+            if client is None:
+                return
+            try:
+                client.pushall()
+            except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
+                logging.error("Refresh of %s failed: %s", client.serial, e)
+
+    def start(self) -> None:
+        """
+        Start sending the refreshes from a background thread.
+        """
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run,
+                                            name="refresh-scheduler",
+                                            daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the refreshes, pending requests are dropped.
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
@@ -0,0 +1,620 @@
+"""
+Persistent print job queue and a scheduler dispatching the jobs to printers.
+
+Jobs are stored in SQLite so that the queue survives restarts. The scheduler
+follows the state of every printer from its report stream instead of
+polling, uploads the next job while the current print is finishing and
+starts it as soon as the printer is free.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Iterable
+
+from .states_info import GcodeState
+
+__all__ = ["Job", "JobQueue", "JobScheduler", "JobState"]
+
+READY_STATES = (GcodeState.IDLE, GcodeState.FINISH, GcodeState.FAILED)
+ACTIVE_STATES = (GcodeState.PREPARE, GcodeState.RUNNING, GcodeState.PAUSE)
+
+
+class JobState(str, Enum):
+    """
+    State of a print job
+    """
+    QUEUED = "queued"
+    UPLOADING = "uploading"
+    STAGED = "staged"
+    PRINTING = "printing"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+@dataclass
+class Job:
+    """
+    Print job, a plate of a local 3MF file
+    """
+    id: int
+    path: str
+    plate: int = 1
+    priority: int = 0
+    printers: tuple[str, ...] | None = None
+    use_ams: bool = True
+    state: JobState = JobState.QUEUED
+    serial: str | None = None
+    attempts: int = 0
+    max_attempts: int = 3
+    not_before: float = 0.0
+    error: str | None = None
+    created: float = 0.0
+    updated: float = 0.0
+
+    @property
+    def remote_name(self) -> str:
+        """
+        Name of the file uploaded to the printer
+        """
+        return f"job{self.id}_{os.path.basename(self.path)}"
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    plate INTEGER NOT NULL,
+    priority INTEGER NOT NULL,
+    printers TEXT,
+    use_ams INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    serial TEXT,
+    attempts INTEGER NOT NULL,
+    max_attempts INTEGER NOT NULL,
+    not_before REAL NOT NULL,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (state, priority DESC, id);
+"""
+
+
+def _job(row: sqlite3.Row) -> Job:
+    return Job(id=row["id"], path=row["path"], plate=row["plate"],
+               priority=row["priority"],
+               printers=tuple(json.loads(row["printers"]))
+               if row["printers"] else None,
+               use_ams=bool(row["use_ams"]), state=JobState(row["state"]),
+               serial=row["serial"], attempts=row["attempts"],
+               max_attempts=row["max_attempts"],
+               not_before=row["not_before"], error=row["error"],
+               created=row["created"], updated=row["updated"])
+
+
+class JobQueue:
+    """
+    Priority queue of print jobs stored in SQLite.
+
+    Higher priorities are dispatched first, then older jobs. Jobs that were
+    being uploaded when the process stopped are queued again on open.
+    """
+
+    def __init__(self, path: str | os.PathLike = ":memory:") -> None:
+        """
+        Args:
+            path (str | os.PathLike, optional): database file.
+                Defaults to an in-memory database.
+        """
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.fspath(path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.executescript(_SCHEMA)
+            self._db.execute(
+                "UPDATE jobs SET state = ?, serial = NULL WHERE state IN "
+                "(?, ?)", (JobState.QUEUED.value, JobState.UPLOADING.value,
+                           JobState.STAGED.value))
+
+    def close(self) -> None:
+        """
+        Close the database
+        """
+        with self._lock:
+            self._db.close()
+
+    def add(self, path: str | os.PathLike, plate: int = 1,
+            priority: int = 0, printers: Iterable[str] | None = None,
+            use_ams: bool = True, max_attempts: int = 3) -> Job:
+        """
+        Add a job.
+
+        Args:
+            path (str | os.PathLike): sliced 3MF file
+            plate (int, optional): plate number. Defaults to 1.
+            priority (int, optional): higher first. Defaults to 0.
+            printers (Iterable[str] | None, optional): serials of the
+                printers allowed to print it, None for any.
+            use_ams (bool, optional): print with the AMS, the trays are
+                matched against the file filaments. Defaults to True.
+            max_attempts (int, optional): attempts before the job fails.
+                Defaults to 3.
+
+        Returns:
+            Job: the queued job
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        now = time.time()
+        allowed = json.dumps(list(printers)) if printers is not None else None
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO jobs (path, plate, priority, printers, use_ams, "
+                "state, attempts, max_attempts, not_before, created, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, 0, ?, 0, ?, ?)",
+                (os.fspath(path), int(plate), int(priority), allowed,
+                 int(use_ams), JobState.QUEUED.value, max_attempts, now, now))
+            job_id = cursor.lastrowid
+        return self.get(job_id)  # type: ignore
+
+    def get(self, job_id: int) -> Job | None:
+        """
+        Get a job.
+
+        Args:
+            job_id (int): job id
+
+        Returns:
+            Job | None: the job, None if it does not exist
+        """
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?",
+                                   (job_id,)).fetchone()
+        return _job(row) if row is not None else None
+
+    def jobs(self, state: JobState | None = None) -> list[Job]:
+        """
+        List the jobs in dispatch order.
+
+        Args:
+            state (JobState | None, optional): only list jobs in this state
+
+        Returns:
+            list[Job]: jobs
+        """
+        query = "SELECT * FROM jobs"
+        params: tuple = ()
+        if state is not None:
+            query += " WHERE state = ?"
+            params = (JobState(state).value,)
+        with self._lock:
+            rows = self._db.execute(
+                query + " ORDER BY priority DESC, id", params).fetchall()
+        return [_job(row) for row in rows]
+
+    def counts(self) -> dict[JobState, int]:
+        """
+        Count the jobs by state.
+
+        Returns:
+            dict[JobState, int]: number of jobs in each state
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {JobState(state): count for state, count in rows}
+
+    def _update(self, job_id: int, **fields: Any) -> None:
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        values = [v.value if isinstance(v, Enum) else v
+                  for v in fields.values()]
+        self._db.execute(f"UPDATE jobs SET {columns} WHERE id = ?",
+                         (*values, job_id))
+
+    def claim(self, serial: str, exclude: Iterable[int] = ()) -> Job | None:
+        """
+        Take the next queued job a printer may print, marking it uploading.
+
+        Args:
+            serial (str): printer serial
+            exclude (Iterable[int], optional): ids of jobs to skip
+
+        Returns:
+            Job | None: the claimed job, None if no job is available
+        """
+        exclude = set(exclude)
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "SELECT * FROM jobs WHERE state = ? AND not_before <= ? "
+                "ORDER BY priority DESC, id",
+                (JobState.QUEUED.value, time.time()))
+            while rows := cursor.fetchmany(64):
+                for row in rows:
+                    job = _job(row)
+                    if job.id in exclude or (job.printers is not None
+                                             and serial not in job.printers):
+                        continue
+                    cursor.close()
+                    self._update(job.id, state=JobState.UPLOADING,
+                                 serial=serial)
+                    job.state, job.serial = JobState.UPLOADING, serial
+                    return job
+        return None
+
+    def mark(self, job_id: int, state: JobState,
+             error: str | None = None) -> None:
+        """
+        Set the state of a job.
+
+        Args:
+            job_id (int): job id
+            state (JobState): new state
+            error (str | None, optional): error message. Defaults to None.
+        """
+        with self._lock, self._db:
+            self._update(job_id, state=JobState(state), error=error)
+
+    def unclaim(self, job_id: int) -> None:
+        """
+        Queue a claimed job again without counting an attempt, for example
+        when the printer does not have the required filaments.
+
+        Args:
+            job_id (int): job id
+        """
+        with self._lock, self._db:
+            self._update(job_id, state=JobState.QUEUED, serial=None)
+
+    def release(self, job_id: int, error: str,
+                retry_delay: float = 0.0) -> Job | None:
+        """
+        Record a failed attempt. The job is queued again after a delay
+        doubling with each attempt, or failed after max_attempts.
+
+        Args:
+            job_id (int): job id
+            error (str): error message
+            retry_delay (float, optional): delay before the first retry.
+                Defaults to 0.
+
+        Returns:
+            Job | None: the updated job
+        """
+        with self._lock, self._db:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?",
+                                   (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = _job(row)
+            attempts = job.attempts + 1
+            if attempts >= job.max_attempts:
+                self._update(job_id, state=JobState.FAILED,
+                             attempts=attempts, error=error)
+            else:
+                self._update(job_id, state=JobState.QUEUED, serial=None,
+                             attempts=attempts, error=error,
+                             not_before=time.time()
+                             + retry_delay * 2 ** (attempts - 1))
+        logging.warning("Job %d attempt %d failed: %s", job_id, attempts,
+                        error)
+        return self.get(job_id)
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Cancel a queued job.
+
+        Args:
+            job_id (int): job id
+
+        Returns:
+            bool: False if the job was not queued
+        """
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "UPDATE jobs SET state = ?, updated = ? WHERE id = ? "
+                "AND state = ?", (JobState.CANCELLED.value, time.time(),
+                                  job_id, JobState.QUEUED.value))
+            return cursor.rowcount == 1
+
+
+class _Slot:  # pylint: disable=too-few-public-methods,too-many-instance-attributes  # noqa
+    def __init__(self, printer: Any) -> None:
+        self.printer = printer
+        self.serial: str = printer.serial
+        self.state = GcodeState.UNKNOWN
+        self.percent = 0
+        self.upload: Future | None = None
+        self.staged: tuple[Job, list[int]] | None = None
+        self.current: Job | None = None
+        self.confirmed = False
+        self.started = 0.0
+        self.incompatible: set[int] = set()
+        self.listener: Any = None
+
+
+class JobScheduler:
+    """
+    Dispatches the jobs of a JobQueue to a fleet of printers.
+
+    A printer is ready when its reported state is IDLE, FINISH or FAILED.
+    When a print passes ``prefetch_percent``, the next job is claimed and
+    uploaded so that it starts as soon as the printer is ready. A job whose
+    filaments are not loaded on a printer is left to the other printers.
+    Failed uploads, prints that do not start and failed prints are retried
+    up to the job ``max_attempts``.
+
+    Printers are :class:`~bambulabs_api.Printer` instances, connected by the
+    caller.
+    """
+
+    def __init__(self, queue: JobQueue, printers: Iterable[Any] = (),
+                 prefetch_percent: int = 90,
+                 upload_workers: int = 4,
+                 start_timeout: float = 300.0,
+                 retry_delay: float = 60.0,
+                 delete_finished: bool = True,
+                 poll_interval: float = 5.0) -> None:
+        """
+        Args:
+            queue (JobQueue): job queue
+            printers (Iterable[Printer], optional): printers to dispatch to
+            prefetch_percent (int, optional): progress of the current print
+                from which the next job is uploaded. Defaults to 90.
+            upload_workers (int, optional): concurrent uploads.
+                Defaults to 4.
+            start_timeout (float, optional): seconds for a started print to
+                be reported running. Defaults to 300.
+            retry_delay (float, optional): seconds before the first retry of
+                a failed job. Defaults to 60.
+            delete_finished (bool, optional): delete the uploaded file once
+                printed. Defaults to True.
+            poll_interval (float, optional): seconds between dispatch passes
+                without any report. Defaults to 5.
+        """
+        self.queue = queue
+        self.prefetch_percent = prefetch_percent
+        self.start_timeout = start_timeout
+        self.retry_delay = retry_delay
+        self.delete_finished = delete_finished
+        self.poll_interval = poll_interval
+
+        self._slots: dict[str, _Slot] = {}
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.upload_workers = upload_workers
+        # Built on first use, and again after stop()
+        self._executor: ThreadPoolExecutor | None = None
+        for printer in printers:
+            self.add_printer(printer)
+
+    def add_printer(self, printer: Any) -> None:
+        """
+        Start dispatching jobs to a printer.
+
+        Args:
+            printer (Printer): printer
+        """
+        slot = _Slot(printer)
+        slot.state = GcodeState(printer.get_state())
+        for job in self.queue.jobs(JobState.PRINTING):
+            if job.serial == slot.serial:
+                slot.current, slot.confirmed = job, True
+
+        def listener(report: dict[str, Any]) -> None:
+            self._on_report(slot, report)
+
+        slot.listener = listener
+        with self._lock:
+            self._slots[slot.serial] = slot
+        printer.add_report_listener(listener)
+        self._wake.set()
+
+    def remove_printer(self, serial: str) -> None:
+        """
+        Stop dispatching jobs to a printer. Its current print is left
+        running and a staged job is queued again.
+
+        Args:
+            serial (str): printer serial
+        """
+        with self._lock:
+            slot = self._slots.pop(serial, None)
+        if slot is None:
+            return
+        slot.printer.remove_report_listener(slot.listener)
+        if slot.staged is not None:
+            self.queue.unclaim(slot.staged[0].id)
+
+    def submit(self, path: str | os.PathLike, plate: int = 1,
+               priority: int = 0, **options: Any) -> Job:
+        """
+        Queue a job, see JobQueue.add for the options.
+
+        Returns:
+            Job: the queued job
+        """
+        job = self.queue.add(path, plate, priority, **options)
+        self._wake.set()
+        return job
+
+    def _on_report(self, slot: _Slot, report: dict[str, Any]) -> None:
+        wake = False
+        if "gcode_state" in report:
+            state = GcodeState(report["gcode_state"])
+            wake = state != slot.state
+            if slot.state not in ACTIVE_STATES and state in ACTIVE_STATES:
+                # A new print, the progress of the last one is stale
+                slot.percent = 0
+            slot.state = state
+        if "mc_percent" in report:
+            percent = int(report["mc_percent"] or 0)
+            wake = wake or (slot.percent < self.prefetch_percent <= percent)
+            slot.percent = percent
+        if "ams" in report or "vt_tray" in report:
+            # Loaded filaments changed, jobs may fit now
+            slot.incompatible.clear()
+            wake = True
+        if wake:
+            self._wake.set()
+
+    def start(self) -> None:
+        """
+        Start dispatching in a background thread
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="job-scheduler")
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop dispatching and wait for the running uploads, the scheduler
+        can be started again
+        """
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _submit(self, fn: Any, *args: Any) -> Future:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.upload_workers,
+                    thread_name_prefix="upload")
+            return self._executor.submit(fn, *args)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.dispatch()
+            except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
+                logging.error("Job dispatch failed: %s", e)
+
+    def dispatch(self) -> None:
+        """
+        Run one dispatch pass over the printers. Called by the background
+        thread on every state change, or directly when not started.
+        """
+        with self._lock:
+            slots = list(self._slots.values())
+        for slot in slots:
+            with self._lock:
+                self._dispatch(slot)
+
+    def wait_for_uploads(self, timeout: float | None = None) -> None:
+        """
+        Wait for the uploads in progress.
+
+        Args:
+            timeout (float | None, optional): seconds to wait per upload
+        """
+        with self._lock:
+            uploads = [s.upload for s in self._slots.values()
+                       if s.upload is not None]
+        for upload in uploads:
+            upload.result(timeout)
+
+    def _finish(self, slot: _Slot, job: Job) -> None:
+        slot.current = None
+        slot.confirmed = False
+        if self.delete_finished:
+            self._submit(self._delete, slot, job)
+
+    def _dispatch(self, slot: _Slot) -> None:
+        job = slot.current
+        if job is not None:
+            if slot.state in ACTIVE_STATES:
+                slot.confirmed = True
+            elif slot.confirmed and slot.state == GcodeState.FINISH:
+                self.queue.mark(job.id, JobState.DONE)
+                logging.info("Job %d done on %s", job.id, slot.serial)
+                self._finish(slot, job)
+            elif slot.confirmed and slot.state == GcodeState.FAILED:
+                self.queue.release(job.id, "print failed", self.retry_delay)
+                self._finish(slot, job)
+            elif not slot.confirmed and \
+                    time.monotonic() - slot.started > self.start_timeout:
+                self.queue.release(job.id, "print did not start",
+                                   self.retry_delay)
+                self._finish(slot, job)
+
+        ready = slot.current is None and slot.state in READY_STATES
+        finishing = slot.state == GcodeState.RUNNING \
+            and slot.percent >= self.prefetch_percent
+        uploading = slot.upload is not None and not slot.upload.done()
+        if slot.staged is None and not uploading and (ready or finishing):
+            claimed = self.queue.claim(slot.serial, slot.incompatible)
+            if claimed is not None:
+                slot.upload = self._submit(self._upload, slot, claimed)
+
+        if ready and slot.staged is not None:
+            job, mapping = slot.staged
+            slot.staged = None
+            if slot.printer.start_print(job.remote_name, job.plate,
+                                        job.use_ams, mapping):
+                self.queue.mark(job.id, JobState.PRINTING)
+                logging.info("Job %d started on %s", job.id, slot.serial)
+                slot.current = job
+                slot.confirmed = False
+                slot.percent = 0
+                slot.started = time.monotonic()
+            else:
+                self.queue.release(job.id, "start_print failed",
+                                   self.retry_delay)
+
+    def _upload(self, slot: _Slot, job: Job) -> None:
+        try:
+            mapping = [0]
+            if job.use_ams:
+                try:
+                    mapping = slot.printer.compute_ams_mapping(job.path,
+                                                               job.plate)
+                except ValueError as e:
+                    logging.info("Job %d skipped on %s: %s", job.id,
+                                 slot.serial, e)
+                    slot.incompatible.add(job.id)
+                    self.queue.unclaim(job.id)
+                    return
+
+            with open(job.path, "rb") as fp:
+                slot.printer.upload_file(fp, job.remote_name)
+        except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
+            self.queue.release(job.id, f"upload failed: {e}",
+                               self.retry_delay)
+        else:
+            with self._lock:
+                if self._slots.get(slot.serial) is slot:
+                    self.queue.mark(job.id, JobState.STAGED)
+                    slot.staged = (job, mapping)
+                else:
+                    self.queue.unclaim(job.id)
+        finally:
+            self._wake.set()
+
+    def _delete(self, slot: _Slot, job: Job) -> None:
+        try:
+            slot.printer.delete_file(job.remote_name)
+        except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
+            logging.warning("Could not delete %s from %s: %s",
+                            job.remote_name, slot.serial, e)
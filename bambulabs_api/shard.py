@@ -0,0 +1,524 @@
+"""
+Fleet runtime sharded across worker processes.
+
+One process decoding the reports and assembling the camera frames of
+hundreds of printers is bound by the GIL. ``ShardedFleet`` spreads the
+printers over worker processes, each owning the MQTT and camera clients of
+its printers. Workers publish the latest state and camera frame of every
+printer into shared memory, read in place by the front-end process without
+IPC messages or decoding:
+
+- the state table holds one row of float64 per printer: a sequence
+  counter, the time of the last report, the gcode state (index in
+  ``GCODE_STATES``) and the numeric report fields, NaN until reported
+- each printer has two frame slots, written in turn, so the latest frame
+  stays in place while the next one is copied in
+
+Rows and slots have a single writer, the worker owning the printer, and
+are read with sequence counters (seqlocks): a reader retries or discards
+what changed while it was reading.
+"""
+
+import itertools
+import logging
+import math
+import multiprocessing
+import queue
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from typing import Any, Iterable
+
+from bambulabs_api.fleet import COMMANDS
+from bambulabs_api.states_info import GcodeState
+from bambulabs_api.telemetry import DEFAULT_FIELDS
+
+__all__ = ["GCODE_STATES", "PrinterSpec", "STATE_FIELDS", "ShardedFleet"]
+
+STATE_FIELDS = DEFAULT_FIELDS + (
+    "mc_remaining_time",
+    "total_layer_num",
+    "spd_lvl",
+)
+
+GCODE_STATES = tuple(GcodeState)
+
+# Columns of a state table row before the report fields
+_HEADER_COLUMNS = ("seq", "last_report", "gcode_state")
+
+# Frame slot header: sequence (0 while written), timestamp, length
+_SLOT_HEADER = struct.Struct("<QdQ")
+_SLOT_HEADER_SIZE = 32
+
+NAN = float("nan")
+
+
+@dataclass(frozen=True)
+class PrinterSpec:
+    """
+    Connection settings of a printer, sent to the worker owning it
+    """
+    ip_address: str
+    access_code: str
+    serial: str
+    mqtt_port: int = 8883
+    camera_port: int = 6000
+
+
+class _StateTable:
+    """
+    Rows of float64 in a shared memory block
+    """
+
+    def __init__(self, buf: memoryview, fields: tuple[str, ...]) -> None:
+        self.fields = fields
+        self.columns = _HEADER_COLUMNS + fields
+        self.stride = len(self.columns)
+        self.values = buf.cast("d")
+
+    def write(self, row: int, last_report: float,
+              report: dict[str, Any]) -> None:
+        values = self.values
+        offset = row * self.stride
+        seq = values[offset]
+        values[offset] = seq + 1
+        values[offset + 1] = last_report
+        state = report.get("gcode_state")
+        if state is not None:
+            values[offset + 2] = GCODE_STATES.index(GcodeState(state))
+        for i, field in enumerate(self.fields, offset + 3):
+            value = report.get(field)
+            if value is not None:
+                try:
+                    values[i] = float(value)
+                except (TypeError, ValueError):
+                    pass
+        values[offset] = seq + 2
+
+    def release(self) -> None:
+        self.values.release()
+
+    def read(self, row: int) -> list[float] | None:
+        values = self.values
+        offset = row * self.stride
+        while True:
+            seq = values[offset]
+            if seq % 2:
+                time.sleep(0)
+                continue
+            row_values = values[offset:offset + self.stride].tolist()
+            if values[offset] == seq:
+                return row_values if seq else None
+
+
+class _FrameSlots:
+    """
+    Two frame slots per printer in a shared memory block
+    """
+
+    def __init__(self, buf: memoryview, frame_size: int) -> None:
+        self.buf = buf
+        self.frame_size = frame_size
+        self.slot_size = _SLOT_HEADER_SIZE + frame_size
+
+    def _offset(self, row: int, slot: int) -> int:
+        return (row * 2 + slot) * self.slot_size
+
+    def write(self, row: int, seq: int, data: Any,
+              timestamp: float) -> bool:
+        size = len(data)
+        if size > self.frame_size:
+            return False
+        offset = self._offset(row, seq % 2)
+        _SLOT_HEADER.pack_into(self.buf, offset, 0, timestamp, size)
+        start = offset + _SLOT_HEADER_SIZE
+        self.buf[start:start + size] = data
+        _SLOT_HEADER.pack_into(self.buf, offset, seq, timestamp, size)
+        return True
+
+    def seq(self, row: int, slot: int) -> int:
+        return _SLOT_HEADER.unpack_from(self.buf,
+                                        self._offset(row, slot))[0]
+
+    def latest(self, row: int) -> tuple[int, float, memoryview] | None:
+        seqs = (self.seq(row, 0), self.seq(row, 1))
+        slot = 0 if seqs[0] > seqs[1] else 1
+        offset = self._offset(row, slot)
+        seq, timestamp, size = _SLOT_HEADER.unpack_from(self.buf, offset)
+        if not seq:
+            return None
+        start = offset + _SLOT_HEADER_SIZE
+        return seq, timestamp, self.buf[start:start + size]
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    return shared_memory.SharedMemory(name=name)
+
+
+def _worker(specs: list[tuple[int, PrinterSpec]], fields: tuple[str, ...],
+            table_name: str, frames_name: str | None, frame_size: int,
+            frame_interval: float, requests: Any, results: Any) -> None:
+    """
+    Worker process: runs the clients of its printers, writes their states
+    and frames to shared memory and runs the commands sent to them
+    """
+    from .camera_client import PrinterCamera  # noqa  # pylint: disable=import-outside-toplevel
+    from .mqtt_client import PrinterMQTTClient  # noqa  # pylint: disable=import-outside-toplevel
+
+    table_shm = _attach(table_name)
+    frames_shm = _attach(frames_name) if frames_name else None
+    table = _StateTable(table_shm.buf, fields)
+    slots = _FrameSlots(frames_shm.buf, frame_size) if frames_shm else None
+
+    clients: dict[str, Any] = {}
+    cameras: list[tuple[int, Any]] = []
+    for row, spec in specs:
+        client = PrinterMQTTClient(spec.ip_address, spec.access_code,
+                                   spec.serial, port=spec.mqtt_port,
+                                   fields=fields + ("gcode_state",))
+
+        def on_report(report: dict[str, Any], row: int = row,
+                      client: Any = client) -> None:
+            table.write(row, client.last_report, report)
+
+        client.add_report_listener(on_report)
+        client.connect()
+        client.start()
+        clients[spec.serial] = client
+        if slots is not None:
+            camera = PrinterCamera(spec.ip_address, spec.access_code,
+                                   port=spec.camera_port,
+                                   supervisor=client.supervisor)
+            camera.start()
+            cameras.append((row, camera))
+
+    written: dict[int, tuple[Any, int]] = {}
+    try:
+        while True:
+            try:
+                request = requests.get(
+                    timeout=frame_interval if cameras else None)
+            except queue.Empty:
+                request = ()
+            if request is None:
+                break
+            if request:
+                request_id, serial, name, args, kwargs = request
+                try:
+                    value = getattr(clients[serial], name)(*args, **kwargs)
+                    results.put((request_id, value, None))
+                except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
+                    results.put((request_id, None, repr(e)))
+            for row, camera in cameras:
+                frame = camera.last_frame
+                previous, seq = written.get(row, (None, 0))
+                if frame is None or frame is previous:
+                    continue
+                if slots.write(row, seq + 1, frame, time.time()):  # type: ignore  # noqa
+                    written[row] = (frame, seq + 1)
+                else:
+                    written[row] = (frame, seq)
+                    logging.warning("Frame of %d bytes over the %d bytes "
+                                    "slot", len(frame), frame_size)
+    finally:
+        for client in clients.values():
+            client.stop()
+        for _, camera in cameras:
+            camera.stop()
+        # Views into the blocks must be released before closing them
+        table.release()
+        table_shm.close()
+        if frames_shm is not None:
+            frames_shm.close()
+
+
+class ShardedFleet:
+    """
+    Printers run by worker processes, their states and camera frames read
+    from shared memory.
+    """
+
+    def __init__(self, printers: Iterable[PrinterSpec],
+                 shards: int | None = None,
+                 fields: Iterable[str] = STATE_FIELDS,
+                 camera: bool = False,
+                 frame_size: int = 1 << 18,
+                 max_fps: float = 5.0) -> None:
+        """
+        Args:
+            printers (Iterable[PrinterSpec]): printers to run
+            shards (int | None, optional): worker processes. Defaults to
+                the number of CPUs.
+            fields (Iterable[str], optional): numeric report fields of the
+                state table. Defaults to STATE_FIELDS.
+            camera (bool, optional): run the camera clients and publish
+                their frames. Defaults to False.
+            frame_size (int, optional): largest frame in bytes, larger
+                frames are dropped. Defaults to 256 KiB.
+            max_fps (float, optional): rate at which workers copy the new
+                frames of each camera. Defaults to 5.
+        """
+        self.specs = list(printers)
+        serials = [spec.serial for spec in self.specs]
+        if len(set(serials)) != len(serials):
+            raise ValueError("Printer serials must be unique")
+        shards = shards or multiprocessing.cpu_count()
+        if shards < 1 or frame_size < 1 or max_fps <= 0:
+            raise ValueError("shards, frame_size and max_fps must be "
+                             "positive")
+        self.shards = min(shards, max(len(self.specs), 1))
+        self.fields = tuple(fields)
+        self.camera = camera
+        self.frame_size = frame_size
+        self.frame_interval = 1 / max_fps
+        self.rows = {serial: row for row, serial in enumerate(serials)}
+
+        self._table_shm: shared_memory.SharedMemory | None = None
+        self._frames_shm: shared_memory.SharedMemory | None = None
+        self._table: _StateTable | None = None
+        self._slots: _FrameSlots | None = None
+        self._processes: list[Any] = []
+        self._requests: list[Any] = []
+        self._results: Any = None
+        self._results_thread: threading.Thread | None = None
+        self._pending: dict[int, Future] = {}
+        self._ids = itertools.count()
+
+    def shard_of(self, serial: str) -> int:
+        """
+        Get the worker running a printer.
+
+        Args:
+            serial (str): printer serial
+
+        Returns:
+            int: worker index
+        """
+        return self.rows[serial] % self.shards
+
+    @property
+    def columns(self) -> tuple[str, ...]:
+        """
+        Columns of the state table rows
+        """
+        return _HEADER_COLUMNS + self.fields
+
+    @property
+    def table(self) -> memoryview:
+        """
+        The state table, float64 values row after row in the order of the
+        printers, for vectorized reads such as
+        ``numpy.frombuffer(fleet.table).reshape(-1, len(fleet.columns))``.
+        Rows being written are not guarded, use state() for consistent
+        rows.
+        """
+        if self._table is None:
+            raise RuntimeError("Fleet is not started")
+        return self._table.values
+
+    def start(self) -> None:
+        """
+        Create the shared memory and start the workers.
+        """
+        if self._processes:
+            return
+        stride = len(self.columns)
+        rows = max(len(self.specs), 1)
+        self._table_shm = shared_memory.SharedMemory(
+            create=True, size=rows * stride * 8)
+        self._table = _StateTable(self._table_shm.buf, self.fields)
+        for row in range(len(self.specs)):
+            offset = row * stride
+            self._table.values[offset] = 0.0
+            for i in range(offset + 1, offset + stride):
+                self._table.values[i] = NAN
+        if self.camera:
+            self._frames_shm = shared_memory.SharedMemory(
+                create=True,
+                size=rows * 2 * (_SLOT_HEADER_SIZE + self.frame_size))
+            self._slots = _FrameSlots(self._frames_shm.buf, self.frame_size)
+
+        # Workers run threads of their own, spawn rather than fork them
+        context = multiprocessing.get_context("spawn")
+        self._results = context.Queue()
+        for shard in range(self.shards):
+            specs = [(row, spec) for row, spec in enumerate(self.specs)
+                     if row % self.shards == shard]
+            requests = context.Queue()
+            process = context.Process(
+                target=_worker, name=f"fleet-shard-{shard}", daemon=True,
+                args=(specs, self.fields, self._table_shm.name,
+                      self._frames_shm.name if self._frames_shm else None,
+                      self.frame_size, self.frame_interval, requests,
+                      self._results))
+            process.start()
+            self._requests.append(requests)
+            self._processes.append(process)
+        self._results_thread = threading.Thread(
+            target=self._collect, name="fleet-shard-results", daemon=True)
+        self._results_thread.start()
+
+    def _collect(self) -> None:
+        while True:
+            result = self._results.get()
+            if result is None:
+                return
+            request_id, value, error = result
+            future = self._pending.pop(request_id, None)
+            if future is None:
+                continue
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(error))
+
+    def stop(self) -> None:
+        """
+        Stop the workers and free the shared memory.
+        """
+        for requests in self._requests:
+            requests.put(None)
+        for process in self._processes:
+            process.join(10)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        if self._results_thread is not None:
+            self._results.put(None)
+            self._results_thread.join()
+        for future in self._pending.values():
+            future.set_exception(RuntimeError("Fleet stopped"))
+        self._pending.clear()
+        self._processes.clear()
+        self._requests.clear()
+        self._results_thread = None
+        for shm in (self._table_shm, self._frames_shm):
+            if shm is None:
+                continue
+            try:
+                if shm is self._table_shm and self._table is not None:
+                    self._table.release()
+                shm.close()
+            except BufferError:
+                # Arrays built on the table still use the memory, it is
+                # freed when they are
+                logging.warning("Shared memory %s still in use", shm.name)
+            shm.unlink()
+        self._table = self._slots = None
+        self._table_shm = self._frames_shm = None
+
+    def __enter__(self) -> "ShardedFleet":
+        self.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def state(self, serial: str) -> dict[str, Any] | None:
+        """
+        Get the latest state of a printer.
+
+        Args:
+            serial (str): printer serial
+
+        Returns:
+            dict[str, Any] | None: last report time, gcode state and report
+                fields (None until reported), None before the first report
+        """
+        if self._table is None:
+            raise RuntimeError("Fleet is not started")
+        values = self._table.read(self.rows[serial])
+        if values is None:
+            return None
+        state = {"last_report": values[1],
+                 "gcode_state": None if math.isnan(values[2])
+                 else GCODE_STATES[int(values[2])]}
+        for field, value in zip(self.fields, values[3:]):
+            state[field] = None if math.isnan(value) else value
+        return state
+
+    def states(self) -> dict[str, dict[str, Any] | None]:
+        """
+        Get the latest state of every printer.
+
+        Returns:
+            dict[str, dict[str, Any] | None]: state by serial, see state()
+        """
+        return {serial: self.state(serial) for serial in self.rows}
+
+    def frame(self, serial: str, copy: bool = True
+              ) -> tuple[int, float, bytes | memoryview] | None:
+        """
+        Get the latest camera frame of a printer.
+
+        Without ``copy`` the frame is a view into shared memory, valid until
+        the worker writes the frame after next: check frame_valid() after
+        using it.
+
+        Args:
+            serial (str): printer serial
+            copy (bool, optional): return a copy of the frame. Defaults to
+                True.
+
+        Returns:
+            tuple[int, float, bytes | memoryview] | None: frame sequence,
+                time and JPEG data, None before the first frame
+        """
+        if self._slots is None:
+            raise RuntimeError("Camera frames are not published")
+        row = self.rows[serial]
+        while True:
+            latest = self._slots.latest(row)
+            if latest is None or not copy:
+                return latest
+            seq, timestamp, view = latest
+            data = bytes(view)
+            if self.frame_valid(serial, seq):
+                return seq, timestamp, data
+
+    def frame_valid(self, serial: str, seq: int) -> bool:
+        """
+        Check that a frame returned by frame() was not overwritten since.
+
+        Args:
+            serial (str): printer serial
+            seq (int): frame sequence
+
+        Returns:
+            bool: True if the frame data is intact
+        """
+        if self._slots is None:
+            return False
+        return self._slots.seq(self.rows[serial], seq % 2) == seq
+
+    def command(self, serial: str, name: str, *args: Any,
+                timeout: float | None = 10.0, **kwargs: Any) -> Any:
+        """
+        Run a command of the fleet command set on a printer, in the worker
+        owning it.
+
+        Args:
+            serial (str): printer serial
+            name (str): PrinterMQTTClient method, see fleet.COMMANDS
+            timeout (float | None, optional): seconds to wait for the
+                result. Defaults to 10.
+
+        Returns:
+            Any: the command result
+        """
+        if name not in COMMANDS:
+            raise ValueError(f"Unknown command {name}")
+        if not self._processes:
+            raise RuntimeError("Fleet is not started")
+        request_id = next(self._ids)
+        future: Future = Future()
+        self._pending[request_id] = future
+        self._requests[self.shard_of(serial)].put(
+            (request_id, serial, name, args, kwargs))
+        try:
+            return future.result(timeout)
+        finally:
+            self._pending.pop(request_id, None)
@@ -0,0 +1,10 @@
+"""
+Printer simulator for load-testing fleets without hardware.
+
+Run ``python -m bambulabs_api.simulator --help`` to serve a fleet of
+simulated printers, or use :class:`SimulatedFleet` from code.
+"""
+
+from .broker import MQTTBroker, make_ssl_context  # noqa
+from .fleet import SimulatedFleet  # noqa
+from .printer import VirtualPrinter  # noqa
@@ -0,0 +1,59 @@
+"""
+Serve a fleet of simulated printers.
+
+Example
+-------
+
+python -m bambulabs_api.simulator --printers 1000 --port 8883
+"""
+
+import argparse
+import asyncio
+import logging
+
+from .broker import make_ssl_context
+from .fleet import SimulatedFleet
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    fleet = SimulatedFleet(
+        (f"{args.prefix}{i:06d}" for i in range(args.printers)),
+        access_code=args.access_code,
+        report_interval=args.interval,
+        speedup=args.speedup,
+        print_duration=args.print_duration,
+    )
+    await fleet.start(args.host, args.port,
+                      make_ssl_context(args.cert, args.key))
+    await asyncio.Event().wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Simulated printer fleet")
+    parser.add_argument("--printers", type=int, default=10)
+    parser.add_argument("--prefix", default="SIM",
+                        help="serial prefix, serials are <prefix>000000...")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8883)
+    parser.add_argument("--access-code", default=None,
+                        help="access code to require, any by default")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="seconds between reports")
+    parser.add_argument("--speedup", type=float, default=1.0,
+                        help="simulated seconds per real second")
+    parser.add_argument("--print-duration", type=float, default=600.0,
+                        help="simulated seconds per print")
+    parser.add_argument("--cert", help="PEM certificate, self-signed "
+                        "by default")
+    parser.add_argument("--key", help="PEM private key")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
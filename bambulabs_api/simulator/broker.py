@@ -0,0 +1,299 @@
+"""
+Minimal asyncio MQTT 3.1.1 broker used by the simulator.
+
+Supports QoS 0 and 1 publishes (delivered at QoS 0), exact and ``+``/``#``
+wildcard subscriptions and username/password checking. Retained messages,
+QoS 2, wills and sessions are not supported.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import ssl
+import struct
+import subprocess
+import tempfile
+from typing import Any, Awaitable, Callable
+
+__all__ = ["MQTTBroker", "make_ssl_context"]
+
+PublishHandler = Callable[[str, bytes], Awaitable[None]]
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+CONNACK_ACCEPTED = b"\x00\x00"
+CONNACK_BAD_CREDENTIALS = b"\x00\x04"
+
+
+def make_ssl_context(certfile: str | None = None,
+                     keyfile: str | None = None) -> ssl.SSLContext:
+    """
+    Create a server SSL context. Without a certificate, a throwaway
+    self-signed one is generated with the ``openssl`` command line tool.
+
+    Args:
+        certfile (str | None, optional): PEM certificate. Defaults to None.
+        keyfile (str | None, optional): PEM private key. Defaults to None.
+
+    Returns:
+        ssl.SSLContext: server context
+    """
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    if certfile is not None:
+        ctx.load_cert_chain(certfile, keyfile)
+        return ctx
+
+    with tempfile.TemporaryDirectory() as directory:
+        cert = os.path.join(directory, "cert.pem")
+        key = os.path.join(directory, "key.pem")
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "ec",
+             "-pkeyopt", "ec_paramgen_curve:prime256v1", "-nodes",
+             "-keyout", key, "-out", cert, "-days", "30",
+             "-subj", "/CN=bambulabs-simulator"],
+            check=True, capture_output=True)
+        ctx.load_cert_chain(cert, key)
+    return ctx
+
+
+def _encode_length(length: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def _packet(kind: int, body: bytes, flags: int = 0) -> bytes:
+    return bytes([kind << 4 | flags]) + _encode_length(len(body)) + body
+
+
+def _string(data: bytes, pos: int) -> tuple[bytes, int]:
+    size = struct.unpack(">H", data[pos:pos + 2])[0]
+    return data[pos + 2:pos + 2 + size], pos + 2 + size
+
+
+def _matches(pattern: str, topic: str) -> bool:
+    levels = topic.split("/")
+    for i, part in enumerate(pattern.split("/")):
+        if part == "#":
+            return True
+        if i >= len(levels) or (part != "+" and part != levels[i]):
+            return False
+    return len(pattern.split("/")) == len(levels)
+
+
+class MQTTBroker:
+    """
+    Minimal MQTT broker.
+
+    Messages published by clients are passed to ``on_publish`` instead of
+    being routed to other clients, the simulator decides what to answer.
+    """
+
+    def __init__(self, access_code: str | None = None,
+                 username: str = "bblp",
+                 on_publish: PublishHandler | None = None,
+                 max_buffer: int = 1 << 20) -> None:
+        self.access_code = access_code
+        self.username = username
+        self.on_publish = on_publish
+        self.max_buffer = max_buffer
+
+        self.subscriptions: dict[str, set[asyncio.StreamWriter]] = {}
+        self.wildcards: dict[str, set[asyncio.StreamWriter]] = {}
+        self.published = 0
+        self.dropped = 0
+        self.server: asyncio.base_events.Server | None = None
+        self.port = 0
+
+    async def start(self, ssl_context: ssl.SSLContext | None,
+                    host: str = "127.0.0.1", port: int = 8883) -> None:
+        """
+        Start listening.
+
+        Args:
+            ssl_context (ssl.SSLContext | None): server TLS context, None
+                for plain TCP
+            host (str, optional): address to bind. Defaults to localhost.
+            port (int, optional): port, 0 for any. Defaults to 8883.
+        """
+        self.server = await asyncio.start_server(
+            self._session, host, port, ssl=ssl_context)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    def close(self) -> None:
+        """
+        Stop listening.
+        """
+        if self.server is not None:
+            self.server.close()
+
+    def subscriber_count(self, topic: str) -> int:
+        """
+        Get the number of clients subscribed to a topic.
+        """
+        count = len(self.subscriptions.get(topic, ()))
+        for pattern, writers in self.wildcards.items():
+            if _matches(pattern, topic):
+                count += len(writers)
+        return count
+
+    def _writers(self, topic: str) -> set[asyncio.StreamWriter]:
+        writers = self.subscriptions.get(topic, set())
+        if self.wildcards:
+            writers = set(writers)
+            for pattern, subscribed in self.wildcards.items():
+                if _matches(pattern, topic):
+                    writers |= subscribed
+        return writers
+
+    async def publish(self, topic: str, payload: bytes | dict[str, Any],
+                      drain: bool = False) -> int:
+        """
+        Publish a message to the subscribers of a topic.
+
+        Without ``drain``, messages to subscribers whose socket buffer is
+        full are dropped, as QoS 0 allows.
+
+        Args:
+            topic (str): topic
+            payload (bytes | dict[str, Any]): payload, dicts are JSON encoded
+            drain (bool, optional): wait for each subscriber to read the
+                message. Defaults to False.
+
+        Returns:
+            int: number of subscribers the message was written to
+        """
+        writers = self._writers(topic)
+        if not writers:
+            return 0
+        if isinstance(payload, dict):
+            payload = json.dumps(payload).encode()
+        encoded = topic.encode()
+        packet = _packet(PUBLISH, struct.pack(">H", len(encoded))
+                         + encoded + payload)
+
+        sent = 0
+        for writer in list(writers):
+            if writer.is_closing():
+                # Client gone while its session still handles a backlog
+                continue
+            if not drain and writer.transport.get_write_buffer_size() \
+                    > self.max_buffer:
+                self.dropped += 1
+                continue
+            writer.write(packet)
+            sent += 1
+            if drain:
+                await writer.drain()
+        self.published += sent
+        return sent
+
+    async def _read_packet(self, reader: asyncio.StreamReader
+                           ) -> tuple[int, int, bytes]:
+        first = (await reader.readexactly(1))[0]
+        length, shift = 0, 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                break
+        return first >> 4, first & 0x0F, await reader.readexactly(length)
+
+    def _check_credentials(self, body: bytes) -> bool:
+        if self.access_code is None:
+            return True
+        _, pos = _string(body, 0)          # protocol name
+        flags = body[pos + 1]
+        pos += 4                           # level, flags, keep alive
+        _, pos = _string(body, pos)        # client id
+        if flags & 0x04:                   # will topic and message
+            _, pos = _string(body, pos)
+            _, pos = _string(body, pos)
+        username = password = b""
+        if flags & 0x80:
+            username, pos = _string(body, pos)
+        if flags & 0x40:
+            password, pos = _string(body, pos)
+        return (username.decode(), password.decode()) == \
+            (self.username, self.access_code)
+
+    def _subscribe(self, writer: asyncio.StreamWriter, topic: str) -> None:
+        table = self.wildcards if "+" in topic or "#" in topic \
+            else self.subscriptions
+        table.setdefault(topic, set()).add(writer)
+
+    def _unsubscribe(self, writer: asyncio.StreamWriter, topic: str) -> None:
+        for table in (self.subscriptions, self.wildcards):
+            writers = table.get(topic)
+            if writers is not None:
+                writers.discard(writer)
+                if not writers:
+                    del table[topic]
+
+    async def _session(self, reader: asyncio.StreamReader,
+                       writer: asyncio.StreamWriter) -> None:
+        topics: set[str] = set()
+        try:
+            while True:
+                kind, flags, body = await self._read_packet(reader)
+                if kind == CONNECT:
+                    if not self._check_credentials(body):
+                        writer.write(_packet(CONNACK,
+                                             CONNACK_BAD_CREDENTIALS))
+                        await writer.drain()
+                        break
+                    writer.write(_packet(CONNACK, CONNACK_ACCEPTED))
+                elif kind == PUBLISH:
+                    await self._on_publish(writer, flags, body)
+                    # Let connection losses be processed between the
+                    # messages of a backlog
+                    await asyncio.sleep(0)
+                elif kind == SUBSCRIBE:
+                    pos, granted = 2, bytearray()
+                    while pos < len(body):
+                        topic, pos = _string(body, pos)
+                        granted.append(min(body[pos], 1))
+                        pos += 1
+                        self._subscribe(writer, topic.decode())
+                        topics.add(topic.decode())
+                    writer.write(_packet(SUBACK, body[:2] + bytes(granted)))
+                elif kind == UNSUBSCRIBE:
+                    pos = 2
+                    while pos < len(body):
+                        topic, pos = _string(body, pos)
+                        self._unsubscribe(writer, topic.decode())
+                        topics.discard(topic.decode())
+                    writer.write(_packet(UNSUBACK, body[:2]))
+                elif kind == PINGREQ:
+                    writer.write(_packet(PINGRESP, b""))
+                elif kind == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.CancelledError,
+                ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            for topic in topics:
+                self._unsubscribe(writer, topic)
+            writer.close()
+
+    async def _on_publish(self, writer: asyncio.StreamWriter, flags: int,
+                          body: bytes) -> None:
+        topic, pos = _string(body, 0)
+        if flags >> 1 & 0x03:
+            writer.write(_packet(PUBACK, body[pos:pos + 2]))
+            pos += 2
+        if self.on_publish is not None:
+            try:
+                await self.on_publish(topic.decode(), body[pos:])
+            except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
+                logging.error("Simulator failed to handle %s: %s",
+                              topic.decode(), e)
@@ -0,0 +1,171 @@
+"""
+Run many simulated printers behind one MQTT broker on one asyncio loop.
+"""
+
+import asyncio
+import json
+import logging
+import ssl
+import threading
+import time
+from typing import Any, Iterable
+
+from .broker import MQTTBroker, make_ssl_context
+from .printer import VirtualPrinter
+
+__all__ = ["SimulatedFleet"]
+
+
+class SimulatedFleet:
+    """
+    Fleet of VirtualPrinter instances served by one MQTTBroker.
+
+    All printers share one broker, each keeps its own
+    ``device/<serial>/request`` and ``device/<serial>/report`` topics, so
+    clients connect with the broker port and their printer serial. A
+    single task advances every printer, so thousands of printers cost one
+    loop iteration per tick rather than one task each.
+    """
+
+    def __init__(self, serials: Iterable[str] = (),
+                 access_code: str | None = None,
+                 report_interval: float = 1.0,
+                 speedup: float = 1.0,
+                 **printer_options: Any) -> None:
+        """
+        Args:
+            serials (Iterable[str], optional): printers to create
+            access_code (str | None, optional): access code the clients must
+                use, None accepts any. Defaults to None.
+            report_interval (float, optional): seconds between incremental
+                reports of each printer, 0 to only answer commands.
+                Defaults to 1.0.
+            speedup (float, optional): simulated seconds per real second.
+                Defaults to 1.0.
+            printer_options: keyword arguments passed to VirtualPrinter
+        """
+        self.printer_options = printer_options
+        self.printers: dict[str, VirtualPrinter] = {}
+        for serial in serials:
+            self.add_printer(serial)
+
+        self.report_interval = report_interval
+        self.speedup = speedup
+        self.broker = MQTTBroker(access_code=access_code,
+                                 on_publish=self._on_publish)
+        self.commands_received = 0
+
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+
+    def add_printer(self, serial: str) -> VirtualPrinter:
+        """
+        Add a printer to the fleet.
+
+        Args:
+            serial (str): printer serial
+
+        Returns:
+            VirtualPrinter: the new printer
+        """
+        printer = VirtualPrinter(serial, **self.printer_options)
+        self.printers[serial] = printer
+        return printer
+
+    async def _on_publish(self, topic: str, payload: bytes) -> None:
+        parts = topic.split("/")
+        if len(parts) != 3 or parts[0] != "device" or parts[2] != "request":
+            return
+        printer = self.printers.get(parts[1])
+        if printer is None:
+            return
+        self.commands_received += 1
+        report_topic = f"device/{printer.serial}/report"
+        for answer in printer.handle_command(json.loads(payload)):
+            await self.broker.publish(report_topic, answer)
+
+    async def _run(self) -> None:
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(self.report_interval)
+            now = time.monotonic()
+            dt, last = (now - last) * self.speedup, now
+            for printer in list(self.printers.values()):
+                printer.tick(dt)
+                topic = f"device/{printer.serial}/report"
+                if not self.broker.subscriber_count(topic):
+                    continue
+                report = printer.report()
+                if report is not None:
+                    await self.broker.publish(topic, report)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8883,
+                    ssl_context: ssl.SSLContext | None = None) -> None:
+        """
+        Start the broker and the simulation on the running loop.
+
+        Args:
+            host (str, optional): address to bind. Defaults to localhost.
+            port (int, optional): broker port, 0 for any. Defaults to 8883.
+            ssl_context (ssl.SSLContext | None, optional): server TLS
+                context. Defaults to a self-signed certificate.
+        """
+        await self.broker.start(ssl_context or make_ssl_context(),
+                                host, port)
+        if self.report_interval > 0:
+            self._task = asyncio.create_task(self._run())
+        logging.info("Simulating %d printers on %s:%d",
+                     len(self.printers), host, self.broker.port)
+
+    async def stop(self) -> None:
+        """
+        Stop the simulation and the broker.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.broker.close()
+
+    def start_in_thread(self, host: str = "127.0.0.1", port: int = 8883,
+                        ssl_context: ssl.SSLContext | None = None) -> None:
+        """
+        Run the fleet on a new event loop in a daemon thread, for use from
+        synchronous code such as tests.
+        """
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        daemon=True)
+        self._thread.start()
+        self.call(self.start(host, port, ssl_context))
+
+    def call(self, coro: Any, timeout: float | None = None) -> Any:
+        """
+        Run a coroutine on the fleet thread and wait for its result.
+        """
+        if self._loop is None:
+            raise RuntimeError("Fleet is not running in a thread")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop) \
+            .result(timeout)
+
+    def stop_thread(self) -> None:
+        """
+        Stop a fleet started with start_in_thread.
+        """
+        if self._loop is None:
+            return
+
+        async def shutdown() -> None:
+            await self.stop()
+            tasks = [t for t in asyncio.all_tasks()
+                     if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.call(shutdown())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(5)
+        self._loop.close()
+        self._loop = self._thread = None
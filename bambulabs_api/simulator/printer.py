@@ -0,0 +1,350 @@
+"""
+State machine of a simulated printer.
+"""
+
+import copy
+import random
+import re
+from typing import Any
+
+from bambulabs_api.states_info import GcodeState, PrintStatus
+
+__all__ = ["VirtualPrinter"]
+
+SPEED_LEVELS = {1: 50, 2: 100, 3: 124, 4: 166}
+AMBIENT = 25.0
+
+# Stages run before printing, with their duration in seconds.
+PREPARE_STAGES = (
+    (PrintStatus.HOMING_TOOLHEAD, 10.0),
+    (PrintStatus.HEATBED_PREHEATING, 0.0),
+    (PrintStatus.AUTO_BED_LEVELING, 30.0),
+    (PrintStatus.HEATING_HOTEND, 0.0),
+    (PrintStatus.CLEANING_NOZZLE_TIP, 10.0),
+)
+
+_GCODE_TEMP = re.compile(r"^(M104|M109|M140|M190)\b.*?\bS(-?\d+(?:\.\d+)?)",
+                         re.IGNORECASE)
+
+
+def _tray(index: int, color: str) -> dict[str, Any]:
+    return {
+        "id": str(index), "remain": 80, "k": 0.02, "n": 1,
+        "tag_uid": "0000000000000000", "tray_id_name": "A00-W1",
+        "tray_info_idx": "GFA00", "tray_type": "PLA",
+        "tray_sub_brands": "PLA Basic", "tray_color": f"{color}FF",
+        "tray_weight": "1000", "tray_diameter": "1.75", "tray_temp": "55",
+        "tray_time": "8", "bed_temp_type": "1", "bed_temp": "35",
+        "nozzle_temp_max": "230", "nozzle_temp_min": "190",
+        "xcam_info": "000000000000000000000000",
+        "tray_uuid": "00000000000000000000000000000000",
+    }
+
+
+class VirtualPrinter:
+    """
+    Simulated printer answering the commands sent by PrinterMQTTClient.
+
+    The printer is advanced with :meth:`tick`. Temperatures move towards
+    their targets (set by ``M104``/``M140`` gcode lines and by the print
+    preparation), a print goes through the preparation stages, then
+    through its layers, and ends in ``FINISH``.
+    """
+
+    def __init__(self, serial: str, print_duration: float = 600.0,
+                 total_layers: int = 200, heat_rate: float = 2.0,
+                 seed: int | None = None) -> None:
+        self.serial = serial
+        self.print_duration = print_duration
+        self.default_layers = total_layers
+        self.heat_rate = heat_rate
+        self._random = random.Random(seed)
+        self.sequence = 0
+
+        self.gcode_state = GcodeState.IDLE
+        self.stage = PrintStatus.IDLE
+        self._stage_index = -1
+        self._stage_time = 0.0
+        self._elapsed = 0.0
+
+        self.nozzle_temper = self.bed_temper = AMBIENT
+        self.chamber_temper = AMBIENT
+        self.nozzle_target_temper = self.bed_target_temper = 0.0
+        self.print_nozzle_temp = 220.0
+        self.print_bed_temp = 55.0
+
+        self.layer_num = 0
+        self.total_layer_num = 0
+        self.mc_percent = 0
+        self.spd_lvl = 2
+        self.gcode_file = ""
+        self.subtask_name = ""
+        self.skipped_objects: list[int] = []
+        self.light_mode = "on"
+
+        colors = ("FFFFFF", "000000", "FF0000", "0000FF")
+        self.ams = {
+            "ams": [{"id": "0", "humidity": "4", "temp": "24.5",
+                     "tray": [_tray(i, c) for i, c in enumerate(colors)]}],
+            "ams_exist_bits": "1", "tray_exist_bits": "f",
+            "tray_now": "255", "tray_tar": "255", "version": 1,
+        }
+        self.vt_tray = {**_tray(0, "FFFFFF"), "id": "254"}
+
+        self._last_sent: dict[str, Any] = {}
+
+    # State
+
+    def state(self) -> dict[str, Any]:
+        """
+        Get the scalar report fields describing the current state.
+
+        Returns:
+            dict[str, Any]: report fields
+        """
+        remaining = 0
+        if self.gcode_state in (GcodeState.RUNNING, GcodeState.PAUSE):
+            remaining = round(self.print_duration * (1 - self.mc_percent
+                                                     / 100) / 60)
+        return {
+            "gcode_state": self.gcode_state.value,
+            "stg_cur": self.stage.value if self.stage.value is not None
+            else -1,
+            "mc_percent": self.mc_percent,
+            "mc_remaining_time": remaining,
+            "layer_num": self.layer_num,
+            "total_layer_num": self.total_layer_num,
+            "nozzle_temper": round(self.nozzle_temper, 1),
+            "nozzle_target_temper": self.nozzle_target_temper,
+            "bed_temper": round(self.bed_temper, 1),
+            "bed_target_temper": self.bed_target_temper,
+            "chamber_temper": round(self.chamber_temper, 1),
+            "spd_lvl": self.spd_lvl,
+            "spd_mag": SPEED_LEVELS.get(self.spd_lvl, 100),
+            "gcode_file": self.gcode_file,
+            "subtask_name": self.subtask_name,
+            "s_obj": list(self.skipped_objects),
+            "lights_report": [{"node": "chamber_light",
+                               "mode": self.light_mode}],
+            "cooling_fan_speed": "15" if self.gcode_state
+            == GcodeState.RUNNING else "0",
+            "heatbreak_fan_speed": "15" if self.nozzle_temper > 50 else "0",
+            "wifi_signal": f"-{self._random.randint(38, 60)}dBm",
+        }
+
+    def _next_sequence(self) -> str:
+        self.sequence += 1
+        return str(self.sequence)
+
+    def full_report(self) -> dict[str, Any]:
+        """
+        Build a full report, as sent in answer to ``pushall``.
+
+        Returns:
+            dict[str, Any]: report document
+        """
+        state = self.state()
+        self._last_sent = copy.deepcopy(state)
+        return {"print": {
+            **state,
+            "ams": copy.deepcopy(self.ams),
+            "vt_tray": dict(self.vt_tray),
+            "upgrade_state": {"sequence_id": 0, "status": "IDLE",
+                              "new_version_state": 2, "new_ver_list": []},
+            "ipcam": {"ipcam_dev": "1", "ipcam_record": "enable",
+                      "timelapse": "disable", "resolution": "1080p"},
+            "xcam": {"first_layer_inspector": True,
+                     "spaghetti_detector": True,
+                     "print_halt": True},
+            "hms": [],
+            "nozzle_diameter": "0.4",
+            "nozzle_type": "stainless_steel",
+            "command": "push_status", "msg": 0,
+            "sequence_id": self._next_sequence(),
+        }}
+
+    def report(self) -> dict[str, Any] | None:
+        """
+        Build an incremental report of the fields changed since the last
+        report.
+
+        Returns:
+            dict[str, Any] | None: report document, None if nothing changed
+        """
+        state = self.state()
+        delta = {k: v for k, v in state.items()
+                 if k != "wifi_signal" and self._last_sent.get(k) != v}
+        if not delta:
+            return None
+        self._last_sent.update(copy.deepcopy(delta))
+        return {"print": {**delta, "wifi_signal": state["wifi_signal"],
+                          "command": "push_status", "msg": 1,
+                          "sequence_id": self._next_sequence()}}
+
+    # Simulation
+
+    def _approach(self, current: float, target: float, dt: float) -> float:
+        goal = target if target > 0 else AMBIENT
+        step = self.heat_rate * dt if goal > current \
+            else max(self.heat_rate / 2 * dt, (current - goal) * 0.02 * dt)
+        if abs(goal - current) <= step:
+            return goal
+        return current + step if goal > current else current - step
+
+    def _at_temperature(self) -> bool:
+        return abs(self.nozzle_temper - self.nozzle_target_temper) < 1 \
+            and abs(self.bed_temper - self.bed_target_temper) < 1
+
+    def tick(self, dt: float) -> None:
+        """
+        Advance the simulation.
+
+        Args:
+            dt (float): simulated seconds elapsed
+        """
+        self.nozzle_temper = self._approach(
+            self.nozzle_temper, self.nozzle_target_temper, dt * 3)
+        self.bed_temper = self._approach(
+            self.bed_temper, self.bed_target_temper, dt)
+        self.chamber_temper = self._approach(
+            self.chamber_temper,
+            AMBIENT + (self.bed_temper - AMBIENT) / 5, dt / 10)
+
+        if self.gcode_state == GcodeState.PREPARE:
+            self._tick_prepare(dt)
+        elif self.gcode_state == GcodeState.RUNNING:
+            self._tick_print(dt)
+
+    def _tick_prepare(self, dt: float) -> None:
+        self._stage_time += dt
+        stage, duration = PREPARE_STAGES[self._stage_index]
+        if stage == PrintStatus.HEATBED_PREHEATING:
+            done = abs(self.bed_temper - self.bed_target_temper) < 1
+        elif stage == PrintStatus.HEATING_HOTEND:
+            done = self._at_temperature()
+        else:
+            done = self._stage_time >= duration
+        if not done:
+            return
+
+        self._stage_index += 1
+        self._stage_time = 0.0
+        if self._stage_index < len(PREPARE_STAGES):
+            self.stage = PREPARE_STAGES[self._stage_index][0]
+            if self.stage == PrintStatus.HEATING_HOTEND:
+                self.nozzle_target_temper = self.print_nozzle_temp
+        else:
+            self.gcode_state = GcodeState.RUNNING
+            self.stage = PrintStatus.PRINTING
+            self.layer_num = 1
+
+    def _tick_print(self, dt: float) -> None:
+        self._elapsed += dt * SPEED_LEVELS.get(self.spd_lvl, 100) / 100
+        progress = min(1.0, self._elapsed / self.print_duration)
+        self.mc_percent = int(progress * 100)
+        self.layer_num = max(1, int(progress * self.total_layer_num))
+        if progress >= 1.0:
+            self._end(GcodeState.FINISH)
+
+    def _end(self, state: GcodeState) -> None:
+        self.gcode_state = state
+        self.stage = PrintStatus.IDLE
+        self.nozzle_target_temper = self.bed_target_temper = 0.0
+
+    def start_print(self, filename: str, total_layers: int | None = None
+                    ) -> None:
+        """
+        Start a print, as the ``project_file`` command does.
+
+        Args:
+            filename (str): file name
+            total_layers (int | None, optional): number of layers.
+                Defaults to the printer default.
+        """
+        self.gcode_state = GcodeState.PREPARE
+        self._stage_index = 0
+        self._stage_time = 0.0
+        self._elapsed = 0.0
+        self.stage = PREPARE_STAGES[0][0]
+        self.mc_percent = 0
+        self.layer_num = 0
+        self.total_layer_num = total_layers or self.default_layers
+        self.gcode_file = self.subtask_name = filename
+        self.skipped_objects = []
+        self.bed_target_temper = self.print_bed_temp
+
+    # Commands
+
+    def _gcode(self, lines: str) -> None:
+        for line in lines.splitlines():
+            match = _GCODE_TEMP.match(line.strip())
+            if match is None:
+                continue
+            value = float(match.group(2))
+            if match.group(1).upper() in ("M104", "M109"):
+                self.nozzle_target_temper = value
+            else:
+                self.bed_target_temper = value
+
+    def handle_command(self, doc: dict[str, Any]) -> list[dict[str, Any]]:
+        """
+        Apply a command published to the printer request topic.
+
+        Args:
+            doc (dict[str, Any]): command payload
+
+        Returns:
+            list[dict[str, Any]]: report documents to send in answer
+        """
+        if doc.get("pushing", {}).get("command") == "pushall":
+            return [self.full_report()]
+
+        if "system" in doc:
+            command = doc["system"]
+            if "led_mode" in command:
+                self.light_mode = command["led_mode"]
+            return [{"system": {**command, "result": "success",
+                                "sequence_id": self._next_sequence()}}]
+
+        command = doc.get("print")
+        if not isinstance(command, dict):
+            return []
+
+        name = command.get("command")
+        result = "success"
+        if name == "project_file":
+            if self.gcode_state in (GcodeState.PREPARE, GcodeState.RUNNING,
+                                    GcodeState.PAUSE):
+                result = "failed"
+            else:
+                self.start_print(str(command.get("subtask_name", "")))
+        elif name == "stop":
+            if self.gcode_state in (GcodeState.PREPARE, GcodeState.RUNNING,
+                                    GcodeState.PAUSE):
+                self._end(GcodeState.FAILED)
+        elif name == "pause":
+            if self.gcode_state == GcodeState.RUNNING:
+                self.gcode_state = GcodeState.PAUSE
+                self.stage = PrintStatus.PAUSED_USER
+        elif name == "resume":
+            if self.gcode_state == GcodeState.PAUSE:
+                self.gcode_state = GcodeState.RUNNING
+                self.stage = PrintStatus.PRINTING
+        elif name == "gcode_line":
+            self._gcode(str(command.get("param", "")))
+        elif name == "print_speed":
+            self.spd_lvl = int(command.get("param", self.spd_lvl))
+        elif name == "skip_objects":
+            self.skipped_objects.extend(command.get("obj_list") or [])
+        elif name == "ams_filament_setting":
+            if command.get("ams_id") == 255:
+                self.vt_tray.update(
+                    {k: command[k] for k in ("tray_info_idx", "tray_color",
+                                             "tray_type") if k in command})
+        reply = {**command, "result": result,
+                 "sequence_id": self._next_sequence()}
+        answers = [{"print": reply}]
+        report = self.report()
+        if report is not None:
+            answers.append(report)
+        return answers
@@ -0,0 +1,232 @@
+"""
+Snapshot of the printer states for warm restarts.
+
+The last known state of every printer of a fleet is checkpointed to one
+gzip compressed JSON file. On startup the states are restored and marked
+stale, so getters answer immediately, and the printers are asked for a full
+report one after the other over a refresh period instead of all at once.
+"""
+
+import gzip
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Iterable
+
+from bambulabs_api import codec
+
+__all__ = ["StateStore"]
+
+_VERSION = 1
+
+
+def _client(printer: Any) -> Any:
+    return getattr(printer, "mqtt_client", printer)
+
+
+class StateStore:
+    """
+    Checkpoints the state of a group of printers to a file.
+    """
+
+    def __init__(self, path: str | os.PathLike,
+                 printers: Iterable[Any] = (),
+                 interval: float = 60.0,
+                 compresslevel: int = 6) -> None:
+        """
+        Args:
+            path (str | os.PathLike): snapshot file
+            printers (Iterable[Printer | PrinterMQTTClient], optional):
+                printers to checkpoint, such as a Fleet
+            interval (float, optional): seconds between checkpoints once
+                started. Defaults to 60.
+            compresslevel (int, optional): gzip level. Defaults to 6.
+        """
+        if interval <= 0:
+            raise ValueError("Checkpoint interval must be positive")
+        self.path = os.fspath(path)
+        self.interval = interval
+        self.compresslevel = compresslevel
+        self._clients: dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._saved_at = 0.0
+        for printer in printers:
+            self.add(printer)
+
+    def add(self, printer: Any) -> None:
+        """
+        Add a printer.
+
+        Args:
+            printer (Printer | PrinterMQTTClient): printer
+        """
+        client = _client(printer)
+        with self._lock:
+            self._clients[client.serial] = client
+
+    def remove(self, serial: str) -> None:
+        """
+        Remove a printer, its state is dropped from the next checkpoints.
+
+        Args:
+            serial (str): printer serial
+        """
+        with self._lock:
+            self._clients.pop(serial, None)
+
+    def load(self) -> dict[str, tuple[dict[str, Any], float]]:
+        """
+        Read the snapshot file.
+
+        Returns:
+            dict[str, tuple[dict[str, Any], float]]: state and last report
+                time by serial, empty if there is no readable snapshot
+        """
+        try:
+            with gzip.open(self.path, "rb") as fp:
+                doc = codec.loads(fp.read())
+        except FileNotFoundError:
+            return {}
+        except (OSError, EOFError, ValueError) as e:
+            logging.warning("Ignoring unreadable state snapshot %s: %s",
+                            self.path, e)
+            return {}
+        if not isinstance(doc, dict) or doc.get("version") != _VERSION:
+            logging.warning("Ignoring state snapshot %s of another version",
+                            self.path)
+            return {}
+        return {serial: (entry["data"], entry["time"])
+                for serial, entry in doc.get("printers", {}).items()}
+
+    def restore(self) -> list[str]:
+        """
+        Restore the saved states into the printers, marked stale.
+
+        Returns:
+            list[str]: serials of the restored printers
+        """
+        states = self.load()
+        with self._lock:
+            clients = list(self._clients.values())
+        restored = []
+        for client in clients:
+            state = states.get(client.serial)
+            if state is not None and client.restore_state(*state):
+                restored.append(client.serial)
+        logging.info("Restored %d printer states from %s", len(restored),
+                     self.path)
+        return restored
+
+    def save(self, force: bool = False) -> bool:
+        """
+        Write the printer states, unless no report arrived since the last
+        checkpoint.
+
+        Args:
+            force (bool, optional): write even if nothing changed.
+                Defaults to False.
+
+        Returns:
+            bool: True if the file was written
+        """
+        with self._lock:
+            clients = list(self._clients.values())
+        latest = max((c.last_report for c in clients), default=0.0)
+        if not force and latest <= self._saved_at:
+            return False
+
+        printers = {}
+        for client in clients:
+            data, last_report = client.state_snapshot()
+            if last_report:
+                printers[client.serial] = {"time": last_report, "data": data}
+        payload = codec.dumps({"version": _VERSION, "saved": time.time(),
+                               "printers": printers})
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(
+                    fileobj=raw, mode="wb",
+                    compresslevel=self.compresslevel) as fp:
+                fp.write(payload)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._saved_at = latest
+        return True
+
+    def refresh(self, period: float = 60.0,
+                stale_only: bool = True) -> threading.Thread:
+        """
+        Ask the printers for a full report one after the other, spread
+        evenly over a period, oldest state first.
+
+        Args:
+            period (float, optional): seconds to spread the requests over.
+                Defaults to 60.
+            stale_only (bool, optional): skip printers that reported since
+                the restore. Defaults to True.
+
+        Returns:
+            threading.Thread: the thread sending the requests
+        """
+        with self._lock:
+            clients = sorted(self._clients.values(),
+                             key=lambda c: c.last_report)
+        if stale_only:
+            clients = [c for c in clients if c.stale]
+        step = period / len(clients) if clients else 0.0
+
+        def run() -> None:
+            start = time.monotonic()
+            for i, client in enumerate(clients):
+                delay = start + i * step - time.monotonic()
+                if delay > 0 and self._stop.wait(delay):
+                    return
+                if stale_only and not client.stale:
+                    continue
+                try:
+                    client.pushall()
+                except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
+                    logging.error("Refresh of %s failed: %s",
+                                  client.serial, e)
+
+        thread = threading.Thread(target=run, name="state-refresh",
+                                  daemon=True)
+        self._threads.append(thread)
+        thread.start()
+        return thread
+
+    def start(self) -> None:
+        """
+        Checkpoint the states every interval until stop is called.
+        """
+        def run() -> None:
+            while not self._stop.wait(self.interval):
+                try:
+                    self.save()
+                except OSError as e:
+                    logging.error("State checkpoint failed: %s", e)
+
+        self._stop.clear()
+        thread = threading.Thread(target=run, name="state-checkpoint",
+                                  daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the checkpoint and refresh threads, then write a last
+        checkpoint.
+        """
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+        self.save()
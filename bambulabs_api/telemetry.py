@@ -0,0 +1,268 @@
+"""
+Fixed-memory time series buffer for numeric printer telemetry.
+"""
+
+import bisect
+import csv
+import math
+import threading
+import time
+from array import array
+from typing import Any, Iterable, TextIO
+
+__all__ = ["TelemetryBuffer", "DEFAULT_FIELDS"]
+
+DEFAULT_FIELDS = (
+    "bed_temper",
+    "bed_target_temper",
+    "nozzle_temper",
+    "nozzle_target_temper",
+    "chamber_temper",
+    "mc_percent",
+    "layer_num",
+    "spd_mag",
+    "cooling_fan_speed",
+    "big_fan1_speed",
+    "big_fan2_speed",
+    "heatbreak_fan_speed",
+)
+
+NAN = float("nan")
+
+
+class _Chronological:
+    """
+    Read-only view of a ring buffer column in chronological order, to
+    bisect it in place
+    """
+
+    def __init__(self, column: array, count: int, first: int) -> None:
+        self._column = column
+        self._count = count
+        self._first = first
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> float:
+        return self._column[(self._first + index) % len(self._column)]
+
+
+class TelemetryBuffer:
+    """
+    Ring buffer recording selected numeric report fields with timestamps.
+
+    Each field is stored in its own preallocated ``array('d')`` column, so
+    memory use is fixed at ``8 * capacity * (len(fields) + 1)`` bytes. Reports
+    are incremental, fields missing from a report keep their last value.
+    Fields that were never reported are NaN and ignored by the aggregates.
+    """
+
+    def __init__(self, fields: Iterable[str] = DEFAULT_FIELDS,
+                 capacity: int = 3600) -> None:
+        if capacity <= 0:
+            raise ValueError("Capacity must be positive")
+
+        self.fields: tuple[str, ...] = tuple(fields)
+        self.capacity = capacity
+
+        self._timestamps = array("d", [NAN]) * capacity
+        self._columns = {f: array("d", [NAN]) * capacity
+                         for f in self.fields}
+        self._last = dict.fromkeys(self.fields, NAN)
+        self._head = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def record(self, report: dict[str, Any],
+               timestamp: float | None = None) -> bool:
+        """
+        Record the tracked fields of a report.
+
+        Args:
+            report (dict[str, Any]): the "print" section of a report
+            timestamp (float | None, optional): time of the report in
+                seconds since the epoch. Defaults to now.
+
+        Returns:
+            bool: False if the report contains none of the tracked fields
+        """
+        values = {}
+        for f in self.fields:
+            if f in report:
+                try:
+                    values[f] = float(report[f])
+                except (TypeError, ValueError):
+                    pass
+        if not values:
+            return False
+
+        with self._lock:
+            self._last |= values
+            i = self._head
+            self._timestamps[i] = time.time() if timestamp is None \
+                else timestamp
+            for f, column in self._columns.items():
+                column[i] = self._last[f]
+            self._head = (i + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+        return True
+
+    def _slice(self, column: array, start: int, end: int) -> array:
+        """
+        Copy the samples start to end, in chronological order, of a column
+        """
+        first = self._head if self._count == self.capacity else 0
+        start, end = first + start, first + end
+        capacity = self.capacity
+        if end <= capacity:
+            return column[start:end]
+        if start >= capacity:
+            return column[start - capacity:end - capacity]
+        return column[start:] + column[:end - capacity]
+
+    def _window(self, since: float | None,
+                until: float | None) -> tuple[int, int]:
+        """
+        Chronological indexes of the samples between since and until,
+        found without copying the timestamps
+        """
+        timestamps = _Chronological(self._timestamps, self._count,
+                                    self._head if self._count
+                                    == self.capacity else 0)
+        start = 0 if since is None \
+            else bisect.bisect_left(timestamps, since)
+        end = len(timestamps) if until is None \
+            else bisect.bisect_right(timestamps, until)
+        return start, max(start, end)
+
+    def columns(self, since: float | None = None,
+                until: float | None = None) -> dict[str, array]:
+        """
+        Get the recorded samples as columns in chronological order.
+
+        Args:
+            since (float | None, optional): only samples at or after this
+                timestamp. Defaults to the oldest sample.
+            until (float | None, optional): only samples at or before this
+                timestamp. Defaults to the newest sample.
+
+        Returns:
+            dict[str, array]: "timestamp" and one column per field
+        """
+        with self._lock:
+            start, end = self._window(since, until)
+            result = {"timestamp": self._slice(self._timestamps, start, end)}
+            for f, column in self._columns.items():
+                result[f] = self._slice(column, start, end)
+        return result
+
+    def _values(self, field: str, since: float | None,
+                until: float | None) -> list[float]:
+        column = self._columns.get(field)
+        if column is None:
+            raise KeyError(f"Field {field} is not recorded")
+        # Only the requested column is copied
+        with self._lock:
+            values = self._slice(column, *self._window(since, until))
+        return [v for v in values if not math.isnan(v)]
+
+    def min(self, field: str, since: float | None = None,
+            until: float | None = None) -> float | None:
+        """
+        Get the minimum of a field over a time window.
+
+        Returns:
+            float | None: minimum, None if there are no samples
+        """
+        return min(self._values(field, since, until), default=None)
+
+    def max(self, field: str, since: float | None = None,
+            until: float | None = None) -> float | None:
+        """
+        Get the maximum of a field over a time window.
+
+        Returns:
+            float | None: maximum, None if there are no samples
+        """
+        return max(self._values(field, since, until), default=None)
+
+    def mean(self, field: str, since: float | None = None,
+             until: float | None = None) -> float | None:
+        """
+        Get the mean of a field over a time window.
+
+        Returns:
+            float | None: mean, None if there are no samples
+        """
+        values = self._values(field, since, until)
+        return math.fsum(values) / len(values) if values else None
+
+    def downsample(self, interval: float, since: float | None = None,
+                   until: float | None = None) -> dict[str, array]:
+        """
+        Average the samples into fixed-width time buckets.
+
+        Args:
+            interval (float): bucket width in seconds
+            since (float | None, optional): start of the window
+            until (float | None, optional): end of the window
+
+        Returns:
+            dict[str, array]: columns with one row per non-empty bucket,
+            timestamped with the start of the bucket
+        """
+        if interval <= 0:
+            raise ValueError("Interval must be positive")
+
+        data = self.columns(since, until)
+        timestamps = data["timestamp"]
+        result = {k: array("d") for k in data}
+        if not timestamps:
+            return result
+
+        origin = timestamps[0] if since is None else since
+        start = 0
+        while start < len(timestamps):
+            bucket = math.floor((timestamps[start] - origin) / interval)
+            bucket_start = origin + bucket * interval
+            end = bisect.bisect_left(timestamps, bucket_start + interval,
+                                     lo=start)
+            result["timestamp"].append(bucket_start)
+            for f in self.fields:
+                values = [v for v in data[f][start:end] if not math.isnan(v)]
+                result[f].append(math.fsum(values) / len(values)
+                                 if values else NAN)
+            start = end
+        return result
+
+    def to_csv(self, fp: TextIO, since: float | None = None,
+               until: float | None = None) -> int:
+        """
+        Write the samples to a CSV file.
+
+        Args:
+            fp (TextIO): text file to write to
+            since (float | None, optional): start of the window
+            until (float | None, optional): end of the window
+
+        Returns:
+            int: number of rows written
+        """
+        data = self.columns(since, until)
+        writer = csv.writer(fp)
+        writer.writerow(data.keys())
+        writer.writerows(zip(*data.values()))
+        return len(data["timestamp"])
+
+    def clear(self) -> None:
+        """
+        Drop all recorded samples.
+        """
+        with self._lock:
+            self._head = 0
+            self._count = 0
+            self._last = dict.fromkeys(self.fields, NAN)
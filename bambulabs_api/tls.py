@@ -0,0 +1,221 @@
+"""
+TLS settings shared by the MQTT, camera and FTP clients.
+
+All clients use the same ``ssl.SSLContext``, so hundreds of printers share
+one context instead of building one per connection. The context remembers
+the TLS session of each printer address when a connection is closed, and
+offers it again on the next connection to that address, so reconnects
+resume the session instead of running a full handshake.
+"""
+
+import ssl
+import threading
+from collections import OrderedDict
+from typing import Any
+
+__all__ = ["TLSConfig", "get_default_config", "set_default_config"]
+
+
+class _SessionSocket(ssl.SSLSocket):
+    """
+    SSLSocket saving its session to the context cache when shut down or
+    closed, whichever comes first
+    """
+    _session_key: tuple | None = None
+    _tracked = False
+
+    def _release(self) -> None:
+        if self._tracked:
+            self._tracked = False
+            self.context._closed(self._session_key, self)  # type: ignore  # noqa  # pylint: disable=protected-access
+
+    def shutdown(self, how: int) -> None:
+        self._release()
+        super().shutdown(how)
+
+    def close(self) -> None:
+        self._release()
+        super().close()
+
+
+class _SessionContext(ssl.SSLContext):
+    """
+    SSLContext resuming the last session of each peer address
+    """
+    sslsocket_class = _SessionSocket
+
+    def __init__(self, protocol: int, max_sessions: int = 4096) -> None:
+        super().__init__()
+        self.max_sessions = max_sessions
+        self.handshakes = 0
+        self.resumed = 0
+        self._sessions: OrderedDict[tuple, ssl.SSLSession] = OrderedDict()
+        self._sessions_lock = threading.Lock()
+
+    def wrap_socket(self, sock: Any, *args: Any,
+                    session: ssl.SSLSession | None = None,
+                    **kwargs: Any) -> ssl.SSLSocket:
+        # Sessions given by the caller, such as the FTP control session
+        # reused by data channels, are managed by the caller
+        key = None
+        if session is None and self.max_sessions > 0:
+            try:
+                key = tuple(sock.getpeername()[:2])
+            except OSError:
+                pass
+            if key is not None:
+                with self._sessions_lock:
+                    session = self._sessions.get(key)
+        ssl_sock = super().wrap_socket(sock, *args, session=session,
+                                       **kwargs)
+        ssl_sock._session_key = key  # type: ignore
+        ssl_sock._tracked = True  # type: ignore
+        return ssl_sock
+
+    def _closed(self, key: tuple | None, ssl_sock: ssl.SSLSocket) -> None:
+        try:
+            session = ssl_sock.session
+            reused = ssl_sock.session_reused
+        except (OSError, ValueError):
+            return
+        with self._sessions_lock:
+            if reused is not None:
+                self.handshakes += 1
+                self.resumed += bool(reused)
+            if session is None or key is None:
+                return
+            self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def clear_sessions(self) -> None:
+        with self._sessions_lock:
+            self._sessions.clear()
+
+    def session_count(self) -> int:
+        with self._sessions_lock:
+            return len(self._sessions)
+
+
+class TLSConfig:
+    """
+    TLS settings, and the context built from them on first use.
+
+    Printers use self-signed certificates, so certificates are not verified
+    unless ``verify`` is set, with ``cafile`` holding the printer CA.
+    """
+
+    def __init__(self, verify: bool = False, cafile: str | None = None,
+                 minimum_version: ssl.TLSVersion = ssl.TLSVersion.TLSv1_2,
+                 ciphers: str | None = None,
+                 session_reuse: bool = True,
+                 max_sessions: int = 4096) -> None:
+        """
+        Args:
+            verify (bool, optional): verify the printer certificates.
+                Defaults to False.
+            cafile (str | None, optional): CA certificates to verify with.
+                Defaults to the system store.
+            minimum_version (ssl.TLSVersion, optional): oldest TLS version
+                accepted. Defaults to TLS 1.2.
+            ciphers (str | None, optional): OpenSSL cipher list.
+                Defaults to the OpenSSL defaults.
+            session_reuse (bool, optional): resume TLS sessions on
+                reconnects. Defaults to True.
+            max_sessions (int, optional): sessions remembered, one per
+                printer address. Defaults to 4096.
+        """
+        if max_sessions < 0:
+            raise ValueError("max_sessions must be positive")
+        self.verify = verify
+        self.cafile = cafile
+        self.minimum_version = minimum_version
+        self.ciphers = ciphers
+        self.session_reuse = session_reuse
+        self.max_sessions = max_sessions
+        self._context: _SessionContext | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def context(self) -> ssl.SSLContext:
+        """
+        The shared SSLContext
+        """
+        context = self._context
+        if context is None:
+            with self._lock:
+                if self._context is None:
+                    self._context = self._build()
+                context = self._context
+        return context
+
+    def _build(self) -> _SessionContext:
+        context = _SessionContext(
+            ssl.PROTOCOL_TLS_CLIENT,
+            max_sessions=self.max_sessions if self.session_reuse else 0)
+        # Printer certificates are issued to the serial, not the address
+        context.check_hostname = False
+        if self.verify:
+            context.verify_mode = ssl.CERT_REQUIRED
+            if self.cafile is not None:
+                context.load_verify_locations(self.cafile)
+            else:
+                context.load_default_certs()
+        else:
+            context.verify_mode = ssl.CERT_NONE
+        context.minimum_version = self.minimum_version
+        if self.ciphers is not None:
+            context.set_ciphers(self.ciphers)
+        return context
+
+    def stats(self) -> dict[str, int]:
+        """
+        Get the handshake counters of the connections closed so far.
+
+        Returns:
+            dict[str, int]: handshakes, resumed handshakes and sessions kept
+        """
+        context = self._context
+        if context is None:
+            return {"handshakes": 0, "resumed": 0, "sessions": 0}
+        return {"handshakes": context.handshakes,
+                "resumed": context.resumed,
+                "sessions": context.session_count()}
+
+    def clear_sessions(self) -> None:
+        """
+        Forget the saved sessions, the next connections do full handshakes.
+        """
+        if self._context is not None:
+            self._context.clear_sessions()
+
+
+_default: TLSConfig | None = None
+_default_lock = threading.Lock()
+
+
+def get_default_config() -> TLSConfig:
+    """
+    Get the TLS settings used by clients created without their own.
+
+    Returns:
+        TLSConfig: the process-wide settings
+    """
+    global _default  # pylint: disable=global-statement
+    with _default_lock:
+        if _default is None:
+            _default = TLSConfig()
+        return _default
+
+
+def set_default_config(config: TLSConfig | None) -> None:
+    """
+    Replace the TLS settings used by clients created from now on.
+
+    Args:
+        config (TLSConfig | None): settings, None to restore the defaults
+    """
+    global _default  # pylint: disable=global-statement
+    with _default_lock:
+        _default = config
@@ -0,0 +1,166 @@
+"""
+Manifest of the files uploaded to each printer, keyed by content hash, so
+that identical files are not uploaded twice.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import BinaryIO
+
+__all__ = ["UploadCache", "UploadRecord", "hash_file"]
+
+_CHUNK_SIZE = 1 << 20
+
+
+@dataclass(frozen=True)
+class UploadRecord:
+    """
+    File uploaded to a printer
+    """
+    name: str
+    size: int
+    sha256: str
+    uploaded: float
+
+
+def hash_file(fp: BinaryIO) -> tuple[str, int]:
+    """
+    Hash a file from its current position, then rewind it.
+
+    Args:
+        fp (BinaryIO): seekable binary file object
+
+    Returns:
+        tuple[str, int]: sha256 hex digest and size in bytes
+    """
+    start = fp.tell()
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := fp.read(_CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    fp.seek(start)
+    return digest.hexdigest(), size
+
+
+def _file_name(path: str) -> str:
+    """
+    Name of a file relative to the printer storage, so that "/sdcard/a.3mf",
+    "/a.3mf" and "a.3mf" match.
+    """
+    name = path.lstrip("/")
+    if name.startswith("sdcard/"):
+        name = name[len("sdcard/"):]
+    return name
+
+
+class UploadCache:
+    """
+    Per-printer manifests of uploaded content.
+
+    A record only says that a file was uploaded, callers should check that
+    it is still on the printer (for example with its FTP size) before
+    skipping an upload. Manifests are kept in memory, and in
+    ``<directory>/<serial>.json`` when a directory is given.
+    """
+
+    def __init__(self, directory: str | os.PathLike | None = None) -> None:
+        """
+        Args:
+            directory (str | os.PathLike | None, optional): directory to
+                persist the manifests in. Defaults to memory only.
+        """
+        self.directory = os.fspath(directory) if directory is not None \
+            else None
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._manifests: dict[str, dict[str, UploadRecord]] = {}
+
+    def _path(self, serial: str) -> str | None:
+        if self.directory is None:
+            return None
+        return os.path.join(self.directory, f"{serial}.json")
+
+    def _manifest(self, serial: str) -> dict[str, UploadRecord]:
+        manifest = self._manifests.get(serial)
+        if manifest is not None:
+            return manifest
+        manifest = {}
+        path = self._path(serial)
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as fp:
+                for item in json.load(fp):
+                    record = UploadRecord(**item)
+                    manifest[record.sha256] = record
+        self._manifests[serial] = manifest
+        return manifest
+
+    def _save(self, serial: str) -> None:
+        path = self._path(serial)
+        if path is None:
+            return
+        records = [asdict(r) for r in self._manifests[serial].values()]
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as fp:
+            json.dump(records, fp)
+        os.replace(tmp, path)
+
+    def lookup(self, serial: str, sha256: str) -> UploadRecord | None:
+        """
+        Find content uploaded to a printer.
+
+        Args:
+            serial (str): printer serial
+            sha256 (str): content hash
+
+        Returns:
+            UploadRecord | None: the upload, None if unknown
+        """
+        with self._lock:
+            return self._manifest(serial).get(sha256)
+
+    def record(self, serial: str, sha256: str, name: str,
+               size: int) -> UploadRecord:
+        """
+        Record an upload, replacing any content previously stored under the
+        same name.
+
+        Args:
+            serial (str): printer serial
+            sha256 (str): content hash
+            name (str): file name on the printer
+            size (int): size in bytes
+
+        Returns:
+            UploadRecord: the new record
+        """
+        name = _file_name(name)
+        record = UploadRecord(name, size, sha256, time.time())
+        with self._lock:
+            manifest = self._manifest(serial)
+            for digest in [d for d, r in manifest.items() if r.name == name]:
+                del manifest[digest]
+            manifest[sha256] = record
+            self._save(serial)
+        return record
+
+    def forget(self, serial: str, name: str) -> None:
+        """
+        Drop the record of a file, for example once deleted.
+
+        Args:
+            serial (str): printer serial
+            name (str): file name on the printer
+        """
+        name = _file_name(name)
+        with self._lock:
+            manifest = self._manifest(serial)
+            for digest in [d for d, r in manifest.items() if r.name == name]:
+                del manifest[digest]
+            self._save(serial)
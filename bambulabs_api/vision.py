@@ -0,0 +1,431 @@
+"""
+Camera based print failure detection.
+
+Frames are decoded at reduced resolution, using the DCT scaling of the
+JPEG decoder (1/2, 1/4 or 1/8 of the size, for a fraction of the decode
+time), as grayscale. Each frame is compared with a reference frame taken
+at the last layer change: the share of changed pixels is computed for each
+cell of a grid, and the anomaly score is the highest cell share, after
+leaving out the few most changed cells that the toolhead covers. Spaghetti
+or a detached part change large areas between two layers, a normal layer
+barely changes the picture.
+
+All the frames of a monitoring pass are scored in one vectorized call, so
+one host can watch many cameras. Requires the ``vision`` extra
+(``pip install bambulabs_api[vision]``).
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, Callable, Iterable
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError as e:  # pragma: no cover
+    raise ImportError("bambulabs_api.vision requires numpy and Pillow, "
+                      "install the vision extra: "
+                      "pip install bambulabs_api[vision]") from e
+
+__all__ = ["AnomalyEvent", "CameraMonitor", "FailureDetector",
+           "cell_scores", "decode_frame"]
+
+
+@dataclass(frozen=True)
+class AnomalyEvent:
+    """
+    Frame of a printer that differs too much from its layer reference
+    """
+    serial: str
+    score: float
+    layer: int | None
+    timestamp: float
+    cells: tuple[tuple[float, ...], ...]
+
+
+AnomalyListener = Callable[[AnomalyEvent], None]
+
+
+def decode_frame(jpeg: bytes, scale: int = 8) -> "np.ndarray":
+    """
+    Decode a JPEG frame to grayscale at reduced resolution.
+
+    Args:
+        jpeg (bytes): JPEG data
+        scale (int, optional): size reduction, 1, 2, 4 or 8 are done by the
+            decoder. Defaults to 8.
+
+    Returns:
+        np.ndarray: float32 pixels of shape (height, width)
+    """
+    with Image.open(BytesIO(jpeg)) as image:
+        width, height = image.size
+        image.draft("L", (max(width // scale, 1), max(height // scale, 1)))
+        return np.asarray(image.convert("L"), dtype=np.float32)
+
+
+def cell_scores(frames: "np.ndarray", references: "np.ndarray",
+                grid: tuple[int, int] = (6, 8),
+                pixel_threshold: float = 0.12) -> "np.ndarray":
+    """
+    Get the share of changed pixels in each grid cell, for a batch of
+    frames.
+
+    The mean brightness of each frame is removed first, so that lighting
+    changes are not counted.
+
+    Args:
+        frames (np.ndarray): frames of shape (n, height, width)
+        references (np.ndarray): reference frames of the same shape
+        grid (tuple[int, int], optional): cells per column and per row.
+            Defaults to (6, 8).
+        pixel_threshold (float, optional): brightness difference, as a
+            share of the full range, above which a pixel has changed.
+            Defaults to 0.12.
+
+    Returns:
+        np.ndarray: changed shares of shape (n, rows, columns)
+    """
+    rows, columns = grid
+    n, height, width = frames.shape
+    cell_h, cell_w = height // rows, width // columns
+    if not cell_h or not cell_w:
+        raise ValueError(f"Frames of {width}x{height} are too small for a "
+                         f"{columns}x{rows} grid")
+    frames = frames[:, :rows * cell_h, :columns * cell_w]
+    references = references[:, :rows * cell_h, :columns * cell_w]
+    diff = (frames - frames.mean(axis=(1, 2), keepdims=True)) - \
+        (references - references.mean(axis=(1, 2), keepdims=True))
+    changed = np.abs(diff) > pixel_threshold * 255
+    return changed.reshape(n, rows, cell_h, columns, cell_w) \
+        .mean(axis=(2, 4))
+
+
+class FailureDetector:
+    """
+    Anomaly scoring of the frames of one printer against the frame taken at
+    the last layer change.
+
+    Reports are fed through on_report, register it as a report listener.
+    Frames are only scored while the printer is printing.
+    """
+
+    def __init__(self, serial: str = "",
+                 grid: tuple[int, int] = (6, 8),
+                 pixel_threshold: float = 0.12,
+                 threshold: float = 0.35,
+                 ignore_cells: int = 2,
+                 consecutive: int = 2) -> None:
+        """
+        Args:
+            serial (str, optional): printer serial, for the events
+            grid (tuple[int, int], optional): cells per column and per row.
+                Defaults to (6, 8).
+            pixel_threshold (float, optional): brightness difference above
+                which a pixel has changed. Defaults to 0.12.
+            threshold (float, optional): anomaly score, the changed share of
+                a cell, that raises an event. Defaults to 0.35.
+            ignore_cells (int, optional): most changed cells left out, the
+                toolhead moves between frames. Defaults to 2.
+            consecutive (int, optional): frames above the threshold in a row
+                before an event. Defaults to 2.
+        """
+        if not 0 <= ignore_cells < grid[0] * grid[1]:
+            raise ValueError("ignore_cells must leave at least one cell")
+        if consecutive < 1:
+            raise ValueError("consecutive must be at least 1")
+        self.serial = serial
+        self.grid = grid
+        self.pixel_threshold = pixel_threshold
+        self.threshold = threshold
+        self.ignore_cells = ignore_cells
+        self.consecutive = consecutive
+
+        self.reference: np.ndarray | None = None
+        self.layer: int | None = None
+        self.printing = False
+        self.last_score: float | None = None
+        self._streak = 0
+        self._listeners: list[AnomalyListener] = []
+
+    def add_listener(self, listener: AnomalyListener) -> None:
+        """
+        Get notified of the anomalies.
+
+        Args:
+            listener (Callable[[AnomalyEvent], None]): called with each
+                event
+        """
+        self._listeners.append(listener)
+
+    def on_report(self, report: dict[str, Any]) -> None:
+        """
+        Report listener following the print state and the layer changes.
+
+        Args:
+            report (dict[str, Any]): the "print" section of a report
+        """
+        state = report.get("gcode_state")
+        if state is not None:
+            printing = state == "RUNNING"
+            if printing != self.printing:
+                self.printing = printing
+                self.reset()
+        layer = report.get("layer_num")
+        if layer is not None and layer != self.layer:
+            self.layer = layer
+            # The next frame becomes the reference
+            self.reference = None
+
+    def reset(self) -> None:
+        """
+        Drop the reference frame and the anomaly streak.
+        """
+        self.reference = None
+        self.last_score = None
+        self._streak = 0
+
+    def wants_frame(self) -> bool:
+        """
+        Whether a frame would be used, to skip decoding otherwise
+        """
+        return self.printing
+
+    def score(self, cells: "np.ndarray") -> float:
+        """
+        Get the anomaly score of the cell scores of a frame.
+
+        Args:
+            cells (np.ndarray): changed share of each cell
+
+        Returns:
+            float: the highest share once the ignored cells are left out
+        """
+        ranked = np.sort(cells, axis=None)
+        return float(ranked[-1 - self.ignore_cells])
+
+    def update(self, frame: "np.ndarray",
+               cells: "np.ndarray | None" = None,
+               timestamp: float | None = None) -> AnomalyEvent | None:
+        """
+        Score a decoded frame, or take it as the reference.
+
+        Args:
+            frame (np.ndarray): grayscale frame
+            cells (np.ndarray | None, optional): cell scores of the frame
+                already computed in a batch. Defaults to None.
+            timestamp (float | None, optional): frame time. Defaults to
+                now.
+
+        Returns:
+            AnomalyEvent | None: the event raised by the frame, if any
+        """
+        if not self.printing:
+            return None
+        if self.reference is None or self.reference.shape != frame.shape:
+            self.reference = frame
+            self._streak = 0
+            return None
+        if cells is None:
+            cells = cell_scores(frame[None], self.reference[None],
+                                self.grid, self.pixel_threshold)[0]
+        self.last_score = score = self.score(cells)
+        if score < self.threshold:
+            self._streak = 0
+            return None
+        self._streak += 1
+        if self._streak != self.consecutive:
+            return None
+        event = AnomalyEvent(self.serial, score, self.layer,
+                             timestamp or time.time(),
+                             tuple(tuple(row) for row in cells.tolist()))
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
+                logging.error("Anomaly listener failed: %s", e)
+        return event
+
+
+class CameraMonitor:
+    """
+    Samples the camera frames of a group of printers and runs their failure
+    detectors.
+
+    Frames are decoded in a thread pool, Pillow releases the GIL while
+    decoding, and the frames of each pass are scored in one batch.
+    """
+
+    def __init__(self, printers: Iterable[Any] = (),
+                 interval: float = 2.0,
+                 scale: int = 8,
+                 workers: int = 4,
+                 **detector_options: Any) -> None:
+        """
+        Args:
+            printers (Iterable[Printer], optional): printers to watch, their
+                camera clients must be started
+            interval (float, optional): seconds between two frames analysed
+                per printer. Defaults to 2.
+            scale (int, optional): decoding size reduction. Defaults to 8.
+            workers (int, optional): decoding threads. Defaults to 4.
+            detector_options: keyword arguments passed to FailureDetector
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        self.interval = interval
+        self.scale = scale
+        self.detector_options = detector_options
+        self.detectors: dict[str, FailureDetector] = {}
+        self.analysed = 0
+        self._cameras: dict[str, Any] = {}
+        self._clients: dict[str, Any] = {}
+        self._seen: dict[str, Any] = {}
+        self._listeners: list[AnomalyListener] = []
+        self.workers = workers
+        # Built on first use, and again after stop()
+        self._executor: ThreadPoolExecutor | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        for printer in printers:
+            self.add(printer)
+
+    def add_listener(self, listener: AnomalyListener) -> None:
+        """
+        Get notified of the anomalies of every printer.
+
+        Args:
+            listener (Callable[[AnomalyEvent], None]): called with each
+                event, from the monitor thread
+        """
+        self._listeners.append(listener)
+
+    def _emit(self, event: AnomalyEvent) -> None:
+        for listener in self._listeners:
+            listener(event)
+
+    def add(self, printer: Any) -> FailureDetector:
+        """
+        Watch a printer.
+
+        Args:
+            printer (Printer): printer
+
+        Returns:
+            FailureDetector: the detector of the printer
+        """
+        client = getattr(printer, "mqtt_client", printer)
+        serial = client.serial
+        detector = FailureDetector(serial, **self.detector_options)
+        detector.add_listener(self._emit)
+        client.add_report_listener(detector.on_report)
+        self.detectors[serial] = detector
+        self._clients[serial] = client
+        self._cameras[serial] = printer.camera_client
+        return detector
+
+    def remove(self, serial: str) -> None:
+        """
+        Stop watching a printer.
+
+        Args:
+            serial (str): printer serial
+        """
+        detector = self.detectors.pop(serial, None)
+        if detector is not None:
+            self._clients.pop(serial).remove_report_listener(
+                detector.on_report)
+            self._cameras.pop(serial, None)
+            self._seen.pop(serial, None)
+
+    def tick(self) -> list[AnomalyEvent]:
+        """
+        Analyse the new frame of every printer that is printing.
+
+        Returns:
+            list[AnomalyEvent]: events raised by the pass
+        """
+        executor = self._executor
+        if executor is None:
+            executor = self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="vision")
+        # Printers may be removed by other threads during the pass
+        detectors = dict(self.detectors)
+        jobs = {}
+        for serial, detector in detectors.items():
+            camera = self._cameras.get(serial)
+            frame = camera.last_frame if camera is not None else None
+            if frame is None or frame is self._seen.get(serial) or \
+                    not detector.wants_frame():
+                continue
+            self._seen[serial] = frame
+            jobs[serial] = executor.submit(decode_frame, bytes(frame),
+                                           self.scale)
+
+        decoded = {}
+        for serial, job in jobs.items():
+            try:
+                decoded[serial] = job.result()
+            except (OSError, ValueError) as e:
+                logging.warning("Undecodable frame from %s: %s", serial, e)
+
+        # Score the frames with a reference of the same size in one batch.
+        # The references are read once, layer changes reset them from the
+        # MQTT threads
+        scored: dict[tuple[int, ...], list[str]] = {}
+        references = {}
+        for serial, frame in decoded.items():
+            reference = detectors[serial].reference
+            if reference is not None and reference.shape == frame.shape:
+                references[serial] = reference
+                scored.setdefault(frame.shape, []).append(serial)
+        cells = {}
+        for serials in scored.values():
+            first = detectors[serials[0]]
+            batch = cell_scores(
+                np.stack([decoded[s] for s in serials]),
+                np.stack([references[s] for s in serials]),
+                first.grid, first.pixel_threshold)
+            cells.update(zip(serials, batch))
+
+        events = []
+        now = time.time()
+        for serial, frame in decoded.items():
+            event = detectors[serial].update(frame, cells.get(serial), now)
+            if event is not None:
+                events.append(event)
+        self.analysed += len(decoded)
+        return events
+
+    def start(self) -> None:
+        """
+        Analyse the frames every interval from a background thread.
+        """
+        def run() -> None:
+            while not self._stop.wait(self.interval):
+                try:
+                    self.tick()
+                except Exception as e:  # noqa  # pylint: disable=broad-exception-caught
+                    logging.error("Camera analysis failed: %s", e)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="camera-monitor",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the background analysis and the decoding threads, the monitor
+        can be started again.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,5 @@
+"""
+Benchmarks for the bambulabs_api clients against local stand-in printers.
+
+Run with ``python -m benchmarks.run --help``.
+"""
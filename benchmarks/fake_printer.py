@@ -0,0 +1,317 @@
+"""
+Local stand-ins for the services of a Bambu Lab printer.
+
+* MQTT: a :class:`~bambulabs_api.simulator.SimulatedFleet`, whose broker
+  answers ``pushall`` and commands for every simulated printer, plus
+  :func:`emit_reports` to flood the clients with report traffic.
+* FakeFTPServer: an implicit FTPS server (TLS from the first byte, as on
+  port 990) supporting the commands used by ``PrinterFTPClient``.
+* FakeCamera: a TLS server speaking the camera protocol, an 80 byte auth
+  packet followed by 16 byte headers and JPEG payloads.
+
+All servers run on one asyncio loop in a background thread, see
+:class:`FakePrinterEnv`.
+"""
+
+import asyncio
+import os
+import random
+import ssl
+import struct
+import threading
+import time
+from typing import Any
+
+from bambulabs_api.simulator import SimulatedFleet, make_ssl_context
+
+ACCESS_CODE = "12345678"
+USERNAME = "bblp"
+
+
+def incremental_report(sequence: int, t: float) -> dict[str, Any]:
+    """
+    Build a small incremental report as sent between full reports.
+
+    Args:
+        sequence (int): report sequence id
+        t (float): time used to vary the values
+
+    Returns:
+        dict[str, Any]: the report document
+    """
+    return {"print": {
+        "nozzle_temper": round(219.5 + random.random(), 2),
+        "bed_temper": round(54.8 + random.random() / 2, 2),
+        "mc_percent": int(t) % 100,
+        "mc_remaining_time": 100 - int(t) % 100,
+        "layer_num": int(t) % 290,
+        "wifi_signal": "-44dBm",
+        "command": "push_status", "msg": 1, "sequence_id": str(sequence),
+    }}
+
+
+async def emit_reports(fleet: SimulatedFleet, serials: list[str],
+                       rate: float, duration: float) -> int:
+    """
+    Flood the clients with incremental reports.
+
+    Args:
+        fleet (SimulatedFleet): fleet whose broker publishes the reports
+        serials (list[str]): printers to emit for
+        rate (float): reports per second per printer, 0 to emit as
+            fast as the subscribers read them
+        duration (float): seconds to emit for
+
+    Returns:
+        int: number of reports delivered
+    """
+    end = time.monotonic() + duration
+    delivered = 0
+    sequence = 0
+    while time.monotonic() < end:
+        tick = time.monotonic()
+        for serial in serials:
+            sequence += 1
+            delivered += await fleet.broker.publish(
+                f"device/{serial}/report",
+                incremental_report(sequence, tick),
+                drain=rate == 0)
+        if rate:
+            await asyncio.sleep(max(0.0, 1 / rate
+                                    - (time.monotonic() - tick)))
+    return delivered
+
+
+class FakeFTPServer:
+    """
+    Implicit FTPS server storing uploads in memory (sizes only).
+    """
+
+    def __init__(self) -> None:
+        self.files: dict[str, int] = {}
+        self.bytes_received = 0
+        self.server: asyncio.base_events.Server | None = None
+        self.port = 0
+        self._ssl_context: ssl.SSLContext | None = None
+        self._host = "127.0.0.1"
+
+    async def start(self, ssl_context: ssl.SSLContext,
+                    host: str = "127.0.0.1", port: int = 0) -> None:
+        self._ssl_context = ssl_context
+        self._host = host
+        self.server = await asyncio.start_server(
+            self._session, host, port, ssl=ssl_context)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def _passive(self) -> tuple[asyncio.base_events.Server,
+                                      asyncio.Future]:
+        done: asyncio.Future = asyncio.get_running_loop().create_future()
+
+        async def receive(reader: asyncio.StreamReader,
+                          writer: asyncio.StreamWriter) -> None:
+            size = 0
+            try:
+                while chunk := await reader.read(1 << 16):
+                    size += len(chunk)
+            except (asyncio.CancelledError, ConnectionError, ssl.SSLError):
+                pass
+            finally:
+                writer.close()
+                if not done.done():
+                    done.set_result(size)
+
+        server = await asyncio.start_server(receive, self._host, 0,
+                                            ssl=self._ssl_context)
+        return server, done
+
+    async def _session(self, reader: asyncio.StreamReader,
+                       writer: asyncio.StreamWriter) -> None:
+        def reply(line: str) -> None:
+            writer.write(f"{line}\r\n".encode())
+
+        data: tuple[asyncio.base_events.Server, asyncio.Future] | None = None
+        reply("220 Fake printer FTPS ready")
+        try:
+            while line := await reader.readline():
+                cmd, _, arg = line.decode().strip().partition(" ")
+                cmd = cmd.upper()
+                if cmd == "USER":
+                    reply("331 Password required")
+                elif cmd == "PASS":
+                    reply("230 Logged in" if arg == ACCESS_CODE
+                          else "530 Login incorrect")
+                elif cmd in ("PBSZ", "PROT", "TYPE", "NOOP"):
+                    reply("200 OK")
+                elif cmd == "PWD":
+                    reply('257 "/"')
+                elif cmd == "CWD":
+                    reply("250 OK")
+                elif cmd == "PASV":
+                    data = await self._passive()
+                    port = data[0].sockets[0].getsockname()[1]
+                    reply("227 Entering Passive Mode "
+                          f"(127,0,0,1,{port >> 8},{port & 0xFF})")
+                elif cmd == "STOR" and data is not None:
+                    reply("150 Opening data connection")
+                    await writer.drain()
+                    server, done = data
+                    size = await done
+                    server.close()
+                    data = None
+                    self.files[arg] = size
+                    self.bytes_received += size
+                    reply("226 Transfer complete")
+                elif cmd == "SIZE":
+                    reply(f"213 {self.files[arg]}" if arg in self.files
+                          else "550 No such file")
+                elif cmd == "DELE":
+                    reply("250 Deleted" if self.files.pop(arg, None)
+                          is not None else "550 No such file")
+                elif cmd == "QUIT":
+                    reply("221 Bye")
+                    break
+                else:
+                    reply("502 Command not implemented")
+                await writer.drain()
+        except (asyncio.CancelledError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+
+
+def fake_jpeg(size: int, width: int = 1280, height: int = 720) -> bytes:
+    """
+    Build a payload with JPEG start and end markers and a start of frame
+    segment, followed by random scan data.
+
+    Args:
+        size (int): payload size in bytes, at least 41
+        width (int, optional): frame width. Defaults to 1280.
+        height (int, optional): frame height. Defaults to 720.
+
+    Returns:
+        bytes: the payload
+    """
+    app0 = b"\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    sof0 = b"\xff\xc0\x00\x11\x08" + struct.pack(">HHB", height, width, 3) \
+        + b"\x01\x22\x00\x02\x11\x01\x03\x11\x01"
+    header = b"\xff\xd8" + app0 + sof0
+    return header + os.urandom(size - len(header) - 2) + b"\xff\xd9"
+
+
+class FakeCamera:
+    """
+    TLS server streaming JPEG frames with the printer camera protocol.
+    """
+
+    def __init__(self, frame_size: int = 60_000, fps: float = 0) -> None:
+        self.frame = fake_jpeg(frame_size)
+        self.fps = fps
+        self.frames_sent = 0
+        self.server: asyncio.base_events.Server | None = None
+        self.port = 0
+
+    async def start(self, ssl_context: ssl.SSLContext,
+                    host: str = "127.0.0.1", port: int = 0) -> None:
+        self.server = await asyncio.start_server(
+            self._session, host, port, ssl=ssl_context)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def _session(self, reader: asyncio.StreamReader,
+                       writer: asyncio.StreamWriter) -> None:
+        try:
+            auth = await reader.readexactly(80)
+            username = auth[16:48].rstrip(b"\x00").decode()
+            access_code = auth[48:80].rstrip(b"\x00").decode()
+            if (username, access_code) != (USERNAME, ACCESS_CODE):
+                return
+
+            header = struct.pack("<IIII", len(self.frame), 0, 1, 0)
+            while True:
+                start = time.monotonic()
+                # Header and payload are separate TLS records, the client
+                # recognises the header by its 16 byte read.
+                writer.write(header)
+                await writer.drain()
+                writer.write(self.frame)
+                await writer.drain()
+                self.frames_sent += 1
+                if self.fps:
+                    await asyncio.sleep(max(0.0, 1 / self.fps
+                                            - (time.monotonic() - start)))
+                else:
+                    await asyncio.sleep(0)
+        except (asyncio.IncompleteReadError, asyncio.CancelledError,
+                ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+
+
+class FakePrinterEnv:
+    """
+    Runs a SimulatedFleet, FakeFTPServer and FakeCamera on a background
+    asyncio loop. Use as a context manager.
+    """
+
+    def __init__(self, serials: list[str],
+                 camera_frame_size: int = 60_000,
+                 camera_fps: float = 0) -> None:
+        self.host = "127.0.0.1"
+        self.access_code = ACCESS_CODE
+        # Printers only answer commands, the benchmarks drive the traffic.
+        self.fleet = SimulatedFleet(serials, access_code=ACCESS_CODE,
+                                    report_interval=0)
+        self.broker = self.fleet.broker
+        self.ftp = FakeFTPServer()
+        self.camera = FakeCamera(camera_frame_size, camera_fps)
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever,
+                                        daemon=True)
+
+    def run(self, coro: Any, timeout: float | None = None) -> Any:
+        """
+        Run a coroutine on the environment loop and wait for its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop) \
+            .result(timeout)
+
+    def __enter__(self) -> "FakePrinterEnv":
+        ctx = make_ssl_context()
+        self._thread.start()
+        self.run(self.fleet.start(self.host, 0, ctx))
+        self.run(self.ftp.start(ctx, self.host))
+        self.run(self.camera.start(ctx, self.host))
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        async def close() -> None:
+            await self.fleet.stop()
+            for server in (self.ftp.server, self.camera.server):
+                if server is not None:
+                    server.close()
+            tasks = [t for t in asyncio.all_tasks()
+                     if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.run(close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(5)
+        self.loop.close()
+
+    def wait_subscribed(self, serials: list[str],
+                        timeout: float = 30.0) -> None:
+        """
+        Wait until every printer report topic has a subscriber.
+
+        Raises:
+            TimeoutError: if the clients did not subscribe in time
+        """
+        end = time.monotonic() + timeout
+        while any(self.broker.subscriber_count(f"device/{s}/report") == 0
+                  for s in serials):
+            if time.monotonic() > end:
+                raise TimeoutError("MQTT clients did not subscribe in time")
+            time.sleep(0.05)
@@ -0,0 +1,684 @@
+"""
+Benchmark the printer clients against local fake printers.
+
+Examples
+--------
+
+python -m benchmarks.run --printers 1 10 100 --json results.json
+python -m benchmarks.run --baseline results.json --tolerance 0.25
+
+With ``--baseline`` the run exits with status 1 when a metric regressed by
+more than the tolerance.
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Callable
+
+import bambulabs_api as bl
+from bambulabs_api import codec, instrumentation
+from bambulabs_api.camera_client import PrinterCamera
+from bambulabs_api.eta import EtaTracker
+from bambulabs_api.fleet import Fleet
+from bambulabs_api.ftp_client import PrinterFTPClient
+from bambulabs_api.gateway import Gateway
+from bambulabs_api.jpeg import validate_jpeg
+from bambulabs_api.journal import JournalReader, JournalWriter, replay
+from bambulabs_api.mqtt_client import PrinterMQTTClient
+from bambulabs_api.refresh import RefreshScheduler
+from bambulabs_api.shard import PrinterSpec, ShardedFleet
+from bambulabs_api.simulator import VirtualPrinter
+from bambulabs_api.snapshot import StateStore
+from bambulabs_api.tls import TLSConfig
+
+from .fake_printer import FakePrinterEnv, emit_reports, incremental_report
+
+Result = dict[str, float]
+
+# Metrics ending with one of these suffixes are better when lower.
+LOWER_IS_BETTER = ("_us", "_ms", "_s")
+
+
+def _serials(n: int) -> list[str]:
+    return [f"BENCH{i:06d}" for i in range(n)]
+
+
+def _connect_mqtt(env: FakePrinterEnv, n: int) -> list[PrinterMQTTClient]:
+    clients = [PrinterMQTTClient(env.host, env.access_code, serial,
+                                 port=env.broker.port)
+               for serial in _serials(n)]
+    for client in clients:
+        client.connect()
+        client.start()
+    env.wait_subscribed(_serials(n))
+    return clients
+
+
+def _stop_mqtt(clients: list[PrinterMQTTClient]) -> None:
+    for client in clients:
+        client.stop()
+
+
+def _percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _import_time(statement: str) -> float:
+    code = ("import time; start = time.perf_counter(); "
+            f"{statement}; print(time.perf_counter() - start)")
+    out = subprocess.run([sys.executable, "-c", code], check=True,
+                         capture_output=True, text=True).stdout
+    return float(out)
+
+
+def bench_startup(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    Package import time in a fresh interpreter, and Printer construction.
+    """
+    runs = max(args.iterations // 40, 3)
+    package = [_import_time("import bambulabs_api") for _ in range(runs)]
+    printer = [_import_time("from bambulabs_api import Printer")
+               for _ in range(runs)]
+
+    construct = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for serial in _serials(n):
+            bl.Printer(env.host, env.access_code, serial)
+        construct.append((time.perf_counter() - start) / n)
+    return {"import_package_ms": statistics.median(package) * 1e3,
+            "import_printer_ms": statistics.median(printer) * 1e3,
+            "construct_us": min(construct) * 1e6}
+
+
+def bench_getters(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    Latency of the state getters once a full report was received.
+    """
+    clients = _connect_mqtt(env, n)
+    try:
+        async def push() -> None:
+            for serial in _serials(n):
+                await env.broker.publish(
+                    f"device/{serial}/report",
+                    env.fleet.printers[serial].full_report())
+        env.run(push())
+        sample = clients[:10]
+        for client in sample:
+            # Serve the getters from the received state without pushall
+            client.printer_timeout = -1
+            while not client.get_nozzle_temperature():
+                time.sleep(0.01)
+
+        def measure() -> list[float]:
+            timings = []
+            for client in sample:
+                for _ in range(args.iterations):
+                    start = time.perf_counter()
+                    client.get_bed_temperature()
+                    client.get_printer_state()
+                    client.get_last_print_percentage()
+                    client.get_light_state()
+                    timings.append((time.perf_counter() - start) / 4)
+            return timings
+
+        timings = measure()
+        # Getters of scheduled clients ask the scheduler instead
+        RefreshScheduler(sample, max_age=60)
+        scheduled = measure()
+        return {"getter_mean_us": statistics.fmean(timings) * 1e6,
+                "getter_p99_us": _percentile(timings, 0.99) * 1e6,
+                "getter_scheduled_mean_us":
+                    statistics.fmean(scheduled) * 1e6}
+    finally:
+        _stop_mqtt(clients)
+
+
+def bench_refresh(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    Fleet refresh through the scheduler, until every client has a state.
+    """
+    clients = _connect_mqtt(env, n)
+    scheduler = RefreshScheduler(clients, period=600, max_rate=200)
+    try:
+        start = time.perf_counter()
+        scheduler.start()
+        deadline = time.monotonic() + n / scheduler.max_rate + 30
+        while any(not c.last_report for c in clients) \
+                and time.monotonic() < deadline:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        return {"refresh_fleet_s": elapsed,
+                "pushall_per_s": scheduler.sent / elapsed}
+    finally:
+        scheduler.stop()
+        _stop_mqtt(clients)
+
+
+def bench_ingest(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    Report ingest throughput with the broker emitting as fast as the
+    clients read.
+    """
+    clients = _connect_mqtt(env, n)
+    received = itertools.count()
+    for client in clients:
+        client.add_report_listener(lambda report: next(received))
+    try:
+        start = time.perf_counter()
+        delivered = env.run(emit_reports(
+            env.fleet, _serials(n), rate=args.rate, duration=args.duration))
+        elapsed = time.perf_counter() - start
+        time.sleep(0.5)
+        handled = next(received)
+        return {"reports_per_s": handled / elapsed,
+                "delivered_per_s": delivered / elapsed}
+    finally:
+        _stop_mqtt(clients)
+
+
+def bench_decode(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    Decode time of a full report with each installed JSON backend, and with
+    a ReportDecoder keeping a handful of fields (msgspec schema when
+    installed, the fastest backend otherwise).
+    """
+    payload = codec.dumps(env.fleet.printers[_serials(n)[0]].full_report())
+    fields = ("gcode_state", "mc_percent", "nozzle_temper", "bed_temper",
+              "layer_num")
+    iterations = args.iterations * 10
+
+    def timed(decode: Callable[[bytes], Any]) -> float:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            decode(payload)
+        return (time.perf_counter() - start) / iterations * 1e6
+
+    previous = codec.get_backend()
+    result = {"report_bytes": float(len(payload))}
+    try:
+        for backend in codec.BACKENDS:
+            try:
+                codec.set_backend(backend)
+            except ImportError:
+                continue
+            result[f"decode_{backend}_us"] = timed(codec.loads)
+    finally:
+        codec.set_backend(previous)
+    result["decode_fields_us"] = timed(codec.ReportDecoder(fields).decode)
+    return result
+
+
+def bench_replay(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    Offline ingest: journal a full report followed by incremental reports
+    for each printer, then replay the journals through the clients.
+    """
+    reports = args.iterations * 10
+    with tempfile.TemporaryDirectory() as directory:
+        for serial in _serials(n):
+            writer = JournalWriter(directory, serial)
+            writer.append(codec.dumps(env.fleet.printers[serial]
+                                      .full_report()), 0.0)
+            for i in range(1, reports):
+                writer.append(codec.dumps(incremental_report(i, i)), i)
+            writer.close()
+        size = sum(os.path.getsize(s.path) for serial in _serials(n)
+                   for s in JournalReader(directory, serial).segments())
+
+        clients = [PrinterMQTTClient(env.host, env.access_code, serial)
+                   for serial in _serials(n)]
+        start = time.perf_counter()
+        replayed = sum(replay(JournalReader(directory, serial), client)
+                       for client, serial in zip(clients, _serials(n)))
+        elapsed = time.perf_counter() - start
+    return {"replay_reports_per_s": replayed / elapsed,
+            "journal_bytes_per_report": size / replayed}
+
+
+def bench_snapshot(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    Checkpoint and warm restore of the full state of every printer.
+    """
+    now = time.time()
+    clients = [PrinterMQTTClient(env.host, env.access_code, serial)
+               for serial in _serials(n)]
+    for client in clients:
+        report = VirtualPrinter(client.serial).full_report()["print"]
+        client.restore_state(report, now)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "states.json.gz")
+        start = time.perf_counter()
+        StateStore(path, clients).save(force=True)
+        save = time.perf_counter() - start
+        size = os.path.getsize(path)
+
+        restarted = [PrinterMQTTClient(env.host, env.access_code, serial)
+                     for serial in _serials(n)]
+        start = time.perf_counter()
+        StateStore(path, restarted).restore()
+        restore = time.perf_counter() - start
+    return {"save_ms": save * 1e3, "restore_ms": restore * 1e3,
+            "bytes_per_printer": size / n}
+
+
+def bench_commands(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    Command round trip, from publishing until the printer answer is merged.
+    """
+    clients = _connect_mqtt(env, n)
+    try:
+        def round_trips(client: PrinterMQTTClient) -> list[float]:
+            answered = threading.Event()
+
+            def listener(report: dict[str, Any]) -> None:
+                if report.get("command") == "print_speed":
+                    answered.set()
+
+            client.add_report_listener(listener)
+            timings = []
+            for i in range(args.iterations // 10 or 1):
+                answered.clear()
+                start = time.perf_counter()
+                client.set_print_speed_lvl(i % 4)
+                if answered.wait(5):
+                    timings.append(time.perf_counter() - start)
+            client.remove_report_listener(listener)
+            return timings
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(n, 64)) as pool:
+            timings = [t for ts in pool.map(round_trips, clients) for t in ts]
+        elapsed = time.perf_counter() - start
+        return {"round_trip_p50_ms": _percentile(timings, 0.5) * 1e3,
+                "round_trip_p99_ms": _percentile(timings, 0.99) * 1e3,
+                "commands_per_s": len(timings) / elapsed}
+    finally:
+        _stop_mqtt(clients)
+
+
+def bench_slider(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    A UI slider hammering set_nozzle_temperature, sent directly and through
+    the rate limited command queue.
+    """
+    clients = _connect_mqtt(env, n)
+    calls = max(args.iterations // 4, 10)
+    try:
+        def hammer(client: PrinterMQTTClient) -> float:
+            start = time.perf_counter()
+            for i in range(calls):
+                client.set_nozzle_temperature(200 + i % 50)
+            return (time.perf_counter() - start) / calls
+
+        with ThreadPoolExecutor(max_workers=min(n, 64)) as pool:
+            direct = list(pool.map(hammer, clients))
+            for client in clients:
+                client.enable_command_queue(rate=5, burst=5)
+            queued = list(pool.map(hammer, clients))
+        published = sum(c.commands.sent + c.commands.depth  # type: ignore
+                        for c in clients)
+        return {"slider_direct_call_us": statistics.fmean(direct) * 1e6,
+                "slider_queued_call_us": statistics.fmean(queued) * 1e6,
+                "slider_published_percent": published / (n * calls) * 100}
+    finally:
+        for client in clients:
+            client.disable_command_queue()
+        _stop_mqtt(clients)
+
+
+def bench_broadcast(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    One command broadcast to every printer, until every answer is merged.
+    """
+    clients = _connect_mqtt(env, n)
+    fleet = Fleet(clients)
+    try:
+        pending: set[str] = set()
+        lock = threading.Lock()
+        done = threading.Event()
+
+        def listener(serial: str) -> Callable[[dict[str, Any]], None]:
+            def on_report(report: dict[str, Any]) -> None:
+                if report.get("command") == "print_speed":
+                    with lock:
+                        pending.discard(serial)
+                        if not pending:
+                            done.set()
+            return on_report
+
+        for client in clients:
+            client.add_report_listener(listener(client.serial))
+
+        publish, complete = [], []
+        for i in range(max(args.iterations // 100, 3)):
+            pending.update(client.serial for client in clients)
+            done.clear()
+            start = time.perf_counter()
+            fleet.broadcast("set_print_speed_lvl", i % 4)
+            publish.append(time.perf_counter() - start)
+            if done.wait(10):
+                complete.append(time.perf_counter() - start)
+        return {"broadcast_publish_ms": statistics.median(publish) * 1e3,
+                "broadcast_complete_ms":
+                    statistics.median(complete) * 1e3 if complete else 0.0}
+    finally:
+        fleet.close()
+        _stop_mqtt(clients)
+
+
+def bench_gateway(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    Consumers polling the printer states through the gateway, with and
+    without a matching ETag.
+    """
+    clients = _connect_mqtt(env, n)
+    gateway = Gateway(clients, connect=False, camera=False)
+    gateway.start_in_thread(port=0)
+    conn = http.client.HTTPConnection("127.0.0.1", gateway.port)
+    try:
+        def poll(etags: dict[str, str]) -> float:
+            start = time.perf_counter()
+            for client in clients:
+                headers = {}
+                if client.serial in etags:
+                    headers["If-None-Match"] = etags[client.serial]
+                conn.request("GET", f"/printers/{client.serial}/state",
+                             headers=headers)
+                response = conn.getresponse()
+                response.read()
+                etags[client.serial] = response.getheader("ETag")
+            return (time.perf_counter() - start) / n
+
+        etags: dict[str, str] = {}
+        rounds = max(args.iterations // n, 3)
+        full = min(poll({}) for _ in range(rounds))
+        poll(etags)
+        cached = min(poll(etags) for _ in range(rounds))
+        return {"gateway_state_us": full * 1e6,
+                "gateway_not_modified_us": cached * 1e6}
+    finally:
+        conn.close()
+        gateway.close()
+        _stop_mqtt(clients)
+
+
+def bench_shard(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    Printers run by two worker processes, states read from shared memory
+    by the front end.
+    """
+    specs = [PrinterSpec(env.host, env.access_code, serial,
+                         mqtt_port=env.broker.port) for serial in _serials(n)]
+    start = time.perf_counter()
+    with ShardedFleet(specs, shards=2) as fleet:
+        env.wait_subscribed(_serials(n))
+        ready = time.perf_counter() - start
+        deadline = time.monotonic() + 30
+        while any(s is None for s in fleet.states().values()) and \
+                time.monotonic() < deadline:
+            time.sleep(0.01)
+        rounds = max(args.iterations // n, 3)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fleet.states()
+        read = (time.perf_counter() - start) / (rounds * n)
+    return {"shard_ready_ms": ready * 1e3,
+            "shard_state_read_us": read * 1e6}
+
+
+def bench_upload(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    Aggregate FTPS upload throughput with one upload per printer.
+    """
+    payload = bytes(args.upload_mb << 20)
+
+    def upload(i: int) -> None:
+        client = PrinterFTPClient(env.host, env.access_code, port=env.ftp.port)
+        client.upload_file(payload, f"bench_{i}.3mf")
+
+    before = env.ftp.bytes_received
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(n, 64)) as pool:
+        list(pool.map(upload, range(n)))
+    elapsed = time.perf_counter() - start
+    sent = env.ftp.bytes_received - before
+    return {"upload_mb_per_s": sent / elapsed / (1 << 20),
+            "upload_wall_s": elapsed}
+
+
+def bench_reconnect(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    CPU time of FTP reconnects, with full handshakes and resumed sessions.
+    """
+    result = {}
+    for mode, reuse in (("full", False), ("resumed", True)):
+        tls = TLSConfig(session_reuse=reuse)
+        clients = [PrinterFTPClient(env.host, env.access_code,
+                                    port=env.ftp.port, tls=tls)
+                   for _ in range(n)]
+        for client in clients:
+            client.get_file_size("missing.3mf")
+        rounds = max(args.iterations // 100, 2)
+        start = time.process_time()
+        for _ in range(rounds):
+            for client in clients:
+                client.get_file_size("missing.3mf")
+        cpu = time.process_time() - start
+        result[f"reconnect_{mode}_cpu_ms"] = cpu / (rounds * n) * 1e3
+    return result
+
+
+def bench_camera(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    Camera frame throughput across all cameras.
+    """
+    frames = itertools.count()
+
+    def hook(name: str, seconds: float, attrs: dict[str, Any]) -> None:
+        if name == "camera.frame":
+            next(frames)
+
+    cameras = [PrinterCamera(env.host, env.access_code, port=env.camera.port)
+               for _ in range(n)]
+    instrumentation.add_hook(hook)
+    try:
+        for camera in cameras:
+            camera.start()
+        time.sleep(1.0)
+        start_count = next(frames)
+        start = time.perf_counter()
+        time.sleep(args.duration)
+        count = next(frames) - start_count - 1
+        elapsed = time.perf_counter() - start
+    finally:
+        instrumentation.remove_hook(hook)
+        for camera in cameras:
+            camera.stop()
+    frame_mb = len(env.camera.frame) / (1 << 20)
+    start = time.perf_counter()
+    for _ in range(1000):
+        validate_jpeg(env.camera.frame)
+    validate = (time.perf_counter() - start) / 1000
+    return {"frames_per_s": count / elapsed,
+            "frame_mb_per_s": count * frame_mb / elapsed,
+            "frame_validate_us": validate * 1e6}
+
+
+def bench_vision(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    Failure detection passes over n 720p cameras, and the decode time of a
+    frame at full and reduced resolution.
+    """
+    try:
+        import io  # pylint: disable=import-outside-toplevel
+        import numpy as np  # pylint: disable=import-outside-toplevel
+        from PIL import Image  # pylint: disable=import-outside-toplevel
+        from bambulabs_api.vision import CameraMonitor, decode_frame  # noqa  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return {}
+
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(2):
+        pixels = rng.integers(0, 255, (720, 1280), dtype=np.uint8) // 32 \
+            + np.linspace(0, 180, 1280, dtype=np.uint8)
+        pixels[100 * i:100 * i + 80, 600:680] = 255
+        out = io.BytesIO()
+        Image.fromarray(pixels, "L").save(out, "JPEG", quality=85)
+        frames.append(out.getvalue())
+
+    def decode_ms(scale: int) -> float:
+        start = time.perf_counter()
+        for _ in range(20):
+            decode_frame(frames[0], scale)
+        return (time.perf_counter() - start) / 20 * 1e3
+
+    printers = [SimpleNamespace(
+        mqtt_client=PrinterMQTTClient("", "", serial),
+        camera_client=SimpleNamespace(last_frame=None))
+        for serial in _serials(n)]
+    monitor = CameraMonitor(printers, workers=4)
+    for printer in printers:
+        monitor.detectors[printer.mqtt_client.serial].on_report(
+            {"gcode_state": "RUNNING", "layer_num": 1})
+    passes = []
+    try:
+        for i in range(6):
+            for printer in printers:
+                printer.camera_client.last_frame = bytearray(frames[i % 2])
+            start = time.perf_counter()
+            monitor.tick()
+            passes.append(time.perf_counter() - start)
+    finally:
+        monitor.stop()
+    return {"vision_decode_full_ms": decode_ms(1),
+            "vision_decode_scaled_ms": decode_ms(8),
+            "vision_pass_ms": min(passes[1:]) * 1e3}
+
+
+def bench_eta(env: FakePrinterEnv, n: int, args) -> Result:
+    """
+    Finish time estimate updates per report, and fleet-wide queries.
+    """
+    tracker = EtaTracker(PrinterMQTTClient("", "", serial)
+                         for serial in _serials(n))
+    now = time.time()
+    for serial in tracker.serials:
+        tracker.update(serial, {"gcode_state": "RUNNING", "stg_cur": 0,
+                                "mc_percent": 0}, now)
+    rounds = max(args.iterations // n, 3)
+    start = time.perf_counter()
+    for i in range(1, rounds + 1):
+        report = {"mc_percent": i % 100, "mc_remaining_time": 100 - i % 100}
+        for serial in tracker.serials:
+            tracker.update(serial, report, now + i)
+    update = (time.perf_counter() - start) / (rounds * n)
+    tracker.finish_times(now)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        tracker.finish_times(now + rounds)
+    query = (time.perf_counter() - start) / rounds
+    return {"eta_update_us": update * 1e6,
+            "eta_fleet_query_us": query * 1e6}
+
+
+BENCHMARKS: dict[str, Callable[[FakePrinterEnv, int, Any], Result]] = {
+    "startup": bench_startup,
+    "getters": bench_getters,
+    "refresh": bench_refresh,
+    "ingest": bench_ingest,
+    "decode": bench_decode,
+    "replay": bench_replay,
+    "snapshot": bench_snapshot,
+    "commands": bench_commands,
+    "broadcast": bench_broadcast,
+    "slider": bench_slider,
+    "gateway": bench_gateway,
+    "shard": bench_shard,
+    "upload": bench_upload,
+    "reconnect": bench_reconnect,
+    "camera": bench_camera,
+    "vision": bench_vision,
+    "eta": bench_eta,
+}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compare results to a baseline.
+
+    Returns:
+        list[str]: one message per regressed metric
+    """
+    regressions = []
+    for name, runs in results.items():
+        for n, metrics in runs.items():
+            for metric, value in metrics.items():
+                old = baseline.get(name, {}).get(n, {}).get(metric)
+                if not old:
+                    continue
+                change = (value - old) / old
+                if metric.endswith(LOWER_IS_BETTER):
+                    change = -change
+                if change < -tolerance:
+                    regressions.append(
+                        f"{name}[{n}] {metric}: {old:.2f} -> {value:.2f}")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--printers", type=int, nargs="+",
+                        default=[1, 10, 100],
+                        help="simulated printer counts (1 to 500)")
+    parser.add_argument("--bench", nargs="+", choices=list(BENCHMARKS),
+                        default=list(BENCHMARKS))
+    parser.add_argument("--duration", type=float, default=3.0,
+                        help="seconds per throughput measurement")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="reports/s per printer, 0 for unthrottled")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--upload-mb", type=int, default=4)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare to a results file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results: dict[str, dict[str, Result]] = {}
+    for name in args.bench:
+        for n in args.printers:
+            with FakePrinterEnv(_serials(n)) as env:
+                result = BENCHMARKS[name](env, n, args)
+            results.setdefault(name, {})[str(n)] = result
+            print(f"{name:<10}{n:>6} printers  " + "  ".join(
+                f"{k}={v:.2f}" for k, v in result.items()), flush=True)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fp:
+            json.dump(results, fp, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fp:
+            regressions = compare(results, json.load(fp), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
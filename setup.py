@@ -14,8 +14,12 @@ setup(
     url="https://github.com/acse-ci223/bambulabs_api",
     author="Chris Ioannidis",
     author_email="chris.ioannidis23@imperial.ac.uk",
-    packages=["bambulabs_api"],
+    packages=["bambulabs_api", "bambulabs_api.simulator"],
     install_requires=[
         "paho-mqtt",
     ],
+    extras_require={
+        "fast": ["orjson>=3.8", "msgspec>=0.18"],
+        "vision": ["numpy>=1.22", "Pillow>=9.0"],
+    },
 )
@@ -2,6 +2,9 @@
 Test the Client class
 """
 
+import subprocess
+import sys
+
 import pytest  # noqa: F401, F403
 
 import bambulabs_api as bl  # noqa: F401, F403
@@ -20,3 +23,50 @@ class TestAPI:
         assert client.ip_address == ''
         assert client.access_code == ''
         assert client.serial == ''
+
+    def test_lazy_import(self):
+        """
+        test_lazy_import Test importing the package does not load the clients
+        """
+        code = ("import sys, bambulabs_api; "
+                "print(any(m.startswith(('paho', 'ftplib', 'bambulabs_api.'))"
+                " for m in sys.modules))")
+        out = subprocess.run([sys.executable, "-c", code], check=True,
+                             capture_output=True, text=True).stdout
+        assert out.strip() == "False"
+        assert bl.GcodeState.RUNNING.value == "RUNNING"
+        with pytest.raises(AttributeError):
+            bl.NotAnExport  # noqa: B018  # pylint: disable=pointless-statement
+
+    def test_lazy_helpers(self):
+        """
+        test_lazy_helpers Test building a Printer does not load the upload,
+        project and telemetry helpers
+        """
+        code = ("import sys, bambulabs_api; "
+                "bambulabs_api.Printer('', '', 'S'); "
+                "print(sorted(m for m in ('zipfile', 'xml.etree', "
+                "'bambulabs_api.project_info', 'bambulabs_api.upload_cache', "
+                "'bambulabs_api.telemetry') if m in sys.modules))")
+        out = subprocess.run([sys.executable, "-c", code], check=True,
+                             capture_output=True, text=True).stdout
+        assert out.strip() == "[]"
+        printer = bl.Printer('', '', 'S')
+        assert printer.upload_cache is printer.upload_cache
+
+    def test_lazy_clients(self):
+        """
+        test_lazy_clients Test the sub-clients are built on first use
+        """
+        printer = bl.Printer('127.0.0.1', '', 'SERIAL')
+        assert printer._Printer__mqtt is None
+        assert printer._Printer__camera is None
+        assert printer._Printer__ftp is None
+        printer.disconnect()
+        assert printer._Printer__camera is None
+
+        client = printer.mqtt_client
+        assert client is printer.mqtt_client
+        assert client.serial == 'SERIAL'
+        assert client.supervisor is printer.supervisor
+        assert printer._Printer__ftp is None
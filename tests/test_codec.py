@@ -0,0 +1,55 @@
+"""
+Test the JSON codec backends and report decoder
+"""
+
+import sys
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api import codec
+
+PAYLOAD = (b'{"print": {"command": "push_status", "sequence_id": "7", '
+           b'"mc_percent": 42, "bed_temper": 55.5, '
+           b'"ams": {"ams": [{"id": "0", "tray": []}]}}, '
+           b'"info": {"module": []}}')
+
+
+class TestCodec:
+    """
+    TestCodec Class for testing the JSON codec
+    """
+
+    @pytest.mark.parametrize("backend", list(codec.BACKENDS))
+    def test_backends(self, backend):
+        """
+        test_backends Test every installed backend round trips documents
+        """
+        previous = codec.get_backend()
+        try:
+            codec.set_backend(backend)
+        except ImportError:
+            pytest.skip(f"{backend} is not installed")
+        try:
+            doc = codec.loads(PAYLOAD)
+            assert doc["print"]["bed_temper"] == 55.5
+            assert codec.loads(codec.dumps(doc)) == doc
+            assert b" " not in codec.dumps({"a": [1, 2]})
+        finally:
+            codec.set_backend(previous)
+
+        with pytest.raises(ValueError):
+            codec.set_backend("yaml")
+
+    @pytest.mark.parametrize("msgspec", [True, False])
+    def test_report_decoder_fields(self, monkeypatch, msgspec):
+        """
+        test_report_decoder_fields Test only the requested fields are kept
+        """
+        if not msgspec:
+            monkeypatch.setitem(sys.modules, "msgspec", None)
+        decoder = codec.ReportDecoder(["mc_percent", "gcode_state"])
+
+        assert decoder.decode(PAYLOAD) == {"print": {
+            "command": "push_status", "sequence_id": "7", "mc_percent": 42}}
+        assert decoder.decode(b'{"system": {"led_mode": "on"}}') == {}
+        assert codec.ReportDecoder().decode(PAYLOAD) == codec.loads(PAYLOAD)
@@ -0,0 +1,113 @@
+"""
+Test the rate limited command queue
+"""
+
+import threading
+import time
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api import metrics
+from bambulabs_api.command_queue import CommandQueue, TokenBucket
+from bambulabs_api.mqtt_client import PrinterMQTTClient
+
+
+class Recorder:
+    """
+    Publish stand-in recording the payloads and their time
+    """
+
+    def __init__(self):
+        self.payloads = []
+        self.times = []
+        self.done = threading.Event()
+        self.expected = None
+
+    def __call__(self, payload):
+        self.payloads.append(payload)
+        self.times.append(time.monotonic())
+        if self.expected is not None and len(self.payloads) >= self.expected:
+            self.done.set()
+        return True
+
+
+class TestCommandQueue:
+    """
+    TestCommandQueue Class for testing command rate limiting
+    """
+
+    def test_token_bucket(self):
+        """
+        test_token_bucket Test the burst is available then the rate applies
+        """
+        bucket = TokenBucket(rate=10, burst=2)
+        assert bucket.take() == 0
+        assert bucket.take() == 0
+        assert 0 < bucket.take() <= 0.1
+        with pytest.raises(ValueError):
+            TokenBucket(rate=0)
+
+    def test_coalesce(self):
+        """
+        test_coalesce Test a hammered setter only sends its latest value
+        """
+        publish = Recorder()
+        queue = CommandQueue(publish, rate=20, burst=1)
+        assert queue.submit({"n": 0}, "nozzle")
+        for i in range(1, 50):
+            assert queue.submit({"n": i}, "nozzle")
+        queue.submit({"cmd": "pause"})
+        assert queue.depth == 2
+        assert queue.coalesced == 48
+
+        publish.expected = 3
+        assert publish.done.wait(2)
+        assert publish.payloads == [{"n": 0}, {"n": 49}, {"cmd": "pause"}]
+        assert all(b - a >= 0.045 for a, b in
+                   zip(publish.times, publish.times[1:]))
+        queue.close()
+
+    def test_drop(self):
+        """
+        test_drop Test commands beyond the queue depth are dropped
+        """
+        publish = Recorder()
+        queue = CommandQueue(publish, rate=0.5, burst=1, max_depth=2)
+        assert queue.submit({"n": 0})
+        assert queue.submit({"n": 1})
+        assert queue.submit({"n": 2})
+        assert not queue.submit({"n": 3})
+        assert queue.dropped == 1
+        queue.close()
+        assert queue.dropped == 3
+        assert not queue.submit({"n": 4})
+        assert publish.payloads == [{"n": 0}]
+
+    def test_client(self):
+        """
+        test_client Test the client setters go through the queue
+        """
+        publish = Recorder()
+        client = PrinterMQTTClient("", "", "SERIAL1")
+        client._PrinterMQTTClient__send_command = publish
+        queue = client.enable_command_queue(rate=0.5, burst=1)
+        assert client.set_nozzle_temperature(200)
+        assert client.set_nozzle_temperature(210)
+        assert client.set_nozzle_temperature(220)
+        assert client.turn_light_on()
+        assert client.turn_light_off()
+        assert queue.depth == 2 and queue.coalesced == 2
+
+        registry = metrics.enable_metrics()
+        try:
+            text = registry.render()
+        finally:
+            metrics.disable_metrics()
+        assert 'bambulabs_command_queue_depth{serial="SERIAL1"} 2.0' in text
+        assert ('bambulabs_commands_coalesced_total{serial="SERIAL1"} 2.0'
+                in text)
+
+        client.disable_command_queue()
+        assert client.commands is None
+        assert publish.payloads == [{"print": {"command": "gcode_line",
+                                               "param": "M104 S200\n"}}]
@@ -0,0 +1,66 @@
+"""
+Test the reconnection supervisor
+"""
+
+import io
+import socket
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api.connection import (BackoffPolicy, CircuitOpenError,
+                                      ConnectionState, ConnectionSupervisor)
+from bambulabs_api.ftp_client import PrinterFTPClient
+
+
+class TestConnectionSupervisor:
+    """
+    TestConnectionSupervisor Class for testing backoff and circuit breaking
+    """
+
+    def test_backoff_and_circuit(self):
+        """
+        test_backoff_and_circuit Test delays grow, spread and open the circuit
+        """
+        policy = BackoffPolicy(initial=1, maximum=8, jitter=0.5)
+        supervisor = ConnectionSupervisor("P1", policy, failure_threshold=5,
+                                          reset_timeout=100, seed=3)
+        events = []
+        supervisor.add_listener(events.append)
+
+        supervisor.connecting("mqtt")
+        delays = [supervisor.disconnected("mqtt", "lost") for _ in range(4)]
+        for attempt, delay in enumerate(delays, 1):
+            base = min(8, 2 ** (attempt - 1))
+            assert base / 2 <= delay <= base
+        assert len({round(policy.delay(3), 6) for _ in range(20)}) > 1
+        assert supervisor.state("mqtt") == ConnectionState.BACKOFF
+
+        # The fifth failure, on another channel, opens the circuit
+        assert supervisor.disconnected("camera") >= 75
+        assert supervisor.circuit_open
+        assert supervisor.state("camera") == ConnectionState.CIRCUIT_OPEN
+        with pytest.raises(CircuitOpenError):
+            supervisor.check("ftp")
+
+        supervisor.connected("mqtt")
+        assert not supervisor.circuit_open
+        assert 0.5 <= supervisor.disconnected("mqtt") <= 1
+        assert [e.state for e in events[:2]] == [ConnectionState.CONNECTING,
+                                                 ConnectionState.BACKOFF]
+        assert events[-1].failures == 1
+
+    def test_ftp_raises(self):
+        """
+        test_ftp_raises Test FTP errors are retried then raised
+        """
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+
+        supervisor = ConnectionSupervisor(
+            "P1", BackoffPolicy(initial=0.01, maximum=0.01))
+        client = PrinterFTPClient("127.0.0.1", "x", port=port,
+                                  supervisor=supervisor, retries=1)
+        with pytest.raises(OSError):
+            client.upload_file(io.BytesIO(b"data"), "file.3mf")
+        assert supervisor.state("ftp") == ConnectionState.BACKOFF
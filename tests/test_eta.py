@@ -0,0 +1,153 @@
+"""
+Test the print finish time estimation
+"""
+
+import json
+import math
+from types import SimpleNamespace
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api.eta import EtaTracker
+from bambulabs_api.mqtt_client import PrinterMQTTClient
+
+START = 1_000_000.0
+DURATION = 6000.0
+
+
+def _print(tracker, serial, until, firmware_error=3.0, start=START, since=0):
+    """
+    Feed the reports of a print lasting DURATION seconds, whose printer
+    remaining time starts off by firmware_error times
+    """
+    if not since:
+        tracker.update(serial, {"gcode_state": "RUNNING", "stg_cur": 0,
+                                "mc_percent": 0, "spd_mag": 100}, start)
+    for t in range(since + 60, int(until) + 1, 60):
+        progress = t / DURATION
+        error = 1 + (firmware_error - 1) * max(0.0, 1 - 5 * progress)
+        tracker.update(serial, {
+            "mc_percent": int(progress * 100),
+            "mc_remaining_time": (DURATION - t) * error / 60,
+        }, start + t)
+
+
+class TestEta:
+    """
+    TestEta Class for testing the finish time estimation
+    """
+
+    def test_converges(self):
+        """
+        test_converges Test the estimate settles on the finish time
+        """
+        tracker = EtaTracker([PrinterMQTTClient("", "", "P0")])
+        assert tracker.estimate("P0") is None
+
+        finish = START + DURATION
+        _print(tracker, "P0", 600)
+        early = tracker.estimate("P0", START + 600)
+        _print(tracker, "P0", 3000, since=600)
+        late = tracker.estimate("P0", START + 3000)
+        assert abs(late.finish - finish) < abs(early.finish - finish)
+        assert abs(late.finish - finish) < 300
+        assert late.low <= late.finish <= late.high
+        assert late.remaining == pytest.approx(late.finish - START - 3000)
+        assert late.progress == 0.5
+
+        # Overdue prints finish now at the earliest
+        overdue = tracker.estimate("P0", finish + 3600)
+        assert overdue.finish == overdue.low == finish + 3600
+        assert overdue.remaining == 0 and overdue.high >= overdue.finish
+        assert [t[0] for t in tracker.finish_times(finish + 3600)] \
+            == [overdue.finish, overdue.low, overdue.high]
+
+        tracker.update("P0", {"gcode_state": "FINISH"}, finish)
+        done = tracker.estimate("P0", finish + 10)
+        assert done.finish == done.low == done.high == finish
+        tracker.update("P0", {"gcode_state": "IDLE"}, finish + 20)
+        assert tracker.estimate("P0") is None
+
+    def test_pause_and_speed(self):
+        """
+        test_pause_and_speed Test pauses postpone the finish and faster
+        speeds bring it forward
+        """
+        client = PrinterMQTTClient("", "", "P0")
+        tracker = EtaTracker([client])
+        _print(tracker, "P0", 3000, firmware_error=1)
+        before = tracker.estimate("P0", START + 3000).finish
+        tracker.update("P0", {"gcode_state": "PAUSE"}, START + 3000)
+        assert tracker.estimate("P0", START + 3600).finish \
+            == pytest.approx(before + 600)
+        tracker.update("P0", {"gcode_state": "RUNNING"}, START + 3600)
+        assert tracker.estimate("P0", START + 3600).finish \
+            == pytest.approx(before + 600)
+
+        # 3000 s of printing left at 100% speed, 2000 s at 150%
+        tracker.update("P0", {"spd_mag": 150}, START + 3600)
+        for k in range(1, 31):
+            tracker.update("P0", {"mc_percent": 50 + k}, START + 3600 + 40 * k)
+        assert tracker.estimate("P0", START + 4800).finish \
+            == pytest.approx(START + 5600, abs=30)
+
+        # Reports reach the tracker through the client listener
+        client._on_message(None, None, SimpleNamespace(payload=json.dumps(
+            {"print": {"gcode_state": "FAILED"}}).encode()))
+        assert tracker.estimate("P0") is None
+        tracker.remove("P0")
+        assert not client._report_listeners
+        tracker.add(client)
+        assert len(client._report_listeners) == 1
+        assert tracker.serials == ["P0"]
+        client._on_message(None, None, SimpleNamespace(payload=json.dumps(
+            {"print": {"gcode_state": "RUNNING",
+                       "mc_remaining_time": 10}}).encode()))
+        assert tracker.estimate("P0") is not None
+
+    def test_back_to_back(self):
+        """
+        test_back_to_back Test a print started after a finished one does not
+        inherit its progress
+        """
+        tracker = EtaTracker([PrinterMQTTClient("", "", "P0")])
+        _print(tracker, "P0", DURATION, firmware_error=1)
+        tracker.update("P0", {"gcode_state": "FINISH"}, START + DURATION)
+
+        start = START + DURATION + 600
+        tracker.update("P0", {"gcode_state": "RUNNING",
+                              "mc_remaining_time": 60}, start)
+        tracker.update("P0", {"mc_remaining_time": 60}, start + 60)
+        eta = tracker.estimate("P0", start + 60)
+        assert math.isnan(eta.progress)
+        assert eta.finish == pytest.approx(start + 3600, abs=60)
+
+        _print(tracker, "P0", 1200, firmware_error=1, start=start, since=60)
+        eta = tracker.estimate("P0", start + 1200)
+        assert eta.progress == 0.2
+        assert eta.finish == pytest.approx(start + DURATION, abs=300)
+
+    def test_fleet_query(self):
+        """
+        test_fleet_query Test the vectorized query matches the estimates
+        """
+        clients = [PrinterMQTTClient("", "", f"P{i}") for i in range(4)]
+        tracker = EtaTracker(clients)
+        for i in range(3):
+            _print(tracker, f"P{i}", 600 * (i + 1), start=START - 600 * i)
+        now = START + 600
+        finish, low, high = tracker.finish_times(now)
+        etas = tracker.estimates(now)
+        assert sorted(etas) == ["P0", "P1", "P2"]
+        for serial, t, lo, hi in zip(tracker.serials, finish, low, high):
+            if serial == "P3":
+                assert math.isnan(t)
+                continue
+            assert t == pytest.approx(etas[serial].finish)
+            assert (lo, hi) == pytest.approx((etas[serial].low,
+                                              etas[serial].high))
+        assert tracker.finishing_before(math.inf, now=now) \
+            == ["P2", "P1", "P0"]
+        assert tracker.finishing_before(0, now=now) == []
+        with pytest.raises(ValueError):
+            EtaTracker(halflife=0)
@@ -0,0 +1,145 @@
+"""
+Test the fleet command broadcast
+"""
+
+import threading
+import time
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api.fleet import Fleet
+from bambulabs_api.mqtt_client import PrinterMQTTClient
+
+
+class FakeClient:
+    """
+    MQTT client stand-in recording the commands it receives
+    """
+
+    def __init__(self, serial, delay=0.0):
+        self.serial = serial
+        self.delay = delay
+        self.calls = []
+
+    def turn_light_off(self):
+        time.sleep(self.delay)
+        self.calls.append(("turn_light_off",))
+        return True
+
+    def set_print_speed_lvl(self, speed_lvl=1):
+        self.calls.append(("set_print_speed_lvl", speed_lvl))
+        return speed_lvl != 4
+
+    def pause_print(self):
+        raise ConnectionError("offline")
+
+
+class FakePrinter:
+    """
+    Printer stand-in exposing its MQTT client
+    """
+
+    def __init__(self, serial, delay=0.0):
+        self.serial = serial
+        self.mqtt_client = FakeClient(serial, delay)
+
+
+class TestFleet:
+    """
+    TestFleet Class for testing fleet broadcasts
+    """
+
+    def test_select(self):
+        """
+        test_select Test selecting printers by tag, serials and predicate
+        """
+        with Fleet() as fleet:
+            for i in range(4):
+                fleet.add(FakePrinter(f"P{i}"),
+                          tags=["bay3"] if i % 2 else ["bay1"])
+            assert len(fleet.select()) == 4
+            assert [p.serial for p in fleet.select("bay3")] == ["P1", "P3"]
+            assert [p.serial for p in fleet.select(["P0", "P9"])] == ["P0"]
+            assert [p.serial for p in fleet.select(
+                lambda p: p.serial > "P1")] == ["P2", "P3"]
+            fleet.remove("P3")
+            assert fleet.tags("P1") == {"bay3"}
+            assert len(fleet) == 3
+
+    def test_broadcast_concurrent(self):
+        """
+        test_broadcast_concurrent Test commands run on every printer at once
+        """
+        printers = [FakePrinter(f"P{i}", delay=0.2) for i in range(50)]
+        with Fleet(printers, max_workers=64) as fleet:
+            start = time.perf_counter()
+            results = fleet.broadcast("turn_light_off")
+            assert time.perf_counter() - start < 2
+        assert set(results) == {p.serial for p in printers}
+        assert all(r.ok and r.value is True for r in results.values())
+        assert all(p.mqtt_client.calls == [("turn_light_off",)]
+                   for p in printers)
+
+    def test_broadcast_results(self):
+        """
+        test_broadcast_results Test arguments, failures and refused commands
+        """
+        fleet = Fleet([FakePrinter("P0"), FakeClient("P1")])
+        fleet.add(FakePrinter("P2"), tags=["bay3"])
+
+        results = fleet.broadcast("set_print_speed_lvl", 4, selector=["P0"])
+        assert list(results) == ["P0"]
+        assert results["P0"].value is False and not results["P0"].ok
+
+        results = fleet.broadcast("set_print_speed_lvl", speed_lvl=2)
+        assert all(r.ok for r in results.values())
+        assert fleet["P1"].calls == [("set_print_speed_lvl", 2)]
+
+        results = fleet.broadcast("pause_print", selector="bay3")
+        assert isinstance(results["P2"].error, ConnectionError)
+
+        results = fleet.broadcast(lambda p, level: p.serial * level, 2)
+        assert results["P1"].value == "P1P1"
+
+        with pytest.raises(ValueError):
+            fleet.broadcast("get_bed_temperature")
+        fleet.close()
+
+    def test_broadcast_timeout(self):
+        """
+        test_broadcast_timeout Test slow printers get a timeout result
+        """
+        release = threading.Event()
+        fleet = Fleet([FakePrinter("fast"), FakePrinter("slow")])
+
+        def command(printer):
+            if printer.serial == "slow":
+                release.wait(5)
+            return True
+
+        start = time.perf_counter()
+        results = fleet.broadcast(command, timeout=0.2)
+        assert time.perf_counter() - start < 1
+        release.set()
+        assert results["fast"].ok
+        assert isinstance(results["slow"].error, TimeoutError)
+        fleet.close()
+
+    def test_broadcast_frees_workers(self):
+        """
+        test_broadcast_frees_workers Test commands that are never sent stop
+        waiting at the broadcast timeout
+        """
+        paho = pytest.importorskip("paho.mqtt.client")
+        client = PrinterMQTTClient("", "", "stuck")
+        client._client.is_connected = lambda: True
+        client._client.publish = lambda *args: paho.MQTTMessageInfo(1)
+        fleet = Fleet([client], max_workers=1)
+        start = time.perf_counter()
+        results = fleet.broadcast("turn_light_on", timeout=0.2)
+        assert isinstance(results["stuck"].error, TimeoutError)
+        # The worker is free again for the next broadcast
+        results = fleet.broadcast(lambda p: True, timeout=2)
+        assert results["stuck"].ok
+        assert time.perf_counter() - start < 2
+        fleet.close()
@@ -0,0 +1,56 @@
+"""
+Test the FTP upload sources
+"""
+
+import asyncio
+import io
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api.ftp_client import aiter_chunks, iter_chunks
+
+
+class TestUploadSources:
+    """
+    TestUploadSources Class for testing the upload chunking
+    """
+
+    def test_iter_chunks(self):
+        """
+        test_iter_chunks Test every source type is split without copies
+        """
+        data = bytes(range(256)) * 40
+        chunks = list(iter_chunks(data, 4096))
+        assert [len(c) for c in chunks] == [4096, 4096, 2048]
+        assert all(c.obj is data for c in chunks)
+        assert b"".join(chunks) == data
+
+        view = memoryview(bytearray(data)).cast("I")
+        assert b"".join(iter_chunks(view, 1000)) == data
+
+        assert b"".join(bytes(c) for c in iter_chunks(io.BytesIO(data),
+                                                      3000)) == data
+        generator = (data[i:i + 7] for i in range(0, len(data), 7))
+        assert b"".join(iter_chunks(generator)) == data
+
+    def test_aiter_chunks(self):
+        """
+        test_aiter_chunks Test stream readers and async iterables are read
+        """
+        async def collect(source):
+            return [chunk async for chunk in aiter_chunks(source, 4)]
+
+        async def main():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b"0123456789")
+            reader.feed_eof()
+
+            async def generate():
+                yield b"ab"
+                yield b""
+                yield b"cd"
+
+            return await collect(reader), await collect(generate())
+
+        assert asyncio.run(main()) == ([b"0123", b"4567", b"89"],
+                                       [b"ab", b"cd"])
@@ -0,0 +1,222 @@
+"""
+Test the printer gateway
+"""
+
+import base64
+import http.client
+import json
+import os
+import socket
+import struct
+from types import SimpleNamespace
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api.gateway import Gateway
+from bambulabs_api.mqtt_client import PrinterMQTTClient
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 32 + b"\xff\xd9"
+
+
+def _message(report):
+    return SimpleNamespace(payload=json.dumps({"print": report}).encode())
+
+
+class FakePrinter:
+    """
+    Printer stand-in with a real MQTT client and a fake camera
+    """
+
+    def __init__(self, serial):
+        self.serial = serial
+        self.mqtt_client = PrinterMQTTClient("", "", serial)
+        self.camera_client = SimpleNamespace(last_frame=None)
+
+
+def _ws_connect(port, path):
+    sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n"
+                 f"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                 f"Sec-WebSocket-Key: {key}\r\n"
+                 f"Sec-WebSocket-Version: 13\r\n\r\n".encode())
+    head = b""
+    while not head.endswith(b"\r\n\r\n"):
+        head += sock.recv(1)
+    assert head.startswith(b"HTTP/1.1 101")
+    return sock
+
+
+def _recv_exactly(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        assert chunk
+        data += chunk
+    return data
+
+
+def _ws_message(sock):
+    opcode, size = _recv_exactly(sock, 2)
+    size &= 0x7F
+    if size == 126:
+        size = struct.unpack("!H", _recv_exactly(sock, 2))[0]
+    elif size == 127:
+        size = struct.unpack("!Q", _recv_exactly(sock, 8))[0]
+    assert opcode & 0x0F == 1
+    return json.loads(_recv_exactly(sock, size))
+
+
+@pytest.fixture
+def gateway():
+    printer = FakePrinter("GW1")
+    gateway = Gateway([printer], connect=False, max_fps=100)
+    gateway.start_in_thread(port=0)
+    yield gateway, printer
+    gateway.close()
+
+
+class TestGateway:
+    """
+    TestGateway Class for testing the HTTP and WebSocket gateway
+    """
+
+    def test_state_etag(self, gateway):
+        """
+        test_state_etag Test conditional GETs of the cached state
+        """
+        gateway, printer = gateway
+        client = printer.mqtt_client
+        client._on_message(None, None, _message({"mc_percent": 10}))
+        conn = http.client.HTTPConnection("127.0.0.1", gateway.port)
+
+        conn.request("GET", "/printers/GW1/state")
+        response = conn.getresponse()
+        etag = response.getheader("ETag")
+        state = json.loads(response.read())
+        assert response.status == 200
+        assert state["data"] == {"mc_percent": 10}
+        assert state["version"] == 1
+
+        conn.request("GET", "/printers/GW1/state",
+                     headers={"If-None-Match": etag})
+        response = conn.getresponse()
+        assert response.status == 304
+        assert response.read() == b""
+
+        client._on_message(None, None, _message({"bed_temper": 60.0}))
+        conn.request("GET", "/printers/GW1/state",
+                     headers={"If-None-Match": etag})
+        response = conn.getresponse()
+        assert response.status == 200
+        assert response.getheader("ETag") != etag
+        assert json.loads(response.read())["data"] == {
+            "mc_percent": 10, "bed_temper": 60.0}
+
+        conn.request("GET", "/printers")
+        response = conn.getresponse()
+        assert json.loads(response.read())["printers"][0]["version"] == 2
+        conn.request("GET", "/printers/NOPE/state")
+        assert conn.getresponse().status == 404
+        conn.close()
+
+    def test_websocket(self, gateway):
+        """
+        test_websocket Test the state then the deltas are pushed
+        """
+        gateway, printer = gateway
+        printer.mqtt_client._on_message(None, None,
+                                        _message({"mc_percent": 10}))
+        sock = _ws_connect(gateway.port, "/printers/GW1/ws")
+        first = _ws_message(sock)
+        assert first["type"] == "state"
+        assert first["data"] == {"mc_percent": 10}
+
+        printer.mqtt_client._on_message(None, None,
+                                        _message({"mc_percent": 11}))
+        delta = _ws_message(sock)
+        assert delta == {"type": "delta", "serial": "GW1", "version": 2,
+                         "data": {"mc_percent": 11}}
+        sock.close()
+
+    def test_camera(self, gateway):
+        """
+        test_camera Test the latest frame and the MJPEG stream
+        """
+        gateway, printer = gateway
+        conn = http.client.HTTPConnection("127.0.0.1", gateway.port)
+        conn.request("GET", "/printers/GW1/camera.jpg")
+        response = conn.getresponse()
+        response.read()
+        assert response.status == 503
+
+        printer.camera_client.last_frame = bytearray(JPEG)
+        conn.request("GET", "/printers/GW1/camera.jpg")
+        response = conn.getresponse()
+        etag = response.getheader("ETag")
+        assert response.read() == JPEG
+        assert response.getheader("Content-Type") == "image/jpeg"
+        conn.request("GET", "/printers/GW1/camera.jpg",
+                     headers={"If-None-Match": etag})
+        response = conn.getresponse()
+        response.read()
+        assert response.status == 304
+        conn.close()
+
+        sock = socket.create_connection(("127.0.0.1", gateway.port),
+                                        timeout=5)
+        sock.sendall(b"GET /printers/GW1/camera.mjpg HTTP/1.1\r\n\r\n")
+        data = b""
+        while data.count(b"\xff\xd9") < 2:
+            if data.count(b"\xff\xd9") == 1:
+                printer.camera_client.last_frame = bytearray(JPEG)
+            chunk = sock.recv(65536)
+            assert chunk
+            data += chunk
+        assert b"multipart/x-mixed-replace; boundary=frame" in data
+        assert data.count(b"--frame\r\nContent-Type: image/jpeg") == 2
+        sock.close()
+
+    def test_command(self, gateway):
+        """
+        test_command Test commands are proxied and checked
+        """
+        gateway, printer = gateway
+        calls = []
+        printer.mqtt_client.set_print_speed_lvl = \
+            lambda speed_lvl=1: calls.append(speed_lvl) or True
+        conn = http.client.HTTPConnection("127.0.0.1", gateway.port)
+        conn.request("POST", "/printers/GW1/commands/set_print_speed_lvl",
+                     body=json.dumps({"args": [3]}))
+        response = conn.getresponse()
+        assert json.loads(response.read()) == {"ok": True, "value": True}
+        assert calls == [3]
+
+        conn.request("POST", "/printers/GW1/commands/set_print_speed_lvl",
+                     body=json.dumps({"kwargs": {"speed": 3}}))
+        response = conn.getresponse()
+        response.read()
+        assert response.status == 400
+
+        conn.request("POST", "/printers/GW1/commands/disconnect")
+        response = conn.getresponse()
+        response.read()
+        assert response.status == 404
+        conn.close()
+
+    def test_token(self):
+        """
+        test_token Test requests without the token are refused
+        """
+        with Gateway([FakePrinter("GW2")], connect=False,
+                     token="secret") as gateway:
+            gateway.start_in_thread(port=0)
+            conn = http.client.HTTPConnection("127.0.0.1", gateway.port)
+            conn.request("GET", "/printers")
+            response = conn.getresponse()
+            response.read()
+            assert response.status == 401
+            conn.request("GET", "/printers",
+                         headers={"Authorization": "Bearer secret"})
+            assert conn.getresponse().status == 200
+            conn.close()
@@ -0,0 +1,43 @@
+"""
+Test the instrumentation spans and profiler
+"""
+
+from types import SimpleNamespace
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api import instrumentation
+from bambulabs_api.mqtt_client import PrinterMQTTClient
+
+
+class TestInstrumentation:
+    """
+    TestInstrumentation Class for testing spans and profiling mode
+    """
+
+    def test_disabled_span_is_noop(self):
+        """
+        test_disabled_span_is_noop Test spans are shared no-ops by default
+        """
+        assert not instrumentation.ACTIVE
+        assert instrumentation.span("a") is instrumentation.span("b")
+
+    def test_profiling(self):
+        """
+        test_profiling Test spans around report ingest are aggregated
+        """
+        profiler = instrumentation.enable_profiling()
+        try:
+            client = PrinterMQTTClient("", "", "SERIAL1")
+            for _ in range(3):
+                client._on_message(
+                    None, None,
+                    SimpleNamespace(payload=b'{"print": {"mc_percent": 1}}'))
+        finally:
+            assert instrumentation.disable_profiling() is profiler
+
+        report = profiler.report()
+        assert report["mqtt.decode"]["count"] == 3
+        assert report["mqtt.merge"]["count"] == 3
+        assert "mqtt.decode" in profiler.format()
+        assert not instrumentation.ACTIVE
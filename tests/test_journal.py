@@ -0,0 +1,85 @@
+"""
+Test the report journal and replay
+"""
+
+import json
+from types import SimpleNamespace
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api.journal import JournalReader, JournalWriter, replay
+from bambulabs_api.mqtt_client import PrinterMQTTClient
+
+
+def _payload(**report):
+    return json.dumps({"print": report}).encode()
+
+
+class TestJournal:
+    """
+    TestJournal Class for testing journaling and replay
+    """
+
+    def test_segments_and_window(self, tmp_path):
+        """
+        test_segments_and_window Test rotation, the index and time windows
+        """
+        writer = JournalWriter(tmp_path, "P1", segment_seconds=10)
+        for t in range(25):
+            writer.append(_payload(mc_percent=t), timestamp=1000.0 + t)
+        writer.flush()
+
+        reader = JournalReader(tmp_path, "P1")
+        segments = reader.segments()
+        assert [s.start for s in segments] == [1000.0, 1010.0, 1020.0]
+        assert segments[0].count == 10 and segments[-1].end is None
+
+        window = list(reader.records(since=1012, until=1021))
+        assert [t for t, _ in window] == [1012.0 + i for i in range(10)]
+        writer.close()
+        assert reader.segments()[-1].end == 1024.0
+        assert JournalReader(tmp_path, "P2").segments() == []
+
+    def test_delta_replay(self, tmp_path):
+        """
+        test_delta_replay Test delta journals replay to the same state
+        """
+        writer = JournalWriter(tmp_path, "P1", delta=True)
+        reports = [{"gcode_state": "RUNNING", "mc_percent": 1, "ams": {}},
+                   {"gcode_state": "RUNNING", "mc_percent": 1},
+                   {"gcode_state": "RUNNING", "mc_percent": 2}]
+        for t, report in enumerate(reports):
+            writer.append(_payload(**report), timestamp=float(t))
+        writer.close()
+        assert writer.records == 2
+
+        client = PrinterMQTTClient("", "", "P1")
+        seen = []
+        client.add_report_listener(seen.append)
+        assert replay(JournalReader(tmp_path, "P1"), client) == 2
+        assert seen[1] == {"mc_percent": 2}
+        assert client._data == {"gcode_state": "RUNNING", "mc_percent": 2,
+                                "ams": {}}
+
+    def test_journal_failure(self, tmp_path, monkeypatch):
+        """
+        test_journal_failure Test a failing journal is disabled without
+        breaking the report ingest, and deltas reuse the decoded report
+        """
+        client = PrinterMQTTClient("", "", "P1")
+        journal = client.enable_journal(tmp_path, delta=True)
+        loads = []
+        monkeypatch.setattr("bambulabs_api.codec.loads",
+                            lambda payload: loads.append(payload))
+        client._on_message(None, None, SimpleNamespace(
+            payload=_payload(mc_percent=1)))
+        assert journal.records == 1 and loads == []
+
+        def full_disk(*args, **kwargs):
+            raise OSError(28, "No space left on device")
+
+        monkeypatch.setattr(journal, "append", full_disk)
+        client._on_message(None, None, SimpleNamespace(
+            payload=_payload(mc_percent=2)))
+        assert client.journal is None
+        assert client._data["mc_percent"] == 2
@@ -0,0 +1,63 @@
+"""
+Test the JPEG header parsing
+"""
+
+import struct
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api.jpeg import JpegInfo, parse_jpeg, validate_jpeg
+
+APP0 = b"\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+
+
+def _sof(marker, width, height, components=3):
+    body = struct.pack(">BHHB", 8, height, width, components) \
+        + b"\x01\x22\x00" * components
+    return bytes([0xFF, marker]) + struct.pack(">H", len(body) + 2) + body
+
+
+class TestJpeg:
+    """
+    TestJpeg Class for testing the frame validation
+    """
+
+    def test_parse(self):
+        """
+        test_parse Test dimensions are read from the start of frame
+        """
+        data = b"\xff\xd8" + APP0 + b"\xff\xff" + _sof(0xC0, 1920, 1080) \
+            + b"\xff\xda\x00\x02scan\xff\xd9"
+        assert parse_jpeg(data) == JpegInfo(1920, 1080, 3, False)
+        assert validate_jpeg(memoryview(bytearray(data))).width == 1920
+        progressive = b"\xff\xd8" + _sof(0xC2, 640, 480, 1)
+        assert parse_jpeg(progressive) == JpegInfo(640, 480, 1, True)
+
+    def test_invalid(self):
+        """
+        test_invalid Test malformed frames are refused
+        """
+        valid = b"\xff\xd8" + APP0 + _sof(0xC0, 64, 48) + b"\xff\xd9"
+        for data in (
+                b"\xff\xd9" + valid[2:],  # no start of image
+                valid[:-2],  # truncated
+                b"\xff\xd8" + APP0 + b"\xff\xda\x00\x02\xff\xd9",  # no SOF
+                b"\xff\xd8" + APP0 + _sof(0xC0, 0, 48) + b"\xff\xd9",
+                b"\xff\xd8" + APP0[:6] + b"\xff\xd9",  # short segment
+                b"\xff\xd8\x00" + APP0 + b"\xff\xd9"):
+            with pytest.raises(ValueError):
+                validate_jpeg(data)
+
+    def test_pillow_frames(self):
+        """
+        test_pillow_frames Test frames encoded by Pillow
+        """
+        Image = pytest.importorskip("PIL.Image")
+        import io  # pylint: disable=import-outside-toplevel
+        for progressive in (False, True):
+            out = io.BytesIO()
+            Image.new("RGB", (320, 240), "gray").save(
+                out, "JPEG", progressive=progressive)
+            info = validate_jpeg(out.getvalue())
+            assert (info.width, info.height) == (320, 240)
+            assert info.progressive is progressive
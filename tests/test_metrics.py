@@ -0,0 +1,53 @@
+"""
+Test the metrics registry
+"""
+
+import json
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api import metrics
+from bambulabs_api.mqtt_client import PrinterMQTTClient
+
+
+class TestMetrics:
+    """
+    TestMetrics Class for testing the metrics exposition
+    """
+
+    def test_render(self):
+        """
+        test_render Test client and printer metrics are exported
+        """
+        registry = metrics.enable_metrics()
+        try:
+            client = PrinterMQTTClient("", "", "SERIAL1")
+            payload = json.dumps({"print": {"bed_temper": 55.5,
+                                            "gcode_state": "RUNNING"}})
+            client._on_message(None, None,
+                               SimpleNamespace(payload=payload.encode()))
+            text = registry.render()
+        finally:
+            metrics.disable_metrics()
+
+        assert 'bambulabs_mqtt_messages_total{serial="SERIAL1"} 1.0' in text
+        assert "bambulabs_mqtt_decode_seconds_count 1" in text
+        assert ('bambulabs_printer_bed_temperature_celsius'
+                '{serial="SERIAL1"} 55.5') in text
+        assert ('bambulabs_printer_state{serial="SERIAL1",state="RUNNING"}'
+                ' 1.0') in text
+
+    def test_no_server_import(self):
+        """
+        test_no_server_import Test clients do not load the HTTP server
+        """
+        code = ("import sys; "
+                "from bambulabs_api.mqtt_client import PrinterMQTTClient; "
+                "PrinterMQTTClient('', '', 'S'); "
+                "print('http.server' in sys.modules)")
+        out = subprocess.run([sys.executable, "-c", code], check=True,
+                             capture_output=True, text=True).stdout
+        assert out.strip() == "False"
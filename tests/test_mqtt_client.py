@@ -0,0 +1,66 @@
+"""
+Test the MQTT client report handling
+"""
+
+import json
+from types import SimpleNamespace
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api.mqtt_client import PrinterMQTTClient
+
+
+def _message(report):
+    return SimpleNamespace(payload=json.dumps({"print": report}).encode())
+
+
+class TestPrinterMQTTClient:
+    """
+    TestPrinterMQTTClient Class for testing the report ingest
+    """
+
+    def test_report_fields(self):
+        """
+        test_report_fields Test fields outside the allowlist are dropped
+        """
+        client = PrinterMQTTClient("", "", "SERIAL1")
+        client.printer_timeout = -1
+        client._on_message(None, None, _message(
+            {"mc_percent": 10, "ams": {"ams": []}, "ipcam": {"x": 1}}))
+
+        seen = []
+        client.add_report_listener(seen.append)
+        client.set_report_fields(["mc_percent", "bed_temper"])
+        assert client.report_fields >= {"mc_percent", "bed_temper"}
+        assert set(client._data) == {"mc_percent"}
+
+        client._on_message(None, None, _message(
+            {"bed_temper": 60.0, "ipcam": {"x": 2}, "command": "push_status"}))
+        assert client._data == {"mc_percent": 10, "bed_temper": 60.0,
+                                "command": "push_status"}
+        assert seen == [{"bed_temper": 60.0, "command": "push_status"}]
+
+        client.set_report_fields(None)
+        assert client.report_fields is None
+
+    def test_listener_changes(self):
+        """
+        test_listener_changes Test listeners added or removed by a listener
+        only apply from the next report
+        """
+        client = PrinterMQTTClient("", "", "SERIAL1")
+        seen = []
+
+        def once(report):
+            seen.append(("once", report))
+            client.remove_report_listener(once)
+            client.add_report_listener(lambda r: seen.append(("later", r)))
+
+        client.add_report_listener(once)
+        client.add_report_listener(lambda r: seen.append(("always", r)))
+        client._on_message(None, None, _message({"mc_percent": 1}))
+        assert seen == [("once", {"mc_percent": 1}),
+                        ("always", {"mc_percent": 1})]
+        client._on_message(None, None, _message({"mc_percent": 2}))
+        assert seen[2:] == [("always", {"mc_percent": 2}),
+                            ("later", {"mc_percent": 2})]
@@ -0,0 +1,119 @@
+"""
+Test the 3MF project metadata reader
+"""
+
+import io
+import zipfile
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api.ams import AMS
+from bambulabs_api.filament_info import FilamentTray
+from bambulabs_api.project_info import compute_ams_mapping, read_project_info
+
+SLICE_INFO = """<?xml version="1.0" encoding="UTF-8"?>
+<config>
+  <plate>
+    <metadata key="index" value="1"/>
+    <filament id="1" type="PLA" color="#FF0000" used_m="1.5" used_g="4.5"/>
+    <filament id="3" type="PLA" color="#0000FF" used_m="0.5" used_g="1.5"/>
+  </plate>
+</config>
+"""
+
+
+def make_3mf(slice_info: str = SLICE_INFO) -> io.BytesIO:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as archive:
+        archive.writestr("Metadata/slice_info.config", slice_info)
+        archive.writestr("Metadata/plate_1.gcode", "G28\n")
+    buf.seek(0)
+    return buf
+
+
+def make_tray(tray_type: str, color: str) -> FilamentTray:
+    return FilamentTray(
+        k=0.02, n=1, tag_uid="", tray_id_name="", tray_info_idx="GFL99",
+        tray_type=tray_type, tray_sub_brands="", tray_color=f"{color}FF",
+        tray_weight="1000", tray_diameter="1.75", tray_temp="55",
+        tray_time="8", bed_temp_type="1", bed_temp="35",
+        nozzle_temp_max=240, nozzle_temp_min=190, xcam_info="",
+        tray_uuid="")
+
+
+class TestProjectInfo:
+    """
+    TestProjectInfo Class for testing the 3MF metadata reader
+    """
+
+    def test_read_plates(self):
+        """
+        test_read_plates Test the plate filaments are parsed and cached
+        """
+        info = read_project_info(make_3mf())
+        plate = info.get_plate(1)
+        assert [f.id for f in plate.filaments] == [1, 3]
+        assert plate.filaments[0].color == "FF0000"
+        assert info.filament_count == 3
+        assert read_project_info(make_3mf()) is info
+
+    def test_cache_keys(self, tmp_path, monkeypatch):
+        """
+        test_cache_keys Test file objects are hashed from the start and
+        unchanged paths are not read again
+        """
+        info = read_project_info(make_3mf())
+        moved = make_3mf()
+        moved.seek(10)
+        assert read_project_info(moved) is info
+
+        path = tmp_path / "part.3mf"
+        path.write_bytes(make_3mf(SLICE_INFO.replace("FF0000", "00FF00"))
+                         .getvalue())
+        first = read_project_info(path)
+        hashed = []
+        monkeypatch.setattr("bambulabs_api.project_info._hash_file",
+                            lambda fp: hashed.append(fp) or "")
+        assert read_project_info(str(path)) is first
+        assert hashed == []
+
+    def test_compute_ams_mapping(self):
+        """
+        test_compute_ams_mapping Test trays are matched by type and colour
+        """
+        ams = AMS(humidity="5", temperature=25.0)
+        ams.set_filament_tray(make_tray("PLA", "0000F0"), 0)
+        ams.set_filament_tray(make_tray("PETG", "FF0000"), 1)
+        ams.set_filament_tray(make_tray("PLA", "F00000"), 2)
+
+        plate = read_project_info(make_3mf()).get_plate(1)
+        assert compute_ams_mapping(plate, {0: ams}) == [2, -1, 0]
+
+    def test_compute_ams_mapping_missing(self):
+        """
+        test_compute_ams_mapping_missing Test unmatched filaments raise
+        """
+        ams = AMS(humidity="5", temperature=25.0)
+        ams.set_filament_tray(make_tray("ABS", "FF0000"), 0)
+
+        plate = read_project_info(make_3mf()).get_plate(1)
+        with pytest.raises(ValueError):
+            compute_ams_mapping(plate, {0: ams})
+
+    def test_plate_objects(self):
+        """
+        test_plate_objects Test objects are read from plate_<n>.json
+        """
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w") as archive:
+            archive.writestr("Metadata/slice_info.config", SLICE_INFO)
+            archive.writestr(
+                "Metadata/plate_1.json",
+                '{"bbox_objects": [{"id": 71, "name": "Cube"},'
+                ' {"id": 93, "name": "Cone"}]}')
+        plate = read_project_info(buf).get_plate(1)
+
+        assert [o.name for o in plate.objects] == ["Cube", "Cone"]
+        assert plate.find_objects(["Cone"]) == [93]
+        with pytest.raises(ValueError):
+            plate.find_objects(["Sphere"])
@@ -0,0 +1,102 @@
+"""
+Test the fleet refresh scheduler
+"""
+
+import time
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api.mqtt_client import PrinterMQTTClient
+from bambulabs_api.refresh import RefreshScheduler
+
+
+class FakeClient:
+    """
+    MQTT client stand-in recording its pushall requests
+    """
+
+    def __init__(self, serial, last_report=0.0, stale=False):
+        self.serial = serial
+        self.last_report = last_report
+        self.stale = stale
+        self.refresher = None
+        self.pushes = []
+
+    def pushall(self):
+        self.pushes.append(time.monotonic())
+        return True
+
+
+class TestRefreshScheduler:
+    """
+    TestRefreshScheduler Class for testing pushall scheduling
+    """
+
+    def test_rate_limit(self):
+        """
+        test_rate_limit Test printers without state are refreshed at the
+        global rate
+        """
+        clients = [FakeClient(f"P{i}") for i in range(5)]
+        scheduler = RefreshScheduler(clients, period=60, max_rate=20)
+        assert all(c.refresher is scheduler for c in clients)
+        start = time.monotonic()
+        scheduler.start()
+        deadline = start + 2
+        while scheduler.sent < 5 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        scheduler.stop()
+
+        pushes = sorted(t for c in clients for t in c.pushes)
+        assert len(pushes) == 5
+        assert all(b - a >= 0.045 for a, b in zip(pushes, pushes[1:]))
+
+    def test_fresh_skipped(self):
+        """
+        test_fresh_skipped Test printers reporting recently are not refreshed
+        """
+        now = time.time()
+        fresh = FakeClient("FRESH", last_report=now)
+        old = FakeClient("OLD", last_report=now - 100)
+        stale = FakeClient("STALE", last_report=now, stale=True)
+        scheduler = RefreshScheduler([fresh, old, stale], period=0.2,
+                                     max_rate=100, max_age=30)
+        assert not scheduler.request("FRESH")
+        assert scheduler.request("OLD")
+        scheduler.start()
+        time.sleep(0.5)
+        scheduler.stop()
+
+        assert fresh.pushes == []
+        assert len(stale.pushes) >= 1 and len(old.pushes) >= 1
+        assert scheduler.skipped >= 1
+
+    def test_request(self):
+        """
+        test_request Test getter requests are coalesced per printer
+        """
+        client = FakeClient("P0", last_report=time.time() - 100)
+        scheduler = RefreshScheduler([client], period=60, max_rate=100,
+                                     max_age=30)
+        scheduler.start()
+        for _ in range(50):
+            assert scheduler.request("P0")
+            time.sleep(0.005)
+        scheduler.stop()
+        assert len(client.pushes) == 1
+
+        scheduler.remove("P0")
+        assert client.refresher is None
+        assert not scheduler.request("P0")
+        with pytest.raises(ValueError):
+            RefreshScheduler(max_rate=0)
+
+    def test_manual_update(self):
+        """
+        test_manual_update Test getters go through the scheduler
+        """
+        client = PrinterMQTTClient("", "", "P0")
+        scheduler = RefreshScheduler([client])
+        assert client.manual_update()
+        assert client.get_last_print_percentage() is None
+        assert scheduler.sent == 0
@@ -0,0 +1,168 @@
+"""
+Test the job queue and scheduler
+"""
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api.scheduler import JobQueue, JobScheduler, JobState
+
+
+class FakePrinter:
+    """
+    Printer stand-in recording uploads and prints
+    """
+
+    def __init__(self, serial, materials=("PLA",)):
+        self.serial = serial
+        self.materials = materials
+        self.listeners = []
+        self.uploads = []
+        self.started = []
+        self.deleted = []
+
+    def get_state(self):
+        return "IDLE"
+
+    def add_report_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_report_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def report(self, **fields):
+        for listener in self.listeners:
+            listener(fields)
+
+    def compute_ams_mapping(self, path, plate):
+        if "petg" in path and "PETG" not in self.materials:
+            raise ValueError("No loaded tray matches filament(s) 1 (PETG)")
+        return [0]
+
+    def upload_file(self, fp, filename):
+        self.uploads.append((filename, fp.read()))
+        return "226 Transfer complete"
+
+    def start_print(self, filename, plate, use_ams, mapping):
+        self.started.append((filename, plate, mapping))
+        return True
+
+    def delete_file(self, filename):
+        self.deleted.append(filename)
+
+
+class TestScheduler:
+    """
+    TestScheduler Class for testing job dispatch
+    """
+
+    def test_queue_order_and_persistence(self, tmp_path):
+        """
+        test_queue_order_and_persistence Test priorities, retries and reload
+        """
+        db = tmp_path / "jobs.db"
+        queue = JobQueue(db)
+        low = queue.add("a.3mf")
+        high = queue.add("b.3mf", priority=5, printers=["P2"])
+        assert queue.claim("P1").id == low.id
+        assert queue.claim("P1") is None
+        assert queue.claim("P2").id == high.id
+
+        assert queue.release(high.id, "upload failed").state == \
+            JobState.QUEUED
+        queue.add("c.3mf", max_attempts=1)
+        queue.close()
+
+        queue = JobQueue(db)
+        # The claimed job was uploading, it is queued again on reload
+        assert [j.path for j in queue.jobs(JobState.QUEUED)] == \
+            ["b.3mf", "a.3mf", "c.3mf"]
+        job = queue.claim("P1", exclude=[low.id])
+        assert queue.release(job.id, "upload failed").state == \
+            JobState.FAILED
+        assert queue.counts() == {JobState.QUEUED: 2, JobState.FAILED: 1}
+
+    def test_dispatch_pipeline(self, tmp_path):
+        """
+        test_dispatch_pipeline Test jobs are prefetched, started and finished
+        """
+        for name in ("cube.3mf", "petg.3mf", "next.3mf"):
+            (tmp_path / name).write_bytes(name.encode())
+        p1, p2 = FakePrinter("P1"), FakePrinter("P2", ("PLA", "PETG"))
+        scheduler = JobScheduler(JobQueue(), [p1])
+        cube = scheduler.submit(tmp_path / "cube.3mf", priority=1)
+        petg = scheduler.submit(tmp_path / "petg.3mf")
+        nxt = scheduler.submit(tmp_path / "next.3mf")
+
+        scheduler.dispatch()
+        scheduler.wait_for_uploads()
+        scheduler.dispatch()
+        assert p1.started == [(f"job{cube.id}_cube.3mf", 1, [0])]
+
+        p1.report(gcode_state="RUNNING", mc_percent=50)
+        scheduler.dispatch()
+        assert len(p1.uploads) == 1
+
+        # Prefetch while finishing, the PETG job does not fit P1
+        p1.report(mc_percent=95)
+        scheduler.dispatch()
+        scheduler.wait_for_uploads()
+        scheduler.dispatch()
+        scheduler.wait_for_uploads()
+        assert [u[0] for u in p1.uploads][-1] == f"job{nxt.id}_next.3mf"
+        assert scheduler.queue.get(nxt.id).state == JobState.STAGED
+
+        p1.report(gcode_state="FINISH", mc_percent=100)
+        scheduler.dispatch()
+        assert scheduler.queue.get(cube.id).state == JobState.DONE
+        assert p1.started[-1][0] == f"job{nxt.id}_next.3mf"
+
+        scheduler.add_printer(p2)
+        scheduler.dispatch()
+        scheduler.wait_for_uploads()
+        scheduler.dispatch()
+        assert p2.started == [(f"job{petg.id}_petg.3mf", 1, [0])]
+        scheduler.stop()
+        assert p1.deleted == [f"job{cube.id}_cube.3mf"]
+
+        # Stopped schedulers can be started again
+        scheduler.start()
+        scheduler.stop()
+        p2.report(gcode_state="RUNNING", mc_percent=50)
+        scheduler.dispatch()
+        p2.report(gcode_state="FINISH", mc_percent=100)
+        last = scheduler.submit(tmp_path / "cube.3mf")
+        scheduler.dispatch()
+        scheduler.wait_for_uploads()
+        assert p2.uploads[-1][0] == f"job{last.id}_cube.3mf"
+        scheduler.stop()
+
+    def test_next_print_progress(self, tmp_path):
+        """
+        test_next_print_progress Test the progress of a finished print does
+        not prefetch a job at the start of the next one
+        """
+        for name in ("a.3mf", "b.3mf", "c.3mf"):
+            (tmp_path / name).write_bytes(name.encode())
+        printer = FakePrinter("P1")
+        scheduler = JobScheduler(JobQueue(), [printer])
+        jobs = [scheduler.submit(tmp_path / name)
+                for name in ("a.3mf", "b.3mf", "c.3mf")]
+        scheduler.dispatch()
+        scheduler.wait_for_uploads()
+        scheduler.dispatch()
+        printer.report(gcode_state="RUNNING", mc_percent=95)
+        scheduler.dispatch()
+        scheduler.wait_for_uploads()
+        printer.report(gcode_state="FINISH", mc_percent=100)
+        scheduler.dispatch()
+        assert printer.started[-1][0] == f"job{jobs[1].id}_b.3mf"
+
+        # The new print reports its state before its progress
+        printer.report(gcode_state="PREPARE")
+        scheduler.dispatch()
+        printer.report(gcode_state="RUNNING")
+        scheduler.dispatch()
+        scheduler.wait_for_uploads()
+        assert len(printer.uploads) == 2
+        assert scheduler.queue.get(jobs[2].id).state == JobState.QUEUED
+        scheduler.stop()
@@ -0,0 +1,79 @@
+"""
+Test the sharded fleet runtime
+"""
+
+import time
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api.shard import (GCODE_STATES, PrinterSpec, ShardedFleet,
+                                 _FrameSlots, _StateTable)
+from bambulabs_api.simulator import SimulatedFleet
+from bambulabs_api.states_info import GcodeState
+
+
+class TestShardedFleet:
+    """
+    TestShardedFleet Class for testing the shared memory fleet runtime
+    """
+
+    def test_state_table(self):
+        """
+        test_state_table Test rows keep the last value of each field
+        """
+        table = _StateTable(memoryview(bytearray(8 * 2 * 5)),
+                            ("mc_percent", "bed_temper"))
+        assert table.read(1) is None
+        table.write(1, 100.0, {"mc_percent": 5, "gcode_state": "RUNNING"})
+        table.write(1, 101.0, {"bed_temper": "60.5", "ipcam": {}})
+        seq, last_report, state, percent, bed = table.read(1)
+        assert seq == 4
+        assert last_report == 101.0
+        assert GCODE_STATES[int(state)] == GcodeState.RUNNING
+        assert (percent, bed) == (5.0, 60.5)
+        assert table.read(0) is None
+
+    def test_frame_slots(self):
+        """
+        test_frame_slots Test the latest frame stays readable while the next
+        is written
+        """
+        slots = _FrameSlots(memoryview(bytearray(2 * 2 * (32 + 16))), 16)
+        assert slots.latest(0) is None
+        assert slots.write(0, 1, b"first", 1.0)
+        assert not slots.write(0, 2, b"x" * 17, 2.0)
+        assert slots.write(0, 2, b"second", 2.0)
+        seq, timestamp, view = slots.latest(0)
+        assert (seq, timestamp, bytes(view)) == (2, 2.0, b"second")
+        assert slots.seq(0, 1) == 1
+        slots.write(0, 3, b"third", 3.0)
+        assert bytes(view) == b"second"
+        assert slots.latest(1) is None
+
+    def test_workers(self):
+        """
+        test_workers Test states written by the workers and commands
+        """
+        serials = [f"SHARD{i}" for i in range(3)]
+        sim = SimulatedFleet(serials, report_interval=0.05, speedup=10)
+        sim.start_in_thread(port=0)
+        specs = [PrinterSpec("127.0.0.1", "", serial,
+                             mqtt_port=sim.broker.port)
+                 for serial in serials]
+        try:
+            with ShardedFleet(specs, shards=2) as fleet:
+                assert fleet.shard_of("SHARD2") == 0
+                deadline = time.monotonic() + 30
+                while any(s is None or s["gcode_state"] is None
+                          for s in fleet.states().values()):
+                    assert time.monotonic() < deadline
+                    time.sleep(0.05)
+                state = fleet.state("SHARD1")
+                assert state["gcode_state"] == GcodeState.IDLE
+                assert state["bed_temper"] is not None
+                assert len(fleet.table) == 3 * len(fleet.columns)
+                assert fleet.command("SHARD1", "pushall") is True
+                with pytest.raises(ValueError):
+                    fleet.command("SHARD1", "disconnect")
+        finally:
+            sim.stop_thread()
@@ -0,0 +1,61 @@
+"""
+Test the printer simulator
+"""
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api.simulator import VirtualPrinter
+from bambulabs_api.states_info import GcodeState
+
+
+class TestVirtualPrinter:
+    """
+    TestVirtualPrinter Class for testing the simulated printer
+    """
+
+    def test_print_lifecycle(self):
+        """
+        test_print_lifecycle Test a print heats, runs, pauses and finishes
+        """
+        printer = VirtualPrinter("SIM0001", print_duration=100, seed=1)
+        printer.handle_command({"print": {"command": "project_file",
+                                          "subtask_name": "cube.3mf"}})
+        assert printer.gcode_state == GcodeState.PREPARE
+
+        for _ in range(600):
+            printer.tick(1.0)
+            if printer.gcode_state != GcodeState.PREPARE:
+                break
+        assert printer.gcode_state == GcodeState.RUNNING
+        assert printer.bed_temper == pytest.approx(55, abs=1)
+
+        printer.handle_command({"print": {"command": "pause"}})
+        printer.tick(50)
+        assert printer.gcode_state == GcodeState.PAUSE
+        assert printer.mc_percent == 0
+
+        printer.handle_command({"print": {"command": "resume"}})
+        printer.tick(100)
+        assert printer.gcode_state == GcodeState.FINISH
+        assert printer.full_report()["print"]["gcode_state"] == "FINISH"
+
+    def test_gcode_and_reports(self):
+        """
+        test_gcode_and_reports Test gcode sets targets and reports are deltas
+        """
+        printer = VirtualPrinter("SIM0001", seed=1)
+        printer.full_report()
+        assert printer.report() is None
+
+        answers = printer.handle_command(
+            {"print": {"command": "gcode_line",
+                       "param": "M140 S60\nM104 S200\n"}})
+        assert answers[0]["print"]["result"] == "success"
+        assert answers[1]["print"]["bed_target_temper"] == 60
+        assert printer.nozzle_target_temper == 200
+
+        printer.tick(1.0)
+        report = printer.report()["print"]
+        assert report["bed_temper"] > 25
+        assert "bed_target_temper" not in report
+        assert "ams" not in report
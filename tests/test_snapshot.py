@@ -0,0 +1,107 @@
+"""
+Test the printer state snapshots
+"""
+
+import gzip
+import json
+import time
+from types import SimpleNamespace
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api.mqtt_client import PrinterMQTTClient
+from bambulabs_api.snapshot import StateStore
+
+
+def _message(report):
+    return SimpleNamespace(payload=json.dumps({"print": report}).encode())
+
+
+def _client(serial):
+    client = PrinterMQTTClient("", "", serial)
+    client.printer_timeout = -1
+    return client
+
+
+class TestStateStore:
+    """
+    TestStateStore Class for testing state checkpoints and restores
+    """
+
+    def test_save_restore(self, tmp_path):
+        """
+        test_save_restore Test states come back stale after a restart
+        """
+        path = tmp_path / "states.json.gz"
+        clients = [_client("P0"), _client("P1"), _client("P2")]
+        clients[0]._on_message(None, None, _message(
+            {"gcode_state": "RUNNING", "mc_percent": 42}))
+        clients[1]._on_message(None, None, _message({"bed_temper": 60.0}))
+
+        store = StateStore(path, clients)
+        assert store.save()
+        assert not store.save()
+        with gzip.open(path) as fp:
+            assert set(json.load(fp)["printers"]) == {"P0", "P1"}
+
+        restarted = [_client("P0"), _client("P1"), _client("P2")]
+        store = StateStore(path, restarted)
+        assert store.restore() == ["P0", "P1"]
+        assert restarted[0].get_last_print_percentage() == 42
+        assert restarted[0].stale and not restarted[2].stale
+        assert restarted[0].last_report == clients[0].last_report
+
+        restarted[0]._on_message(None, None, _message({"mc_percent": 50}))
+        assert not restarted[0].stale
+        assert restarted[0].get_printer_state().value == "RUNNING"
+        assert not restarted[0].restore_state({"mc_percent": 1}, 1.0)
+
+    def test_unreadable(self, tmp_path):
+        """
+        test_unreadable Test missing or corrupt snapshots are ignored
+        """
+        path = tmp_path / "states.json.gz"
+        store = StateStore(path, [_client("P0")])
+        assert store.restore() == []
+        path.write_bytes(b"not gzip")
+        assert store.load() == {}
+        with pytest.raises(ValueError):
+            StateStore(path, interval=0)
+
+    def test_refresh(self, tmp_path):
+        """
+        test_refresh Test stale printers are refreshed one at a time
+        """
+        clients = [_client(f"P{i}") for i in range(4)]
+        for i, client in enumerate(clients):
+            client.restore_state({"mc_percent": i}, 1000.0 - i)
+        clients[1]._on_message(None, None, _message({"mc_percent": 9}))
+
+        sent = []
+        for client in clients:
+            client.pushall = lambda c=client: sent.append(
+                (c.serial, time.monotonic())) or True
+
+        store = StateStore(tmp_path / "states.json.gz", clients)
+        store.refresh(period=0.3).join(5)
+        assert [serial for serial, _ in sent] == ["P3", "P2", "P0"]
+        assert sent[-1][1] - sent[0][1] >= 0.15
+        store.stop()
+
+    def test_getters_after_restore(self):
+        """
+        test_getters_after_restore Test getters of a restored state send a
+        single full report request until the printer reports
+        """
+        client = PrinterMQTTClient("", "", "P0")
+        client.printer_timeout = 60
+        client.restore_state({"mc_percent": 5}, 1000.0)
+        sent = []
+        client.pushall = lambda: sent.append(1) or True
+        for _ in range(3):
+            assert client.get_last_print_percentage() == 5
+        assert len(sent) == 1
+
+        client._on_message(None, None, _message({"mc_percent": 6}))
+        client.get_last_print_percentage()
+        assert len(sent) == 2
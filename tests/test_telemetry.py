@@ -0,0 +1,69 @@
+"""
+Test the telemetry time series buffer
+"""
+
+import io
+import math
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api.telemetry import TelemetryBuffer
+
+
+class TestTelemetryBuffer:
+    """
+    TestTelemetryBuffer Class for testing the telemetry ring buffer
+    """
+
+    def test_ring_and_queries(self):
+        """
+        test_ring_and_queries Test samples wrap around and are aggregated
+        """
+        buf = TelemetryBuffer(fields=("bed_temper", "mc_percent"), capacity=4)
+        for t in range(6):
+            buf.record({"bed_temper": 20 + t}, timestamp=float(t))
+        buf.record({"mc_percent": 50}, timestamp=6.0)
+
+        data = buf.columns()
+        assert list(data["timestamp"]) == [3.0, 4.0, 5.0, 6.0]
+        assert list(data["bed_temper"]) == [23.0, 24.0, 25.0, 25.0]
+        assert math.isnan(data["mc_percent"][0])
+        assert buf.min("bed_temper") == 23.0
+        assert buf.max("bed_temper", until=4.0) == 24.0
+        assert buf.mean("mc_percent") == 50.0
+        assert not buf.record({"gcode_state": "RUNNING"})
+
+    def test_windows(self):
+        """
+        test_windows Test time windows at every ring position
+        """
+        for recorded in range(1, 12):
+            buf = TelemetryBuffer(fields=("bed_temper",), capacity=5)
+            for t in range(recorded):
+                buf.record({"bed_temper": t}, timestamp=float(t))
+            kept = list(range(max(0, recorded - 5), recorded))
+            for since in range(-1, 12):
+                for until in (since - 1, since + 2, None):
+                    expected = [v for v in kept if v >= since and
+                                (until is None or v <= until)]
+                    data = buf.columns(since, until)
+                    assert list(data["bed_temper"]) == expected
+                    assert list(data["timestamp"]) == expected
+                    assert buf.max("bed_temper", since, until) \
+                        == max(expected, default=None)
+
+    def test_downsample_and_csv(self):
+        """
+        test_downsample_and_csv Test bucketing and CSV export
+        """
+        buf = TelemetryBuffer(fields=("nozzle_temper",), capacity=10)
+        for t in range(6):
+            buf.record({"nozzle_temper": str(t)}, timestamp=float(t))
+
+        data = buf.downsample(2.0)
+        assert list(data["timestamp"]) == [0.0, 2.0, 4.0]
+        assert list(data["nozzle_temper"]) == [0.5, 2.5, 4.5]
+
+        out = io.StringIO()
+        assert buf.to_csv(out, since=4.0) == 2
+        assert out.getvalue().splitlines()[0] == "timestamp,nozzle_temper"
@@ -0,0 +1,109 @@
+"""
+Test the shared TLS configuration and session reuse
+"""
+
+import socket
+import ssl
+import threading
+
+import pytest  # noqa: F401, F403
+
+from bambulabs_api.simulator.broker import make_ssl_context
+from bambulabs_api.tls import (TLSConfig, get_default_config,
+                               set_default_config)
+
+
+@pytest.fixture(scope="module")
+def server():
+    """
+    TLS server answering each connection with one line, then closing it
+    """
+    context = make_ssl_context()
+    listener = socket.create_server(("127.0.0.1", 0))
+
+    def serve():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            try:
+                with context.wrap_socket(conn, server_side=True) as tls:
+                    tls.sendall(b"hello\n")
+                    tls.recv(16)
+            except (OSError, ssl.SSLError):
+                pass
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield listener.getsockname()
+    listener.close()
+
+
+def _exchange(context, address, session=None):
+    sock = socket.create_connection(address, timeout=5)
+    with context.wrap_socket(sock, session=session) as tls:
+        assert tls.recv(16) == b"hello\n"
+        return tls.session_reused
+
+
+class TestTLSConfig:
+    """
+    TestTLSConfig Class for testing the shared TLS settings
+    """
+
+    def test_context(self):
+        """
+        test_context Test the context is built once from the settings
+        """
+        config = TLSConfig()
+        assert config.stats() == {"handshakes": 0, "resumed": 0,
+                                  "sessions": 0}
+        context = config.context
+        assert context is config.context
+        assert context.verify_mode == ssl.CERT_NONE
+        assert not context.check_hostname
+        assert context.minimum_version == ssl.TLSVersion.TLSv1_2
+        assert TLSConfig(verify=True).context.verify_mode == \
+            ssl.CERT_REQUIRED
+        with pytest.raises(ValueError):
+            TLSConfig(max_sessions=-1)
+
+        custom = TLSConfig()
+        set_default_config(custom)
+        try:
+            assert get_default_config() is custom
+        finally:
+            set_default_config(None)
+        assert get_default_config() is not custom
+
+    def test_session_reuse(self, server):
+        """
+        test_session_reuse Test reconnects resume the session of the address
+        """
+        config = TLSConfig()
+        assert not _exchange(config.context, server)
+        assert _exchange(config.context, server)
+        assert _exchange(config.context, server)
+        assert config.stats() == {"handshakes": 3, "resumed": 2,
+                                  "sessions": 1}
+
+        config.clear_sessions()
+        assert not _exchange(config.context, server)
+
+        disabled = TLSConfig(session_reuse=False)
+        assert not _exchange(disabled.context, server)
+        assert not _exchange(disabled.context, server)
+        assert disabled.stats()["sessions"] == 0
+
+    def test_explicit_session(self, server):
+        """
+        test_explicit_session Test sessions given by the caller are not cached
+        """
+        config = TLSConfig()
+        sock = socket.create_connection(server, timeout=5)
+        with config.context.wrap_socket(sock) as tls:
+            tls.recv(16)
+            session = tls.session
+        assert _exchange(config.context, server, session=session)
+        assert config.stats() == {"handshakes": 2, "resumed": 1,
+                                  "sessions": 1}
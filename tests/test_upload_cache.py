@@ -0,0 +1,95 @@
+"""
+Test the content-addressed upload cache
+"""
+
+import io
+
+import pytest  # noqa: F401, F403
+
+import bambulabs_api as bl
+from bambulabs_api.upload_cache import UploadCache, hash_file
+
+
+class FakeFTPClient:
+    """
+    FTP client stand-in storing uploads in a dict
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.uploads = 0
+
+    def upload_file(self, fp, path):
+        self.files[path] = fp.read()
+        self.uploads += 1
+        return "226 Transfer complete"
+
+    def get_file_size(self, path):
+        data = self.files.get(path)
+        return None if data is None else len(data)
+
+    def delete_file(self, path):
+        del self.files[path]
+        return "250 Deleted"
+
+
+class TestUploadCache:
+    """
+    TestUploadCache Class for testing upload dedupe
+    """
+
+    def test_manifest_persistence(self, tmp_path):
+        """
+        test_manifest_persistence Test records survive and names are unique
+        """
+        cache = UploadCache(tmp_path)
+        digest, size = hash_file(io.BytesIO(b"abc"))
+        assert size == 3
+        cache.record("P1", digest, "a.3mf", size)
+        cache.record("P1", "other", "a.3mf", 5)
+
+        reloaded = UploadCache(tmp_path)
+        assert reloaded.lookup("P1", digest) is None
+        assert reloaded.lookup("P1", "other").size == 5
+        assert reloaded.lookup("P2", "other") is None
+
+    def test_upload_if_needed(self, tmp_path):
+        """
+        test_upload_if_needed Test identical content is only uploaded once
+        """
+        path = tmp_path / "part.3mf"
+        path.write_bytes(b"3mf content")
+        printer = bl.Printer("", "", "P1")
+        ftp = printer._Printer__printerFTPClient = FakeFTPClient()
+
+        assert printer.upload_file_if_needed(path) == "part.3mf"
+        fp = io.BytesIO(b"3mf content")
+        assert printer.upload_file_if_needed(fp, "copy.3mf") == "part.3mf"
+        assert ftp.uploads == 1 and not fp.closed and fp.tell() == 0
+
+        # Deleted on the printer behind the cache's back
+        ftp.files.clear()
+        assert printer.upload_file_if_needed(path) == "part.3mf"
+        assert ftp.uploads == 2
+
+        printer.delete_file("part.3mf")
+        printer.upload_file_if_needed(path)
+        assert ftp.uploads == 3
+
+    def test_overwritten_name(self):
+        """
+        test_overwritten_name Test plain uploads and deletes invalidate the
+        cached content of a name
+        """
+        printer = bl.Printer("", "", "P1")
+        ftp = printer._Printer__printerFTPClient = FakeFTPClient()
+        printer.upload_file_if_needed(io.BytesIO(b"content A"), "part.3mf")
+        # Same size, different content, under the cached name
+        printer.upload_file(io.BytesIO(b"content B"), "part.3mf")
+        printer.upload_file_if_needed(io.BytesIO(b"content A"), "part.3mf")
+        assert ftp.uploads == 3 and ftp.files["part.3mf"] == b"content A"
+
+        ftp.files["/sdcard/part.3mf"] = ftp.files["part.3mf"]
+        printer.delete_file("/sdcard/part.3mf")
+        assert printer.upload_cache.lookup(
+            "P1", hash_file(io.BytesIO(b"content A"))[0]) is None
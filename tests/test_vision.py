@@ -0,0 +1,159 @@
+"""
+Test the camera failure detection
+"""
+
+import io
+import json
+from types import SimpleNamespace
+
+import pytest  # noqa: F401, F403
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+from bambulabs_api.mqtt_client import PrinterMQTTClient  # noqa: E402
+from bambulabs_api.vision import (CameraMonitor, FailureDetector,  # noqa: E402, E501
+                                  cell_scores, decode_frame)
+
+
+def _jpeg(pixels):
+    out = io.BytesIO()
+    image = Image.fromarray(pixels.astype(np.uint8), "L")
+    image.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def _scene(toolhead=(100, 100), noise=None):
+    pixels = np.tile(np.linspace(40, 200, 640), (480, 1))
+    pixels[300:400, 250:390] = 90  # the part
+    x, y = toolhead
+    pixels[y:y + 40, x:x + 40] = 250
+    if noise is not None:
+        rows, cols = noise
+        rng = np.random.default_rng(1)
+        pixels[rows, cols] = rng.integers(0, 255, pixels[rows, cols].shape)
+    return _jpeg(pixels)
+
+
+def _message(report):
+    return SimpleNamespace(payload=json.dumps({"print": report}).encode())
+
+
+class FakePrinter:
+    """
+    Printer stand-in with a real MQTT client and a fake camera
+    """
+
+    def __init__(self, serial):
+        self.mqtt_client = PrinterMQTTClient("", "", serial)
+        self.camera_client = SimpleNamespace(last_frame=None)
+
+
+class TestVision:
+    """
+    TestVision Class for testing the failure detection
+    """
+
+    def test_decode_scaled(self):
+        """
+        test_decode_scaled Test frames are decoded at reduced resolution
+        """
+        frame = decode_frame(_scene(), scale=8)
+        assert frame.shape == (60, 80)
+        assert frame.dtype == np.float32
+        assert decode_frame(_scene(), scale=2).shape == (240, 320)
+
+    def test_cell_scores(self):
+        """
+        test_cell_scores Test changed shares per cell, ignoring brightness
+        """
+        reference = np.zeros((1, 60, 80), dtype=np.float32)
+        frame = reference + 50
+        frame[0, :10, :10] += 100
+        cells = cell_scores(frame, reference, grid=(6, 8))
+        assert cells.shape == (1, 6, 8)
+        assert cells[0, 0, 0] == 1.0
+        assert cells[0, 5, 7] == 0.0
+
+    def test_monitor(self):
+        """
+        test_monitor Test a failure raises an event and a normal layer not
+        """
+        printer = FakePrinter("VIS1")
+        client = printer.mqtt_client
+        client.printer_timeout = -1
+        monitor = CameraMonitor([printer], consecutive=2)
+        events = []
+        monitor.add_listener(events.append)
+        camera = printer.camera_client
+
+        camera.last_frame = bytearray(_scene())
+        assert monitor.tick() == []
+        assert monitor.analysed == 0  # not printing
+
+        client._on_message(None, None, _message(
+            {"gcode_state": "RUNNING", "layer_num": 1}))
+        monitor.tick()
+        detector = monitor.detectors["VIS1"]
+        assert detector.reference is not None
+
+        camera.last_frame = bytearray(_scene(toolhead=(500, 50)))
+        assert monitor.tick() == []
+        assert detector.last_score < detector.threshold
+
+        for _ in range(2):
+            camera.last_frame = bytearray(_scene(
+                noise=(slice(150, 480), slice(100, 600))))
+            monitor.tick()
+        assert len(events) == 1
+        assert events[0].serial == "VIS1"
+        assert events[0].layer == 1
+        assert events[0].score >= detector.threshold
+
+        client._on_message(None, None, _message({"layer_num": 2}))
+        assert detector.reference is None
+        monitor.stop()
+
+        # Usable again after stop
+        camera.last_frame = bytearray(_scene())
+        monitor.tick()
+        monitor.start()
+        monitor.stop()
+
+    def test_reference_reset_during_pass(self):
+        """
+        test_reference_reset_during_pass Test a layer change resetting the
+        reference while a pass reads it
+        """
+        class ResetOnRead(FailureDetector):
+            """
+            Detector whose reference is reset by a layer change right after
+            being read
+            """
+            @property
+            def reference(self):
+                reference = self.__dict__.get("reference")
+                self.__dict__["reference"] = None
+                return reference
+
+            @reference.setter
+            def reference(self, value):
+                self.__dict__["reference"] = value
+
+        printer = FakePrinter("VIS2")
+        monitor = CameraMonitor([printer])
+        detector = monitor.detectors["VIS2"]
+        detector.__class__ = ResetOnRead
+        detector.printing = True
+        detector.reference = decode_frame(_scene())
+        printer.camera_client.last_frame = bytearray(_scene())
+        assert monitor.tick() == []
+        assert monitor.analysed == 1
+        monitor.stop()
+
+    def test_detector_options(self):
+        """
+        test_detector_options Test invalid options are refused
+        """
+        with pytest.raises(ValueError):
+            FailureDetector(grid=(1, 2), ignore_cells=2)